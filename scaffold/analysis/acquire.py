@@ -24,38 +24,108 @@ Docstring for acquire
 
 import re
 import csv
+import traceback
+import numpy
 from decimal import Decimal
-from scipy import signal
-from bitarray import bitarray
 try:
     from pathlib import Path
     Path().expanduser()
 except (ImportError, AttributeError):
     from pathlib2 import Path
 
-import render
+# render, and with it matplotlib, is imported by the methods which plot,
+# so that processes which only compute statistics do not load it.
+import ingest
 import process
+import pyramid
+import pipeline
+import spectral
+import timebase
+import container
+import instrument
+from store import ColumnStore
+from pipeline import Job
+from cache import fingerprint, SourceFile
+
+BLOCK_SIZE = 1 << 16
 
 
 class Renderable(object):
+    # Decimation of long series in graphs. None uses render.DECIMATE.
+    decimate = None
+    # Attributes holding data, which are dropped by release
+    _derived = ('_x_data', '_y_data')
+
     def __init__(self, parent, fidx):
         self.parent = parent
         self.fidx = fidx
 
-        self._x_data = []
-        self._y_data = []
-
-        self.points = []
+        self._x_data = None
+        self._y_data = None
 
     @property
     def name(self):
         return '{0}.{1}'.format(self.parent.name, self.fidx)
 
+    @property
+    def x_data(self):
+        if self._x_data is None:
+            self._x_data = self.parent.x_data
+        return self._x_data
+
+    @property
+    def y_data(self):
+        """
+        The samples of the channel, parsed when first needed if the
+        dataset was loaded with only some of its channels.
+        """
+        if self._y_data is None:
+            self._y_data = self.parent.channel(self.fidx)
+        return self._y_data
+
+    def release(self):
+        """
+        Drops the data of the channel and everything derived from it, to
+        free memory once it has been rendered. It is computed again if
+        it is used afterwards. Plot jobs already created keep the data
+        they need.
+        """
+        for name in self._derived:
+            setattr(self, name, None)
+
+    def iter_blocks(self, block_size=BLOCK_SIZE):
+        for x, ys in self.parent.iter_blocks(block_size):
+            yield x, ys[self.fidx]
+
     def process_waveform(self):
+        """
+        Binds the data of the channel. Derived series are computed and
+        memoized when they are first used.
+        """
+        self._x_data = self.parent.x_data
+        self._y_data = self.parent.channel(self.fidx)
+
+    def statistics(self, nbins=1024):
+        """
+        Returns numeric summaries of the channel, for runs which do not
+        plot : ``y``, as from :func:`process.describe`, and
+        ``histogram``, a dict of the ``edges`` and ``counts`` of at most
+        ``nbins`` bins, as from :func:`process.histogram`.
+        """
+        edges, counts = process.histogram(self.y_data, nbins)
+        return {'y': process.describe(self.y_data),
+                'histogram': {'edges': edges, 'counts': counts}}
+
+    def plot_jobs(self, outfolder):
+        """
+        Returns the plots of this waveform as a list of
+        :class:`pipeline.Job`, which can be run here or in a worker.
+        """
         raise NotImplementedError
 
     def render_plots(self, outfolder):
-        raise NotImplementedError
+        for job in self.plot_jobs(outfolder):
+            job()
 
     def _outfolder(self, outfolder):
         if not isinstance(outfolder, Path):
@@ -63,36 +133,117 @@ class Renderable(object):
         outfolder.mkdir(parents=True, exist_ok=True)
         return outfolder
 
+    def _job(self, outfolder, suffix, func, **kwargs):
+        outpath = outfolder / (self.name + suffix + '.png')
+        return Job(self.name + suffix, func, outpath=str(outpath), **kwargs)
+
 
 class BinDump(Renderable):
+    nbits = 16
+    # How bit planes are drawn : 'stack' or 'raster' for all of the bit
+    # planes in one figure and the XOR planes in another, or 'separate'
+    # for a graph per plane. See render.make_bitplanes.
+    planes = 'stack'
+    _derived = Renderable._derived + (
+        '_bit_data', '_xor_data', '_xor_bit_data', '_transitions',
+        '_glitches'
+    )
+
     def __init__(self, parent, fidx):
         super(BinDump, self).__init__(parent, fidx)
         self._bit_data = None
         self._xor_data = None
+        self._xor_bit_data = None
+        self._transitions = None
+        self._glitches = None
 
-    def process_waveform(self):
-        self._x_data, self._y_data = map(list, zip(*self.points))
-        self._xor_data = [p.tolist()[::-1] for p in self._y_data]
-        self._xor_data = [[int(p[i] != p[i + 1]) for i in range(len(p) - 1)] for p in self._xor_data]
-        self._xor_bit_data = list(map(list, zip(*self._xor_data)))
-        self._y_data = [[int(b) for b in p.tolist()[::-1]] for p in self._y_data]
-        self._bit_data = list(map(list, zip(*self._y_data)))
+    @property
+    def bit_data(self):
+        if self._bit_data is None:
+            self._bit_data = process.bit_planes(self.y_data, self.nbits)
+        return self._bit_data
 
-    def render_plots(self, outfolder):
+    @property
+    def xor_data(self):
+        if self._xor_data is None:
+            self._xor_data = process.adjacent_xor(self.y_data)
+        return self._xor_data
+
+    @property
+    def xor_bit_data(self):
+        if self._xor_bit_data is None:
+            self._xor_bit_data = process.bit_planes(self.xor_data,
+                                                    self.nbits - 1)
+        return self._xor_bit_data
+
+    @property
+    def transitions(self):
+        """
+        Per-bit transition statistics of the processed dump.
+
+        .. seealso:: :func:`process.bit_transition_stats`
+        """
+        if self._transitions is None:
+            self._transitions = process.bit_transition_stats(self.y_data,
+                                                             self.nbits)
+        return self._transitions
+
+    @property
+    def glitches(self):
+        """
+        Sample indices and bit masks of single sample glitches in the
+        processed dump.
+
+        .. seealso:: :func:`process.find_glitches`
+        """
+        if self._glitches is None:
+            self._glitches = process.find_glitches(self.y_data)
+        return self._glitches
+
+    def statistics(self, nbins=1024):
+        """
+        Adds the per-bit ``transitions`` and the number of ``glitches``
+        to the summaries of :meth:`Renderable.statistics`.
+        """
+        rval = super(BinDump, self).statistics(nbins)
+        rval['transitions'] = self.transitions
+        rval['glitches'] = len(self.glitches[0])
+        return rval
+
+    def plot_jobs(self, outfolder):
+        import render
         outfolder = self._outfolder(outfolder)
+        if self.planes != 'separate':
+            return [
+                self._job(outfolder, '.bits', render.make_bitplanes,
+                          plotdata_x=self.x_data, planes=self.bit_data,
+                          style=self.planes, decimate=self.decimate),
+                self._job(outfolder, '.xors', render.make_bitplanes,
+                          plotdata_x=self.x_data, planes=self.xor_bit_data,
+                          labels=['{0}-{1}'.format(b, b + 1)
+                                  for b in range(self.nbits - 1)],
+                          style=self.planes, decimate=self.decimate),
+            ]
+        jobs = []
 
-        for b in range(16):
-            outpath = outfolder / (self.name + '.b{0}.png'.format(b))
-            render.make_graph(outpath=str(outpath), plotdata_x=self._x_data,
-                              plotdata_y=self._bit_data[b], marker=None, lw=0.5)
+        for b in range(self.nbits):
+            jobs.append(self._job(outfolder, '.b{0}'.format(b),
+                                  render.make_graph, plotdata_x=self.x_data,
+                                  plotdata_y=self.bit_data[b], marker=None, lw=0.5,
+                                  decimate=self.decimate))
 
-        for b in range(15):
-            outpath = outfolder / (self.name + '.x{0}-{1}.png'.format(b, b+1))
-            render.make_graph(outpath=str(outpath), plotdata_x=self._x_data,
-                              plotdata_y=self._xor_bit_data[b], marker=None, lw=0.5)
+        for b in range(self.nbits - 1):
+            jobs.append(self._job(outfolder, '.x{0}-{1}'.format(b, b+1),
+                                  render.make_graph, plotdata_x=self.x_data,
+                                  plotdata_y=self.xor_bit_data[b], marker=None, lw=0.5,
+                                  decimate=self.decimate))
+        return jobs
 
 
 class Waveform(Renderable):
+    _derived = Renderable._derived + ('_fd_data', '_sd_data', '_detrended',
+                                      '_pyramid', '_spectrum')
+
     def __init__(self, parent, fidx):
         super(Waveform, self).__init__(parent, fidx)
         self.x_units = None
@@ -100,60 +251,345 @@ class Waveform(Renderable):
         self.y_units = None
         self.y_title = None
 
-        self._fd_data = []
-        self._sd_data = []
+        self._fd_data = None
+        self._sd_data = None
+        self._detrended = None
+        self._pyramid = None
+        self._spectrum = None
 
-    def process_waveform(self):
-        self._x_data, self._y_data = map(list, zip(*self.points))
-        self._fd_data = process.get_fd(self._y_data)
-        self._sd_data = process.get_sd(self._y_data)
+    @property
+    def fd_data(self):
+        if self._fd_data is None:
+            self._fd_data = process.get_fd(self.y_data)
+        return self._fd_data
 
-    def render_plots(self, outfolder):
-        outfolder = self._outfolder(outfolder)
+    @property
+    def sd_data(self):
+        if self._sd_data is None:
+            self._sd_data = process.get_fd(self.fd_data, lpoint=0)
+        return self._sd_data
+
+    @property
+    def detrended(self):
+        """
+        The channel without its linear trend, from the third sample on,
+        aligned with the second difference in the combined graph.
+        """
+        if self._detrended is None:
+            self._detrended = process.detrend(self.y_data[2:])
+        return self._detrended
+
+    @property
+    def spectrum(self):
+        """
+        The Welch estimate of the power spectral density of the channel,
+        as ``(freqs, psd)``, or ``None`` if the capture is too short or
+        its x-axis does not give a sample rate.
+
+        .. seealso:: :func:`spectral.welch`
+        """
+        if self._spectrum is None:
+            if len(self.y_data) < spectral.MIN_SAMPLES:
+                return None
+            try:
+                fs = spectral.sample_rate(self.x_data)
+            except ValueError:
+                return None
+            self._spectrum = spectral.welch(self.y_data, fs)
+        return self._spectrum
 
-        outpath = outfolder / (self.name + '.w.png')
-        render.make_graph(outpath=str(outpath), plotdata_x=self._x_data,
-                          plotdata_y=self._y_data, marker='.', linestyle='None')
+    def spectral_metrics(self, **kwargs):
+        """
+        Returns the SNR, SINAD, ENOB and spurs of the channel, taken to
+        be a capture of a single tone, or ``None`` if it has no spectrum.
 
-        outpath = outfolder / (self.name + '.fdw.png')
-        render.make_graph(outpath=str(outpath),
-                          plotdata_x=self._x_data[1:], plotdata_y=self._fd_data[1:],
-                          color='blue')
+        .. seealso:: :func:`spectral.analyze`
+        """
+        if self.spectrum is None:
+            return None
+        return spectral.analyze(*self.spectrum, **kwargs)
+
+    def statistics(self, nbins=1024):
+        """
+        Adds ``fd`` and ``sd``, summaries of the first and second
+        differences, to those of :meth:`Renderable.statistics`.
+        """
+        rval = super(Waveform, self).statistics(nbins)
+        rval['fd'] = process.describe(self.fd_data[1:])
+        rval['sd'] = process.describe(self.sd_data[2:])
+        return rval
+
+    @property
+    def pyramid(self):
+        """
+        The :class:`pyramid.Pyramid` of the channel, built when first
+        needed. If the dataset is cached, the pyramid is kept in its
+        cache entry.
+        """
+        if self._pyramid is None:
+            y = self.parent.channel(self.fidx)
+            path = self.parent.cache_file('pyr{0}.npy'.format(self.fidx))
+            if path is None:
+                self._pyramid = pyramid.Pyramid.build(y)
+            else:
+                self._pyramid = pyramid.cached(path, y)
+        return self._pyramid
 
-        outpath = outfolder / (self.name + '.sdw.png')
-        render.make_graph(outpath=str(outpath),
-                          plotdata_x=self._x_data[2:], plotdata_y=self._sd_data[2:],
-                          color='red')
+    def render_window(self, x0, x1, outpath, ncols=None, **kwargs):
+        """
+        Renders the part of the waveform between ``x0`` and ``x1`` as a
+        graph, drawn from the pyramid at the resolution of the output.
+        Apart from building the pyramid once, this takes time in
+        proportion to the width of the output, and not to the number of
+        samples in the window.
 
-        outpath = outfolder / (self.name + '.allw.png')
-        render.make_multigraph(outpath=str(outpath), plotdata_x=self._x_data[2:],
-                               plotdata_ys=[signal.detrend(self._y_data[2:]),
-                                            self._fd_data[2:], self._sd_data[2:]],
-                               colors=['black', 'blue', 'red'])
+        :param x0: The start of the window, in x-axis units
+        :param x1: The end of the window, inclusive
+        :param outpath: The path to the output file
+        :param ncols: The number of buckets to draw, by default the
+                      width of the output in pixels
+        :param kwargs: Further arguments to :func:`render.make_graph`
+        :return: The output path
+        """
+        import render
+        x = self.parent.x_data
+        y = self.parent.channel(self.fidx)
+        i0 = timebase.searchsorted(x, x0, side='left')
+        i1 = timebase.searchsorted(x, x1, side='right')
+        if ncols is None:
+            ncols = render.graph_pixels()[0]
+        starts, lo, hi, _ = self.pyramid.window(y, i0, i1, ncols)
+        plotdata_x, plotdata_y = pyramid.envelope(x, starts, lo, hi)
+        kwargs.setdefault('decimate', False)
+        return render.make_graph(outpath, plotdata_y, plotdata_x, **kwargs)
 
-        outpath = outfolder / (self.name + '.h.png')
-        render.make_histogram(outpath=str(outpath), plotdata_y=self._y_data[2:],
-                              color='grey')
+    def iter_processed(self, block_size=BLOCK_SIZE):
+        differentiator = process.Differentiator()
+        for x, y in self.iter_blocks(block_size):
+            fd, sd = differentiator.push(y)
+            yield x, y, fd, sd
 
-        outpath = outfolder / (self.name + '.fdh.png')
-        render.make_histogram(outpath=str(outpath), plotdata_y=self._fd_data[2:],
-                              color='blue')
+    def plot_jobs(self, outfolder):
+        import render
+        outfolder = self._outfolder(outfolder)
+        return [
+            self._job(outfolder, '.w', render.make_graph,
+                      plotdata_x=self.x_data, plotdata_y=self.y_data,
+                      marker='.', linestyle='None', decimate=self.decimate),
+            self._job(outfolder, '.fdw', render.make_graph,
+                      plotdata_x=self.x_data[1:], plotdata_y=self.fd_data[1:],
+                      color='blue', decimate=self.decimate),
+            self._job(outfolder, '.sdw', render.make_graph,
+                      plotdata_x=self.x_data[2:], plotdata_y=self.sd_data[2:],
+                      color='red', decimate=self.decimate),
+            self._job(outfolder, '.allw', render.make_multigraph,
+                      plotdata_x=self.x_data[2:],
+                      plotdata_ys=[self.detrended,
+                                   self.fd_data[2:], self.sd_data[2:]],
+                      colors=['black', 'blue', 'red'], decimate=self.decimate),
+            self._job(outfolder, '.h', render.make_histogram,
+                      plotdata_y=self.y_data[2:], color='grey'),
+            self._job(outfolder, '.fdh', render.make_histogram,
+                      plotdata_y=self.fd_data[2:], color='blue'),
+            self._job(outfolder, '.sdh', render.make_histogram,
+                      plotdata_y=self.sd_data[2:], color='red'),
+        ] + self._spectral_jobs(outfolder)
 
-        outpath = outfolder / (self.name + '.sdh.png')
-        render.make_histogram(outpath=str(outpath), plotdata_y=self._sd_data[2:],
-                              color='red')
+    def _spectral_jobs(self, outfolder):
+        if self.spectrum is None:
+            return []
+        freqs, psd = self.spectrum
+        if not numpy.any(psd[1:] > 0):
+            return []
+        import render
+        return [self._job(outfolder, '.psd', render.make_graph,
+                          plotdata_x=freqs[1:], plotdata_y=psd[1:],
+                          yscale='log', color='green', lw=0.5)]
 
 
 class DataSet(object):
-    def __init__(self, uri):
+    y_dtype = numpy.float64
+    renderable = Waveform
+
+    def __init__(self, uri, stream=False, cache=None, channels=None):
+        """
+        :param uri: The path to the capture file
+        :param stream: Only read the header, and read the samples from
+                       the file on each pass of :meth:`iter_blocks`
+        :param cache: An optional :class:`cache.DataSetCache`
+        :param channels: The indices of the channels to parse now, by
+                         default all of them. Channels beyond those in
+                         the file are ignored. The waveforms of the other
+                         channels are still available, and their samples
+                         are parsed when first used. With a cache, every
+                         channel is parsed into it once, and is then only
+                         read from it when used.
+        """
         self._uri = None
         self.uri = uri
         self._waveforms = []
-        self._acquire()
+        self._store = None
+        self._stream = stream
+        self._cache = cache
+        self._channels = None if channels is None else list(channels)
+        # Channel index of each column of the store
+        self._loaded = []
+        # Times and counters of the acquisition, see instrument
+        self.stats = instrument.Stats()
+        with instrument.scope(self.stats), instrument.stage('acquire'):
+            self._populate(cache)
+
+    def _populate(self, cache):
+        if self._stream:
+            self._scan()
+            return
+        source = None
+        if cache is not None:
+            # Cache entries hold every channel
+            self._channels = None
+            with instrument.stage('acquire.cache_load'):
+                if cache.load(self):
+                    instrument.count('cache_hits')
+                    instrument.count('samples', len(self._store) *
+                                     len(self._waveforms))
+                    return
+            source = SourceFile(self._uri)
+        with instrument.stage('acquire.parse'):
+            self._acquire(source)
+            if self._store is None:
+                return
+            self._store.finalize()
+        instrument.count('bytes_read', self._uri.stat().st_size)
+        instrument.count('samples', len(self._store) * len(self._loaded))
+        if cache is not None:
+            with instrument.stage('acquire.cache_store'):
+                cache.store(self, source)
+
+    def _scan(self):
+        with self._uri.open() as f:
+            self._read_header(f)
+
+    def _acquire(self, source=None):
+        # Reads through the SourceFile of a dataset being cached
+        opened = self._uri.open() if source is None else source.open()
+        with opened as f:
+            try:
+                self._acquire_bulk(f)
+            except ValueError:
+                self._waveforms = []
+                self._store = None
+                f.seek(0)
+                self._acquire_rows(f)
+
+    def _acquire_bulk(self, f):
+        nch, head = self._read_header(f)
+        if nch is None:
+            return
+        usecols = None
+        if self._loaded != list(range(nch)):
+            usecols = [0] + [i + 1 for i in self._loaded]
+        for block, ticks, places in ingest.read_blocks(
+                f, nch + 1, head, usecols=usecols, exact_x=True):
+            x, ys = self._split_block(block)
+            self._store.extend(x, ys, ticks, places)
 
-    def _acquire(self):
+    def _load_channels(self, idxs):
+        # Parses further channels of a dataset which was loaded with only
+        # some of them, and adds them to its store.
+        state = self._waveforms, self._store, self._loaded, self._channels
+        self._channels = list(idxs)
+        try:
+            with instrument.scope(self.stats), \
+                    instrument.stage('acquire.parse_channels'):
+                self._acquire()
+                store, loaded = self._store, self._loaded
+        finally:
+            self._waveforms, self._store, self._loaded, self._channels = \
+                state
+        store.finalize()
+        for i, idx in enumerate(loaded):
+            self._store.add_column(store.column(i))
+            self._loaded.append(idx)
+
+    def _append_row(self, x, ys):
+        # Used by the row by row parsers, which read every channel
+        if len(self._loaded) != len(ys):
+            ys = [ys[i] for i in self._loaded]
+        self._store.append_row(x, ys)
+
+    def _read_header(self, f):
+        # By default, there is no preamble. The first row is a data row,
+        # and determines the number of channels.
+        for line, row in _header_rows(f):
+            nch = len(row) - 1
+            self._create_channels(nch)
+            return nch, [line]
+        return None, None
+
+    def _acquire_rows(self, f):
         raise NotImplementedError
 
+    def _split_block(self, block):
+        return block[:, 0], block[:, 1:]
+
+    def _create_channels(self, nch):
+        if len(self._waveforms) != nch:
+            self._waveforms = [self.renderable(self, i) for i in range(nch)]
+        if self._channels is None:
+            self._loaded = list(range(nch))
+        else:
+            self._loaded = sorted(set(x for x in self._channels
+                                      if 0 <= x < nch))
+        if not self._stream:
+            self._store = ColumnStore(len(self._loaded), self.y_dtype)
+
+    def _iter_file_blocks(self, block_size):
+        with self._uri.open() as f:
+            nch, head = self._read_header(f)
+            if nch is None:
+                return
+            blocks = ingest.read_blocks(f, nch + 1, head)
+            for block in ingest.rebuffer(blocks, block_size):
+                x, ys = self._split_block(block)
+                yield x, [ys[:, i].astype(self.y_dtype) for i in range(nch)]
+
+    def iter_blocks(self, block_size=BLOCK_SIZE):
+        """
+        Yields the dataset as a sequence of ``(x, ys)`` blocks of
+        ``block_size`` samples, where ``ys`` holds one array per channel.
+
+        Streaming datasets are read from the file as the blocks are
+        consumed, so memory use is bounded by the block size. The row by
+        row fallback is not available in this mode, and malformed files
+        raise :class:`ValueError`.
+        """
+        if self._stream:
+            for block in self._iter_file_blocks(block_size):
+                yield block
+            return
+        nch = len(self._waveforms)
+        for start in range(0, len(self._store), block_size):
+            end = start + block_size
+            yield (numpy.asarray(self._store.x[start:end]),
+                   [self.channel(i)[start:end] for i in range(nch)])
+
+    def histograms(self, nbins=1024, block_size=BLOCK_SIZE):
+        """
+        Returns a histogram accumulator per channel, from
+        :func:`process.accumulator`, over all of the samples. Streaming
+        datasets are read block by block, without holding the samples.
+        """
+        hists = None
+        for _, ys in self.iter_blocks(block_size):
+            if hists is None:
+                hists = [process.accumulator(y.dtype, nbins) for y in ys]
+            for hist, y in zip(hists, ys):
+                hist.update(y)
+        if hists is None:
+            hists = [process.accumulator(self.y_dtype, nbins)
+                     for _ in self._waveforms]
+        return hists
+
     @property
     def uri(self):
         return self._uri.as_uri()
@@ -168,6 +604,16 @@ class DataSet(object):
     def filename(self):
         return self._uri.name
 
+    @property
+    def fingerprint(self):
+        """
+        Identifies the source file and its current contents, by path, size
+        and modification time, along with the parser used to read it.
+        """
+        rval = fingerprint(self._uri, with_hash=False)
+        rval['parser'] = type(self).__name__
+        return rval
+
     @property
     def name(self):
         return self._uri.stem
@@ -176,115 +622,425 @@ class DataSet(object):
     def waveforms(self):
         return self._waveforms
 
+    @property
+    def streaming(self):
+        return self._stream
+
+    @property
+    def x_data(self):
+        """
+        The x-axis of the dataset, usually as a compact
+        :class:`timebase.TimeBase`. Use :func:`numpy.asarray` where an
+        array is needed.
+        """
+        return self._store.x
+
+    def channel(self, idx):
+        """
+        Returns the samples of channel ``idx``, parsing them first if
+        they were not loaded with the dataset.
+        """
+        if idx not in self._loaded:
+            if not 0 <= idx < len(self._waveforms):
+                raise IndexError("Channel {0} not in {1}".format(
+                    idx, self.filename))
+            self._load_channels([idx])
+        return self._store.column(self._loaded.index(idx))
+
+    @property
+    def loaded_channels(self):
+        """
+        The indices of the channels whose samples are in memory, or
+        mapped from the cache.
+        """
+        return sorted(self._loaded)
+
+    def cache_file(self, name):
+        """
+        Returns a path for data derived from this dataset in its cache
+        entry, or ``None`` if it is not cached.
+
+        .. seealso:: :meth:`cache.DataSetCache.entry_file`
+        """
+        if self._cache is None:
+            return None
+        return self._cache.entry_file(self, name)
+
+
+def _header_rows(f):
+    # Reads rows one line at a time, so that the file position is left
+    # just past the last row consumed by the caller.
+    for line in iter(f.readline, ''):
+        row = [x.strip() for x in next(csv.reader([line]), [])]
+        if not any(row):
+            continue
+        yield line, row
+
 
 class CSVDataSet(DataSet):
-    def _acquire(self):
-        with self._uri.open() as f:
-            state = 'PRELIM'
-            reader = csv.reader(f)
-            for row in reader:
-                row = [x.strip() for x in row]
-                if not len(row):
-                    continue
-                if state == 'PRELIM':
-                    nch = len(row) - 1
-                    for i in range(nch):
-                        self._waveforms.append(Waveform(self, i))
-                    state = 'DATA'
-                if state == 'DATA':
-                    x_data = Decimal(row[0])
-                    for i in range(nch):
-                        y_data = float(row[i + 1])
-                        self._waveforms[i].points.append((x_data, y_data))
-                    continue
+    def _acquire_rows(self, f):
+        state = 'PRELIM'
+        reader = csv.reader(f)
+        for row in reader:
+            row = [x.strip() for x in row]
+            if not any(row):
+                continue
+            if state == 'PRELIM':
+                nch = len(row) - 1
+                self._create_channels(nch)
+                state = 'DATA'
+            if state == 'DATA':
+                x_data = row[0]
+                y_data = [float(row[i + 1]) for i in range(nch)]
+                self._append_row(x_data, y_data)
+                continue
 
 
 class CSVBinDump(DataSet):
-    def _acquire(self):
-        with self._uri.open() as f:
-            state = 'PRELIM'
-            reader = csv.reader(f)
-            for row in reader:
-                row = [x.strip() for x in row]
-                if not len(row):
-                    continue
-                if state == 'PRELIM':
-                    nch = len(row) - 1
-                    for i in range(nch):
-                        self._waveforms.append(BinDump(self, i))
-                    state = 'DATA'
-                if state == 'DATA':
-                    x_data = Decimal(row[0])
-                    for i in range(nch):
-                        y_data = bitarray(row[i + 1].zfill(16))
-                        self._waveforms[i].points.append((x_data, y_data))
-                    continue
+    y_dtype = numpy.uint16
+    renderable = BinDump
+
+    def _split_block(self, block):
+        codes = ingest.parse_bincodes(block[:, 1:], self.renderable.nbits)
+        return block[:, 0], codes
+
+    def _acquire_rows(self, f):
+        mask = (1 << self.renderable.nbits) - 1
+        state = 'PRELIM'
+        reader = csv.reader(f)
+        for row in reader:
+            row = [x.strip() for x in row]
+            if not any(row):
+                continue
+            if state == 'PRELIM':
+                nch = len(row) - 1
+                self._create_channels(nch)
+                state = 'DATA'
+            if state == 'DATA':
+                x_data = row[0]
+                y_data = [int(row[i + 1], 2) & mask for i in range(nch)]
+                self._append_row(x_data, y_data)
+                continue
 
 
 class IQDataSet(DataSet):
+    y_dtype = numpy.int64
     regex_nch = re.compile(r'^channels_(?P<nch>\d+)$')
     regex_name = re.compile(r'^field_(?P<name>\S+)$')
     regex_unit = re.compile(r'^unit_(?P<unit>\S+)$')
 
-    def _acquire(self):
-        with self._uri.open() as f:
-            state = 'NCH'
-            reader = csv.reader(f)
-            for row in reader:
-                row = [x.strip() for x in row]
-                if not len(row):
-                    continue
-                if state == 'Data':
-                    x_data = Decimal(row[0])
-                    for i in range(nch):
-                        y_data = int(Decimal(row[i + 1]))
-                        self._waveforms[i].points.append((x_data, y_data))
-                    continue
-                if state == 'NCH':
-                    m = self.regex_nch.match(row[0])
-                    if m:
-                        nch = int(m.group('nch'))
-                        for i in range(nch):
-                            self._waveforms.append(Waveform(self, i))
-                        state = 'Names'
-                    continue
-                if state == 'Names':
-                    m = self.regex_name.match(row[0])
-                    if m:
-                        x_name = m.group('name')
-                        for i in range(nch):
-                            self._waveforms[i].x_name = x_name
-                            m = self.regex_name.match(row[i + 1])
-                            self._waveforms[i].y_name = m.group('name')
-                        state = 'Units'
-                    continue
-                if state == "Units":
-                    m = self.regex_unit.match(row[0])
-                    if m:
-                        x_unit = m.group('unit')
-                        for i in range(nch):
-                            self._waveforms[i].x_unit = x_unit
-                            m = self.regex_unit.match(row[i + 1])
-                            self._waveforms[i].y_unit = m.group('unit')
-                        state = 'Data'
-                    continue
-
-
-def all_datasets(folder, parsers=None):
+    def _read_header(self, f):
+        state = 'NCH'
+        for line, row in _header_rows(f):
+            state = self._header_row(state, row)
+            if state == 'Data':
+                return len(self._waveforms), None
+        return None, None
+
+    def _split_block(self, block):
+        return block[:, 0], numpy.trunc(block[:, 1:])
+
+    def _header_row(self, state, row):
+        nch = len(self._waveforms)
+        if state == 'NCH':
+            m = self.regex_nch.match(row[0])
+            if m:
+                self._create_channels(int(m.group('nch')))
+                state = 'Names'
+        elif state == 'Names':
+            m = self.regex_name.match(row[0])
+            if m:
+                x_name = m.group('name')
+                for i in range(nch):
+                    self._waveforms[i].x_name = x_name
+                    m = self.regex_name.match(row[i + 1])
+                    self._waveforms[i].y_name = m.group('name')
+                state = 'Units'
+        elif state == "Units":
+            m = self.regex_unit.match(row[0])
+            if m:
+                x_unit = m.group('unit')
+                for i in range(nch):
+                    self._waveforms[i].x_unit = x_unit
+                    m = self.regex_unit.match(row[i + 1])
+                    self._waveforms[i].y_unit = m.group('unit')
+                state = 'Data'
+        return state
+
+    def _acquire_rows(self, f):
+        state = 'NCH'
+        reader = csv.reader(f)
+        for row in reader:
+            row = [x.strip() for x in row]
+            if not any(row):
+                continue
+            if state == 'Data':
+                x_data = row[0]
+                y_data = [int(Decimal(row[i + 1])) for i in range(nch)]
+                self._append_row(x_data, y_data)
+                continue
+            state = self._header_row(state, row)
+            nch = len(self._waveforms)
+
+
+class BinaryDataSet(DataSet):
+    """
+    A capture in the binary format of :mod:`container`. Its columns are
+    memory mapped rather than parsed, so that loading it is immediate
+    and only the channels which are used are ever read. The channels
+    are processed as they would have been by the parser the capture was
+    converted from. A dataset cache is not needed, and is not used.
+    """
+    def _populate(self, cache):
+        with instrument.stage('acquire.map'):
+            header, x, columns = container.load(self._uri)
+        parser = PARSERS.get(header['parser'], DataSet)
+        self.renderable = parser.renderable
+        self.y_dtype = parser.y_dtype
+        # Mapping every column costs nothing until it is read
+        self._channels = None
+        self._create_channels(len(columns))
+        for waveform, attrs in zip(self._waveforms, header['channels']):
+            for k, v in attrs.items():
+                setattr(waveform, k, v)
+        if self._stream:
+            return
+        self._store = ColumnStore.from_arrays(x, columns)
+        instrument.count('bytes_mapped', sum(c.nbytes for c in columns))
+        instrument.count('samples', len(x) * len(columns))
+
+    def _iter_file_blocks(self, block_size):
+        _, x, columns = container.load(self._uri)
+        for start in range(0, len(x), block_size):
+            end = start + block_size
+            yield numpy.asarray(x[start:end]), [c[start:end] for c in columns]
+
+
+PARSERS = dict((cls.__name__, cls)
+               for cls in (CSVDataSet, CSVBinDump, IQDataSet, BinaryDataSet))
+
+
+def _load(parser, datafile, skip_errors, cache, channels=None):
+    if not skip_errors:
+        return parser(datafile, cache=cache, channels=channels)
+    try:
+        return parser(datafile, cache=cache, channels=channels)
+    except Exception:
+        print("Failed to acquire {0}".format(datafile))
+        traceback.print_exc()
+
+
+def _prefetch(parser, datafile, cache, channels=None):
+    # Runs in a loader worker. With a cache, the parsed dataset is left
+    # in the cache for the consumer to map, rather than sent back, and
+    # only the stats of its acquisition are returned.
+    dataset = parser(datafile, cache=cache, channels=channels)
+    if cache is None and not isinstance(dataset, BinaryDataSet):
+        return dataset
+    # Containers are mapped again by the consumer, which is cheaper
+    # than sending their contents back.
+    return dataset.stats
+
+
+def captures(folder, parser):
+    """
+    Yields ``(parser, path)`` for each capture file in ``folder``. Text
+    captures which have been converted with :func:`convert_captures`
+    are read from their container instead, with :class:`BinaryDataSet`,
+    unless the text file has changed since. Containers whose text file
+    has been removed are read as well.
+    """
+    for datafile in folder.glob('**/*.csv'):
+        if container.is_current(datafile):
+            yield BinaryDataSet, container.container_path(datafile)
+        else:
+            yield parser, datafile
+    for datafile in folder.glob('**/*' + container.SUFFIX):
+        if not datafile.with_suffix('.csv').exists():
+            yield BinaryDataSet, datafile
+
+
+def _datafiles(folder, parsers):
     if isinstance(parsers, list):
         for branch, parser in parsers:
             print(branch, parser)
-            dfolder = folder / branch
-            datafiles = list(dfolder.glob('**/*.csv'))
-            for datafile in datafiles:
-                yield parser(datafile)
+            for rval in captures(folder / branch, parser):
+                yield rval
+    else:
+        for rval in captures(folder, parsers):
+            yield rval
+
+
+def all_datasets(folder, parsers=None, skip_errors=False, cache=None,
+                 workers=1, prefetch=None, ordered=True, threads=False,
+                 channels=None):
+    """
+    Yields a dataset for each capture file found in ``folder``.
+
+    :param parsers: A :class:`DataSet` subclass used for every file in
+                    ``folder``, or a list of ``(branch, parser)`` tuples
+                    for the files in each subfolder of ``folder``.
+    :param skip_errors: Report files which can't be parsed and continue,
+                        instead of raising the error.
+    :param cache: An optional :class:`cache.DataSetCache`
+    :param workers: The number of loader workers. With more than one,
+                    files are parsed in a pool while the datasets already
+                    yielded are being used. ``None`` uses one per CPU.
+    :param prefetch: The maximum number of datasets being loaded or
+                     waiting to be consumed at once, which bounds the
+                     memory used by the loaders. Defaults to twice the
+                     number of workers.
+    :param ordered: If ``False``, datasets are yielded as they finish
+                    loading rather than in the order of discovery.
+    :param threads: Use loader threads rather than processes.
+    :param channels: The indices of the channels to load from each
+                     file, by default all of them. See :class:`DataSet`.
+    """
+    datafiles = _datafiles(folder, parsers)
+    if workers is not None and workers <= 1:
+        for parser, datafile in datafiles:
+            dataset = _load(parser, datafile, skip_errors, cache, channels)
+            if dataset is not None:
+                yield dataset
+        return
+
+    loading = {}
+
+    def jobs():
+        for parser, datafile in datafiles:
+            name = str(datafile)
+            loading.setdefault(name, []).append(parser)
+            yield Job(name, _prefetch, parser=parser, datafile=datafile,
+                      cache=cache, channels=channels)
+
+    results = pipeline.run_jobs(jobs(), workers, max_pending=prefetch,
+                                threads=threads, ordered=ordered)
+    for result in results:
+        parser = loading[result.name].pop(0)
+        if not result.ok:
+            if not skip_errors:
+                raise ValueError("Failed to acquire {0}\n{1}"
+                                 "".format(result.name, result.error))
+            print("Failed to acquire {0}".format(result.name))
+            print(result.error)
+            continue
+        dataset = result.result
+        if not isinstance(dataset, DataSet):
+            # Parsed into the cache by the worker, which returned the
+            # stats of the acquisition
+            stats = dataset
+            dataset = _load(parser, Path(result.name), skip_errors, cache,
+                            channels)
+            if dataset is not None:
+                dataset.stats = stats.merge(dataset.stats)
+        if dataset is not None:
+            yield dataset
+
+
+def _histograms(parser, datafile, nbins):
+    return parser(datafile, stream=True).histograms(nbins)
+
+
+def _merge_histograms(total, hists):
+    if total is None:
+        return hists
+    if len(total) != len(hists):
+        raise ValueError("Captures have different numbers of channels")
+    return [a.merge(b) for a, b in zip(total, hists)]
+
+
+def aggregate_histograms(folder, parsers=None, skip_errors=False, workers=1,
+                         nbins=1024, threads=False):
+    """
+    Accumulates one histogram per channel over every capture file in each
+    branch of ``folder``, streaming each file so that only one block of
+    samples per worker is held at a time. Histograms of integer codes are
+    exact, and those of real values are :class:`process.FloatSketch`
+    with ``nbins`` bins.
+
+    :param parsers: As for :func:`all_datasets`. With a single parser,
+                    the branch is named for ``folder``.
+    :param workers: The number of worker processes reading files.
+    :return: A dict of ``{branch: [accumulator, ...]}``
+    """
+    if not isinstance(parsers, list):
+        branches = [(folder.name, folder, parsers)]
     else:
-        datafiles = list(folder.glob('**/*.csv'))
-        for datafile in datafiles:
-            yield parsers(datafile)
+        branches = [(b, folder / b, p) for b, p in parsers]
+    rval = {}
+    for branch, path, parser in branches:
+        jobs = (Job(str(datafile), _histograms, parser=cparser,
+                    datafile=datafile, nbins=nbins)
+                for cparser, datafile in captures(path, parser))
+        total = None
+        for result in pipeline.run_jobs(jobs, workers, threads=threads,
+                                        ordered=False):
+            if not result.ok:
+                if not skip_errors:
+                    raise ValueError("Failed to acquire {0}\n{1}"
+                                     "".format(result.name, result.error))
+                print("Failed to acquire {0}".format(result.name))
+                print(result.error)
+                continue
+            try:
+                total = _merge_histograms(total, result.result)
+            except ValueError:
+                if not skip_errors:
+                    raise
+                print("Skipping {0}, which has a different number of "
+                      "channels".format(result.name))
+        if total is not None:
+            rval[branch] = total
+    return rval
+
+
+def convert_captures(folder, parsers=None, skip_errors=False, workers=1,
+                     threads=False):
+    """
+    Converts every text capture in ``folder`` which does not have a
+    current container into the binary format of :mod:`container`,
+    alongside it. Datasets found by :func:`all_datasets` are then read
+    from the containers.
+
+    :param parsers: As for :func:`all_datasets`
+    :return: A list of the containers written
+    """
+    def jobs():
+        for parser, datafile in _datafiles(folder, parsers):
+            if parser is BinaryDataSet:
+                continue
+            yield Job(str(datafile), container.convert, parser=parser,
+                      datafile=datafile)
+
+    written = []
+    for result in pipeline.run_jobs(jobs(), workers, threads=threads,
+                                    ordered=False):
+        if not result.ok:
+            if not skip_errors:
+                raise ValueError("Failed to convert {0}\n{1}"
+                                 "".format(result.name, result.error))
+            print("Failed to convert {0}".format(result.name))
+            print(result.error)
+            continue
+        print("Converted {0}".format(result.name))
+        written.append(result.result)
+    return written
+
 
+def all_waveforms(folder, parsers=None, skip_errors=False, cache=None,
+                  channels=None, **kwargs):
+    """
+    Yields every waveform of every dataset found in ``folder``, or only
+    those of ``channels`` which each dataset has.
 
-def all_waveforms(folder, parsers=None):
-    for dataset in all_datasets(folder, parsers):
-        for waveform in dataset.waveforms:
-            yield waveform
+    .. seealso:: :func:`all_datasets`
+    """
+    for dataset in all_datasets(folder, parsers, skip_errors, cache,
+                                channels=channels, **kwargs):
+        if channels is None:
+            for waveform in dataset.waveforms:
+                yield waveform
+            continue
+        for idx in sorted(set(channels)):
+            if 0 <= idx < len(dataset.waveforms):
+                yield dataset.waveforms[idx]
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmarks of acquisition, processing and rendering.
+
+Synthetic captures in each of the supported formats are generated in a
+temporary folder, and each stage of the pipeline is timed on them :
+
+    - ``parse`` : reading the file with its :class:`acquire.DataSet`
+    - ``process`` : :func:`process.get_fd` and :func:`process.get_sd`
+    - ``bins`` : :func:`render.get_optimum_bins`
+    - ``render`` : :func:`render.make_graph` and
+      :func:`render.make_histogram`
+
+Each case runs in a fresh worker process, so that the peak resident
+set size reported for a stage, which includes every stage before it,
+is not inflated by earlier cases. Results are written as JSON, and may
+be compared against those of an earlier run ::
+
+    python bench.py --sizes 100000 1000000 --out new.json --baseline old.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+import numpy
+
+import render
+import process
+import acquire
+import instrument
+
+FORMATS = ('csv', 'bindump', 'iq')
+STAGES = ('parse', 'process', 'bins', 'render')
+
+
+def _signal(nsamples, nch, seed=0):
+    rng = numpy.random.RandomState(seed)
+    t = numpy.arange(nsamples)
+    ys = [numpy.sin(2 * numpy.pi * t / (1000.0 + 100 * i)) +
+          0.05 * rng.standard_normal(nsamples) for i in range(nch)]
+    return t * 1e-6, ys
+
+
+def write_csv(path, nsamples, nch=1):
+    """
+    Writes a plain capture, as read by :class:`acquire.CSVDataSet`.
+    """
+    x, ys = _signal(nsamples, nch)
+    numpy.savetxt(str(path), numpy.column_stack([x] + ys),
+                  delimiter=',', fmt='%.9g')
+
+
+def write_bindump(path, nsamples, nch=1, nbits=16):
+    """
+    Writes a binary dump, as read by :class:`acquire.CSVBinDump`.
+    """
+    x, ys = _signal(nsamples, nch)
+    columns = []
+    for y in ys:
+        codes = ((y + 1.5) / 3 * ((1 << nbits) - 1)).astype(numpy.uint32)
+        bits = (codes[:, None] >> numpy.arange(nbits - 1, -1, -1)) & 1
+        chars = (bits + ord('0')).astype(numpy.uint8)
+        columns.append(chars.view('S{0}'.format(nbits)).ravel())
+    with open(str(path), 'w') as f:
+        for row in zip(x, *columns):
+            f.write('{0:.9g},{1}\n'.format(
+                row[0], ','.join(c.decode('ascii') for c in row[1:])
+            ))
+
+
+def write_iq(path, nsamples, nch=1):
+    """
+    Writes an IQ export with its header, as read by
+    :class:`acquire.IQDataSet`.
+    """
+    x, ys = _signal(nsamples, nch)
+    with open(str(path), 'w') as f:
+        f.write('channels_{0},\n'.format(nch))
+        f.write(','.join(['field_time'] + ['field_ch{0}'.format(i)
+                                           for i in range(nch)]) + '\n')
+        f.write(','.join(['unit_s'] + ['unit_V'] * nch) + '\n')
+        numpy.savetxt(f, numpy.column_stack([x] + [(y * 1000).astype(int)
+                                                   for y in ys]),
+                      delimiter=',', fmt=['%.9g'] + ['%d'] * nch)
+
+
+WRITERS = {'csv': write_csv, 'bindump': write_bindump, 'iq': write_iq}
+PARSERS = {'csv': acquire.CSVDataSet, 'bindump': acquire.CSVBinDump,
+           'iq': acquire.IQDataSet}
+
+
+def _timed(func, *args, **kwargs):
+    start = time.time()
+    rval = func(*args, **kwargs)
+    return rval, time.time() - start
+
+
+def run_case(fmt, path, stages, outfolder):
+    """
+    Runs the stages of one case in the current process, and returns a
+    dict of ``{stage: (seconds, peak_rss_mb)}``.
+    """
+    rval = {}
+    dataset, elapsed = _timed(PARSERS[fmt], path)
+    rval['parse'] = (elapsed, instrument._peak_rss_mb())
+    ys = [dataset.channel(i) for i in range(len(dataset.waveforms))]
+    if 'process' in stages:
+        start = time.time()
+        for y in ys:
+            process.get_fd(y)
+            process.get_sd(y)
+        rval['process'] = (time.time() - start, instrument._peak_rss_mb())
+    if 'bins' in stages:
+        start = time.time()
+        for y in ys:
+            render.get_optimum_bins(y)
+        rval['bins'] = (time.time() - start, instrument._peak_rss_mb())
+    if 'render' in stages:
+        start = time.time()
+        for i, y in enumerate(ys):
+            render.make_graph(os.path.join(outfolder, '{0}.w.png'.format(i)),
+                              y, dataset.x_data)
+            render.make_histogram(
+                os.path.join(outfolder, '{0}.h.png'.format(i)), y, bins=50
+            )
+        rval['render'] = (time.time() - start, instrument._peak_rss_mb())
+    return rval
+
+
+def run(formats=FORMATS, sizes=(100000,), nch=1, stages=STAGES, repeat=1,
+        folder=None):
+    """
+    Generates the synthetic captures and runs every case, returning a
+    list of result records. Times are the best of ``repeat`` runs.
+
+    :param folder: The folder in which to write the captures and plots,
+                   by default a temporary folder which is removed once
+                   the cases have run. A folder given is left in place.
+    """
+    created = folder is None
+    if created:
+        folder = tempfile.mkdtemp(prefix='mwtp-bench-')
+    results = []
+    try:
+        for fmt in formats:
+            for nsamples in sizes:
+                path = os.path.join(folder, '{0}.{1}.csv'.format(fmt,
+                                                                 nsamples))
+                WRITERS[fmt](path, nsamples, nch)
+                best = {}
+                for _ in range(repeat):
+                    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+                    try:
+                        case = pool.apply(run_case,
+                                          (fmt, path, stages, folder))
+                    finally:
+                        pool.terminate()
+                        pool.join()
+                    for stage, (elapsed, rss) in case.items():
+                        prev = best.get(stage, (elapsed, rss))
+                        best[stage] = (min(prev[0], elapsed),
+                                       max(prev[1], rss))
+                for stage in STAGES:
+                    if stage not in best:
+                        continue
+                    elapsed, rss = best[stage]
+                    samples = nsamples * nch
+                    results.append({
+                        'format': fmt, 'stage': stage, 'samples': nsamples,
+                        'channels': nch, 'seconds': elapsed,
+                        'samples_per_s': samples / max(elapsed, 1e-9),
+                        'peak_rss_mb': rss,
+                        'file_mb': os.path.getsize(path) / 1024.0 ** 2,
+                    })
+                os.remove(path)
+    finally:
+        if created:
+            shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def environment():
+    import matplotlib
+    return {'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'matplotlib': matplotlib.__version__,
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def _key(record):
+    return record['format'], record['stage'], record['samples'], \
+        record['channels']
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Compares results against a baseline, and returns a list of
+    ``(record, ratio)`` for each case which is slower than the baseline
+    by more than ``threshold``. The ratio is of the baseline throughput
+    to the current throughput.
+    """
+    reference = dict((_key(r), r) for r in baseline)
+    regressions = []
+    for record in results:
+        ref = reference.get(_key(record))
+        if ref is None:
+            continue
+        ratio = ref['samples_per_s'] / record['samples_per_s']
+        record['baseline_ratio'] = ratio
+        if ratio > 1 + threshold:
+            regressions.append((record, ratio))
+    return regressions
+
+
+def report(results):
+    print('{0:<8} {1:<8} {2:>10} {3:>10} {4:>14} {5:>10} {6:>10}'.format(
+        'format', 'stage', 'samples', 'seconds', 'samples/s', 'rss MB',
+        'vs base'))
+    for r in results:
+        ratio = r.get('baseline_ratio')
+        ratio = '{0:.2f}x'.format(1 / ratio) if ratio else ''
+        print('{0:<8} {1:<8} {2:>10} {3:>10.3f} {4:>14.0f} {5:>10.1f} '
+              '{6:>10}'.format(r['format'], r['stage'], r['samples'],
+                               r['seconds'], r['samples_per_s'],
+                               r['peak_rss_mb'], ratio))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description="Benchmark acquisition, "
+                                                 "processing and rendering")
+    parser.add_argument('--formats', nargs='+', default=list(FORMATS),
+                        choices=FORMATS)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100000],
+                        help="Numbers of samples per capture.")
+    parser.add_argument('--channels', type=int, default=1)
+    parser.add_argument('--stages', nargs='+', default=list(STAGES),
+                        choices=STAGES)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per case. The best time is reported.")
+    parser.add_argument('--out', help="Write the results to this file.")
+    parser.add_argument('--baseline',
+                        help="Compare against results from this file.")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Slowdown relative to the baseline above "
+                             "which a case is reported as a regression.")
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    results = run(args.formats, args.sizes, args.channels, args.stages,
+                  args.repeat)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+    report(results)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'environment': environment(), 'results': results},
+                      f, indent=2)
+    for record, ratio in regressions:
+        print("Regression : {0} {1} at {2} samples is {3:.2f}x slower"
+              "".format(record['format'], record['stage'],
+                        record['samples'], ratio))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Persistent on-disk cache of parsed datasets.
+
+Each cached dataset is a folder holding one ``.npy`` file per column
+and a ``meta.json`` describing the source file it was parsed from.
+Columns are loaded memory mapped, so a cache hit costs little more
+than opening the files. Entries are validated against the size,
+modification time and content hash of the source file. The size and
+modification time are taken before the file is parsed, and the hash of
+the contents as the parser reads them, see :class:`SourceFile`. The
+modification time of ``meta.json`` records the last use of an entry,
+and is used for least recently used eviction.
+
+There is deliberately no shared index, so that several processes may
+use the same cache at once.
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import numpy
+
+import timebase
+from store import ColumnStore
+
+FORMAT_VERSION = 3
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+
+def content_hash(path, blocksize=1 << 20):
+    h = hashlib.sha1()
+    with open(str(path), 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fingerprint(path, with_hash=True):
+    """
+    Returns a dict identifying the current contents of the file at
+    ``path`` : its resolved path, size, modification time and,
+    optionally, the SHA1 hash of its contents.
+    """
+    path = os.path.realpath(str(path))
+    st = os.stat(path)
+    rval = {'path': path, 'size': st.st_size, 'mtime': st.st_mtime}
+    if with_hash:
+        rval['hash'] = content_hash(path)
+    return rval
+
+
+class _HashingReader(io.RawIOBase):
+    # Passes the bytes read from a file to a SourceFile. Seeking back to
+    # the start restarts the hash, and seeking anywhere else spoils it.
+    def __init__(self, raw, source):
+        self._raw = raw
+        self._source = source
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._raw.readinto(b)
+        if n:
+            self._source._update(memoryview(b)[:n])
+        return n
+
+    def tell(self):
+        return self._raw.tell()
+
+    def seek(self, pos, whence=0):
+        if (pos, whence) == (0, 1):
+            return self._raw.tell()
+        pos = self._raw.seek(pos, whence)
+        self._source._restart(pos)
+        return pos
+
+    def close(self):
+        self._raw.close()
+        super(_HashingReader, self).close()
+
+
+class SourceFile(object):
+    """
+    The source file of a dataset being parsed. Its fingerprint is taken
+    when this is created, before the file is read, so that a file which
+    changes while it is parsed is not recorded as current. The contents
+    are hashed as the parser reads them, so that the file is only read
+    once.
+
+    :param path: The path to the file
+    """
+    def __init__(self, path):
+        self.fingerprint = fingerprint(path, with_hash=False)
+        self._hash = None
+        self._nbytes = 0
+
+    def open(self):
+        """
+        Opens the file for reading as text, as :meth:`pathlib.Path.open`
+        would.
+        """
+        raw = _HashingReader(io.FileIO(self.fingerprint['path'], 'rb'), self)
+        self._restart(0)
+        return io.TextIOWrapper(io.BufferedReader(raw))
+
+    def _restart(self, pos):
+        self._hash = hashlib.sha1() if pos == 0 else None
+        self._nbytes = 0
+
+    def _update(self, data):
+        if self._hash is not None:
+            self._hash.update(data)
+            self._nbytes += len(data)
+
+    def digest(self):
+        """
+        Returns the fingerprint, with the hash of the contents if they
+        were read once, from start to end, and were as long as the file
+        was when the fingerprint was taken.
+        """
+        rval = dict(self.fingerprint)
+        if self._hash is not None and self._nbytes == rval['size']:
+            rval['hash'] = self._hash.hexdigest()
+        return rval
+
+
+def channel_attrs(renderable):
+    """
+    Returns the simple public attributes, such as names and units, which
+    the parser set on a channel.
+    """
+    return dict((k, v) for k, v in vars(renderable).items()
+                if not k.startswith('_') and k not in ('parent', 'fidx') and
+                isinstance(v, (str, int, float)))
+
+
+class DataSetCache(object):
+    """
+    :param folder: The folder in which cache entries are kept
+    :param max_bytes: The total size of the cache, beyond which the
+                      least recently used entries are evicted
+    :param refresh: If ``True``, entries stored before the cache was
+                    created are ignored and replaced, forcing every
+                    dataset to be re-parsed once
+    """
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+        self.folder = os.path.abspath(str(folder))
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.created = time.time()
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+
+    def _key(self, path, parser):
+        key = '{0}|{1}|{2}'.format(os.path.realpath(str(path)),
+                                   parser.__name__, FORMAT_VERSION)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+
+    def _entry(self, path, parser):
+        return os.path.join(self.folder, self._key(path, parser))
+
+    def _read_meta(self, entry):
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry, meta):
+        fd, tmp = tempfile.mkstemp(dir=entry, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.rename(tmp, os.path.join(entry, 'meta.json'))
+
+    def _validate(self, entry, meta, path):
+        current = fingerprint(path, with_hash=False)
+        source = meta['source']
+        if source['path'] != current['path'] or \
+                source['size'] != current['size']:
+            return False
+        if source['mtime'] == current['mtime']:
+            return True
+        # Touched, but possibly not changed. Compare the contents.
+        if 'hash' not in source or content_hash(path) != source['hash']:
+            return False
+        source['mtime'] = current['mtime']
+        self._write_meta(entry, meta)
+        return True
+
+    def load(self, dataset):
+        """
+        Populates ``dataset`` from the cache, if a valid entry exists
+        for its source file. Stale entries are removed.
+
+        :return: ``True`` if the dataset was loaded from the cache
+        """
+        entry = self._entry(dataset._uri, type(dataset))
+        meta = self._read_meta(entry)
+        if meta is None:
+            return False
+        if meta.get('version') != FORMAT_VERSION or \
+                (self.refresh and meta['stored'] < self.created) or \
+                not self._validate(entry, meta, dataset._uri):
+            self.invalidate_entry(entry)
+            return False
+        x = None
+        if meta['x']['kind'] != 'uniform':
+            x = numpy.load(os.path.join(entry, 'x.npy'), mmap_mode='r')
+        x = timebase.load(meta['x'], x)
+        columns = [numpy.load(os.path.join(entry, 'ch{0}.npy'.format(i)),
+                              mmap_mode='r')
+                   for i in range(meta['nch'])]
+        dataset._create_channels(meta['nch'])
+        dataset._store = ColumnStore.from_arrays(x, columns)
+        for waveform, attrs in zip(dataset.waveforms, meta['channels']):
+            for k, v in attrs.items():
+                setattr(waveform, k, v)
+        os.utime(os.path.join(entry, 'meta.json'), None)
+        return True
+
+    def store(self, dataset, source=None):
+        """
+        Writes the parsed contents of ``dataset`` to the cache, and
+        then evicts old entries if the cache is over its size limit.
+
+        :param source: The :class:`SourceFile` the dataset was parsed
+                       from. Without it, the source file is fingerprinted
+                       and hashed now.
+        """
+        if source is None:
+            source = fingerprint(dataset._uri)
+        else:
+            source = source.digest()
+        entry = self._entry(dataset._uri, type(dataset))
+        tmp = tempfile.mkdtemp(dir=self.folder, prefix='.tmp')
+        try:
+            nbytes = 0
+            xmeta, x = timebase.dump(dataset.x_data)
+            arrays = [('x', x)] if x is not None else []
+            arrays.extend(('ch{0}'.format(i), dataset.channel(i))
+                          for i in range(len(dataset.waveforms)))
+            for name, array in arrays:
+                numpy.save(os.path.join(tmp, name + '.npy'), array)
+                nbytes += array.nbytes
+            meta = {
+                'version': FORMAT_VERSION,
+                'parser': type(dataset).__name__,
+                'source': source,
+                'nch': len(dataset.waveforms),
+                'x': xmeta,
+                'channels': [channel_attrs(w) for w in dataset.waveforms],
+                'bytes': nbytes,
+                'stored': time.time(),
+            }
+            self._write_meta(tmp, meta)
+            self.invalidate_entry(entry)
+            os.rename(tmp, entry)
+        except OSError:
+            # Most likely stored by another process in the meanwhile
+            if self._read_meta(entry) is None:
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=entry)
+
+    def entry_file(self, dataset, name):
+        """
+        Returns the path of a file named ``name`` kept alongside the
+        cached columns of ``dataset``, such as data derived from them,
+        or ``None`` if the dataset is not cached. Such files are removed
+        along with the entry.
+        """
+        entry = self._entry(dataset._uri, type(dataset))
+        if self._read_meta(entry) is None:
+            return None
+        return os.path.join(entry, name)
+
+    def invalidate_entry(self, entry):
+        shutil.rmtree(entry, ignore_errors=True)
+
+    def invalidate(self, path=None, parser=None):
+        """
+        Removes the entry for the file at ``path`` as parsed by
+        ``parser``, or every entry if ``path`` is ``None``.
+        """
+        if path is not None:
+            self.invalidate_entry(self._entry(path, parser))
+            return
+        for entry in self.entries():
+            self.invalidate_entry(entry)
+
+    def entries(self):
+        for name in os.listdir(self.folder):
+            if name.startswith('.'):
+                continue
+            entry = os.path.join(self.folder, name)
+            if os.path.isdir(entry):
+                yield entry
+
+    def evict(self, keep=None):
+        """
+        Removes least recently used entries until the cache fits in
+        ``max_bytes``. The entry ``keep`` is only removed if it alone
+        exceeds the limit.
+        """
+        usage = []
+        for entry in self.entries():
+            meta = self._read_meta(entry)
+            if meta is None:
+                # Incomplete or damaged
+                self.invalidate_entry(entry)
+                continue
+            atime = os.path.getmtime(os.path.join(entry, 'meta.json'))
+            usage.append((entry == keep, atime, meta['bytes'], entry))
+        total = sum(x[2] for x in usage)
+        for _, _, nbytes, entry in sorted(usage):
+            if total <= self.max_bytes:
+                break
+            self.invalidate_entry(entry)
+            total -= nbytes
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A compact binary container for captures, read with memory mapping and
+without parsing or copying.
+
+A container file, with the suffix :data:`SUFFIX`, is laid out as :
+
+    - The 8 byte magic string :data:`MAGIC`
+    - The length of the header in bytes, a little endian ``uint32``
+    - The header, UTF-8 encoded JSON, padded with spaces so that the
+      data which follows starts at a multiple of :data:`ALIGN` bytes
+    - The columns, each a contiguous array starting at a multiple of
+      :data:`ALIGN` bytes from the start of the file
+
+The header is an object with the keys :
+
+    - ``version`` : :data:`FORMAT_VERSION`
+    - ``parser`` : The name of the :class:`acquire.DataSet` subclass the
+      capture was originally read with, which determines how its
+      channels are processed
+    - ``count`` : The number of samples
+    - ``x`` : The time base, as from :func:`timebase.dump`
+    - ``columns`` : A list of ``{name, dtype, offset}`` objects, where
+      ``name`` is ``x`` for an x-axis which is not uniform and
+      ``ch<N>`` for the channels, ``dtype`` is a numpy type string
+      including the byte order, such as ``<i8``, and ``offset`` is the
+      position of the first byte of the column in the file
+    - ``channels`` : A list with an object for each channel, holding
+      the attributes set on it from the preamble of the source file,
+      such as its names and units
+
+Captures in any of the text formats are converted with :func:`convert`.
+"""
+
+import os
+import json
+import struct
+import tempfile
+import numpy
+
+import timebase
+from cache import channel_attrs
+
+MAGIC = b'MWTPCAP\x00'
+FORMAT_VERSION = 1
+SUFFIX = '.mwtp'
+ALIGN = 64
+
+_LENGTH = struct.Struct('<I')
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def write(path, dataset):
+    """
+    Writes the contents of a parsed ``dataset`` to a container at
+    ``path``. The file is replaced atomically.
+    """
+    path = str(path)
+    xmeta, x = timebase.dump(dataset.x_data)
+    arrays = [('x', x)] if x is not None else []
+    arrays.extend(('ch{0}'.format(i), dataset.channel(i))
+                  for i in range(len(dataset.waveforms)))
+    arrays = [(name, numpy.ascontiguousarray(a)) for name, a in arrays]
+    header = {
+        'version': FORMAT_VERSION,
+        'parser': type(dataset).__name__,
+        'count': len(dataset.x_data),
+        'x': xmeta,
+        'columns': [],
+        'channels': [channel_attrs(w) for w in dataset.waveforms],
+    }
+    # Offsets depend on the length of the header, which depends on the
+    # offsets. Leave room for them to grow, then fill them in.
+    for name, array in arrays:
+        header['columns'].append({'name': name, 'dtype': array.dtype.str,
+                                  'offset': 0})
+    size = len(json.dumps(header)) + 32 * len(arrays) + ALIGN
+    start = _aligned(len(MAGIC) + _LENGTH.size + size)
+    offset = start
+    for column, (_, array) in zip(header['columns'], arrays):
+        column['offset'] = offset
+        offset = _aligned(offset + array.nbytes)
+    text = json.dumps(header).encode('utf-8')
+    text += b' ' * (start - len(MAGIC) - _LENGTH.size - len(text))
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                               suffix=SUFFIX + '.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(text)))
+            f.write(text)
+            for column, (_, array) in zip(header['columns'], arrays):
+                f.seek(column['offset'])
+                f.write(array.tobytes())
+        # mkstemp creates files readable only by their owner
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def read_header(path):
+    """
+    Returns the header of the container at ``path``.
+
+    :raises ValueError: If the file is not a container of a supported
+                        version
+    """
+    with open(str(path), 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{0} is not a capture container".format(path))
+        length, = _LENGTH.unpack(f.read(_LENGTH.size))
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header.get('version') != FORMAT_VERSION:
+        raise ValueError("{0} is a container of unsupported version {1}"
+                         "".format(path, header.get('version')))
+    return header
+
+
+def load(path):
+    """
+    Maps the container at ``path``, and returns ``(header, x, columns)``,
+    the x-axis as an array or time base and a list of read only memory
+    mapped arrays, one per channel.
+    """
+    header = read_header(path)
+    count = header['count']
+    arrays = {}
+    for column in header['columns']:
+        dtype = numpy.dtype(column['dtype'])
+        if count:
+            arrays[column['name']] = numpy.memmap(
+                str(path), dtype=dtype, mode='r', offset=column['offset'],
+                shape=(count,)
+            )
+        else:
+            arrays[column['name']] = numpy.zeros(0, dtype=dtype)
+    x = timebase.load(header['x'], arrays.get('x'))
+    columns = [arrays['ch{0}'.format(i)]
+               for i in range(len(header['channels']))]
+    return header, x, columns
+
+
+def container_path(datafile):
+    """
+    Returns the path of the container converted from ``datafile``.
+    """
+    return datafile.with_suffix(SUFFIX)
+
+
+def is_current(datafile):
+    """
+    Returns ``True`` if ``datafile`` has been converted to a container
+    which is at least as new as it.
+    """
+    path = container_path(datafile)
+    try:
+        return os.path.getmtime(str(path)) >= \
+            os.path.getmtime(str(datafile))
+    except OSError:
+        return False
+
+
+def convert(parser, datafile, outpath=None):
+    """
+    Parses ``datafile`` with ``parser``, a :class:`acquire.DataSet`
+    subclass, and writes it to a container, by default alongside it.
+
+    :return: The path of the container
+    """
+    if outpath is None:
+        outpath = container_path(datafile)
+    write(outpath, parser(datafile))
+    return outpath
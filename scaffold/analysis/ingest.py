@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Bulk parsing of the numeric body of CSV captures.
+
+The body of a file is read in large chunks of lines, each of which is
+parsed in one call into a 2D array with one column per CSV field.
+Malformed content raises :class:`ValueError`, which the parsers in
+:mod:`acquire` use to fall back to their row-by-row state machines.
+"""
+
+import numpy
+
+import timebase
+
+CHUNK_BYTES = 1 << 24
+
+# Longest text of an x field read for exact ticks
+_X_WIDTH = 32
+
+
+def read_chunks(f, head=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Yields lists of lines from the file object ``f``, each about
+    ``chunk_bytes`` long. Lines in ``head``, already consumed from
+    ``f`` by a header scan, are emitted first.
+    """
+    if head:
+        yield list(head)
+    while True:
+        lines = f.readlines(chunk_bytes)
+        if not lines:
+            break
+        yield lines
+
+
+def parse_chunk(lines, ncols, converters=None, usecols=None, exact_x=False):
+    """
+    Parses a list of CSV lines into a float64 array of shape
+    ``(nrows, ncols)``. Empty lines are skipped, whitespace around
+    fields is ignored and fields beyond ``ncols`` are dropped. Lines of
+    whitespace alone are malformed, and are left to the row parsers.
+
+    :param lines: The lines to parse
+    :param ncols: The number of leading fields to keep per line
+    :param converters: Optional per-column conversion functions, as
+                       accepted by :func:`numpy.loadtxt`
+    :param usecols: The indices of the fields to keep, in place of the
+                    first ``ncols``. Fields which are not kept are not
+                    converted.
+    :param exact_x: Also read the first field kept, the x-axis, as text,
+                    and return ``(block, ticks, places)`` with its exact
+                    ticks from :func:`timebase.parse_ticks`. The ticks
+                    are ``None`` if the field is not a plain decimal.
+    :raises ValueError: If a line can't be parsed
+    """
+    if usecols is None:
+        usecols = range(ncols)
+    if not exact_x:
+        return numpy.loadtxt(lines, delimiter=',', ndmin=2,
+                             dtype=numpy.float64, usecols=usecols,
+                             converters=converters)
+    # The x field is read twice, as a number and as text. The numbers
+    # follow the text in each record, and are returned as a 2D view.
+    usecols = list(usecols)
+    dtype = numpy.dtype([('text', 'S{0}'.format(_X_WIDTH))] +
+                        [('f{0}'.format(i), numpy.float64)
+                         for i in range(len(usecols))])
+    fields = numpy.loadtxt(lines, delimiter=',', ndmin=1, dtype=dtype,
+                           usecols=[usecols[0]] + usecols,
+                           converters=converters)
+    if not len(fields):
+        return (numpy.zeros((0, len(usecols))),
+                numpy.zeros(0, dtype=numpy.int64), 0)
+    block = numpy.ndarray((len(fields), len(usecols)), dtype=numpy.float64,
+                          buffer=fields, offset=_X_WIDTH,
+                          strides=(dtype.itemsize, 8))
+    texts = numpy.ascontiguousarray(fields['text'])
+    if numpy.any(texts.view(numpy.uint8)
+                                .reshape(len(texts), -1)[:, -1]):
+        # Possibly truncated. Such long timestamps can't be exact anyway.
+        return block, None, None
+    ticks, places = timebase.parse_ticks(texts)
+    return block, ticks, places
+
+
+def read_blocks(f, ncols, head=None, converters=None,
+                chunk_bytes=CHUNK_BYTES, usecols=None, exact_x=False):
+    """
+    Yields the remainder of ``f`` as a sequence of parsed 2D blocks, or
+    with ``exact_x``, of ``(block, ticks, places)``. Once the ticks of a
+    block are ``None``, those of the following blocks are not read.
+
+    .. seealso:: :func:`parse_chunk`
+    """
+    exact = exact_x
+    for lines in read_chunks(f, head, chunk_bytes):
+        rval = parse_chunk(lines, ncols, converters, usecols, exact)
+        if exact_x and not exact:
+            rval = rval, None, None
+        elif exact_x and rval[1] is None:
+            # The time base can't be exact, so the text is not read again
+            exact = False
+        if len(rval[0] if exact_x else rval):
+            yield rval
+
+
+def rebuffer(blocks, nrows):
+    """
+    Regroups a sequence of 2D blocks into blocks of exactly ``nrows``
+    rows. The last block yielded may be shorter.
+    """
+    pending = []
+    npending = 0
+    for block in blocks:
+        pending.append(block)
+        npending += len(block)
+        if npending < nrows:
+            continue
+        data = numpy.concatenate(pending)
+        nfull = (len(data) // nrows) * nrows
+        for start in range(0, nfull, nrows):
+            yield data[start:start + nrows]
+        pending = [data[nfull:]]
+        npending = len(data) - nfull
+    if npending:
+        yield numpy.concatenate(pending)
+
+
+def parse_bincodes(values, nbits=16):
+    """
+    Converts binary codes, such as ``0010110``, which have been parsed
+    as though they were decimal numbers, into unsigned integers. Codes
+    of up to 16 digits are represented exactly by the float64 arrays
+    produced by :func:`parse_chunk`, so the body of a binary dump can
+    be read with the same bulk parser as any other capture. The digits
+    are then peeled off arithmetically, across all codes at once.
+
+    :param values: An array of codes parsed as decimal numbers
+    :param nbits: The number of bits to keep, from the LSB, at most 16
+    :return: An array of uint16 codes, of the same shape
+    :raises ValueError: If a value is not a binary code of at most
+                        16 digits
+    """
+    values = numpy.asarray(values)
+    digits = values.astype(numpy.int64)
+    if numpy.any(digits != values) or numpy.any(digits < 0) \
+            or numpy.any(digits > 1111111111111111):
+        raise ValueError("Values are not binary codes of up to 16 digits")
+    codes = numpy.zeros(values.shape, dtype=numpy.uint16)
+    for b in range(16):
+        digits, digit = numpy.divmod(digits, 10)
+        if numpy.any(digit > 1):
+            raise ValueError("Values are not binary codes")
+        if b < nbits:
+            codes |= (digit << b).astype(numpy.uint16)
+    return codes
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Timers and counters for the stages of the pipeline.
+
+Code is instrumented with :func:`stage` around units of work, and
+:func:`count` for quantities such as samples processed or bytes read.
+These are recorded into every :class:`Stats` opened with :func:`scope`
+on the current thread, so that a scope around a whole waveform also
+collects the stages within it. When instrumentation is disabled, which
+is the default, the hooks do nothing.
+"""
+
+import csv
+import json
+import time
+import resource
+import threading
+import functools
+from contextlib import contextmanager
+
+ENABLED = False
+
+_local = threading.local()
+
+
+def enable(enabled=True):
+    global ENABLED
+    ENABLED = enabled
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Stats(object):
+    """
+    Accumulated times and call counts per stage, counters, and
+    ``process_peak_rss_mb``, the peak resident set size of the process
+    which recorded them, as it stood when the last of their scopes
+    ended. This is the high water mark of the whole process up to then,
+    and not the memory used by the work recorded : the stats of one
+    waveform include that of every waveform handled before it by the
+    same process. Merged stats hold the largest peak of those merged.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.process_peak_rss_mb = 0.0
+
+    def add_time(self, name, seconds):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        if other is None:
+            return self
+        for name, (seconds, calls) in other.stages.items():
+            entry = self.stages.setdefault(name, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+        for name, value in other.counters.items():
+            self.count(name, value)
+        self.process_peak_rss_mb = max(self.process_peak_rss_mb,
+                                       other.process_peak_rss_mb)
+        return self
+
+    def seconds(self, name):
+        return self.stages.get(name, (0.0, 0))[0]
+
+    def as_dict(self):
+        return {
+            'stages': dict((k, {'seconds': v[0], 'calls': v[1]})
+                           for k, v in self.stages.items()),
+            'counters': dict(self.counters),
+            'process_peak_rss_mb': self.process_peak_rss_mb,
+        }
+
+
+def _scopes():
+    scopes = getattr(_local, 'scopes', None)
+    if scopes is None:
+        scopes = _local.scopes = []
+    return scopes
+
+
+@contextmanager
+def scope(stats=None):
+    """
+    Collects the stages and counters recorded on this thread within the
+    block into ``stats``, or a new :class:`Stats`, which is yielded.
+    """
+    if stats is None:
+        stats = Stats()
+    if not ENABLED:
+        yield stats
+        return
+    scopes = _scopes()
+    scopes.append(stats)
+    try:
+        yield stats
+    finally:
+        scopes.remove(stats)
+        stats.process_peak_rss_mb = max(stats.process_peak_rss_mb,
+                                        _peak_rss_mb())
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the block as an occurrence of the stage ``name``.
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start
+        for stats in _scopes():
+            stats.add_time(name, elapsed)
+
+
+def timed(name):
+    """
+    Decorator form of :func:`stage`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    if not ENABLED:
+        return
+    for stats in _scopes():
+        stats.count(name, value)
+
+
+def write_summary(path, summary):
+    """
+    Writes a summary, a dict of ``{name: {part: Stats}}`` such as one
+    per waveform with its ``acquire``, ``process`` and ``render`` parts,
+    to ``path``. A ``.csv`` path gets one row per name and part, with a
+    column for each stage and counter. Any other path gets JSON.
+    """
+    path = str(path)
+    if not path.endswith('.csv'):
+        with open(path, 'w') as f:
+            json.dump(dict((name, dict((part, stats.as_dict())
+                                       for part, stats in parts.items()))
+                           for name, parts in summary.items()),
+                      f, indent=2, sort_keys=True)
+        return
+    stages, counters = set(), set()
+    for parts in summary.values():
+        for stats in parts.values():
+            stages.update(stats.stages)
+            counters.update(stats.counters)
+    stages, counters = sorted(stages), sorted(counters)
+    with open(path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'part', 'process_peak_rss_mb'] +
+                        [x + '_s' for x in stages] + counters)
+        for name in sorted(summary):
+            for part, stats in sorted(summary[name].items()):
+                writer.writerow(
+                    [name, part, '{0:.1f}'.format(stats.process_peak_rss_mb)] +
+                    ['{0:.6f}'.format(stats.seconds(x)) for x in stages] +
+                    [stats.counters.get(x, 0) for x in counters]
+                )
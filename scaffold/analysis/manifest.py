@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Manifest of rendered outputs, for incremental re-rendering.
+
+Each output file is recorded with a digest of everything which went
+into it : the fingerprint of the source file, the processing stage and
+version, the rendering function and its parameters, and the global
+configuration of rendering and of spectral estimation. A plot whose
+output exists and whose digest is unchanged need not be drawn again.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import numpy
+
+import output
+import process
+import spectral
+
+
+def _is_data(value):
+    # Arrays, and array-likes such as time bases
+    if hasattr(value, '__array__'):
+        return True
+    if isinstance(value, (list, tuple)):
+        return any(hasattr(x, '__array__') for x in value)
+    return False
+
+
+def render_config():
+    import render
+    return {'dpi': render.GRAPH_DPI, 'decimate': render.DECIMATE,
+            'decimate_threshold': render.DECIMATE_THRESHOLD,
+            'png_compression': output.PNG_COMPRESSION,
+            'spectral': {'window': spectral.WINDOW,
+                         'nperseg': spectral.NPERSEG,
+                         'overlap': spectral.OVERLAP}}
+
+
+def job_digest(job, source):
+    """
+    Returns a digest of the inputs of a rendering job, other than the
+    data arrays themselves, which are determined by the source and the
+    processing stage.
+
+    :param job: A :class:`pipeline.Job`
+    :param source: The fingerprint of the source file, as from
+                   :func:`cache.fingerprint`
+    """
+    params = dict((k, v) for k, v in job.kwargs.items()
+                  if k != 'outpath' and not _is_data(v))
+    inputs = {
+        'source': source,
+        'stage': job.name,
+        'process': process.STAGE_VERSION,
+        'func': '{0}.{1}'.format(job.func.__module__, job.func.__name__),
+        'params': params,
+        'render': render_config(),
+    }
+    blob = json.dumps(inputs, sort_keys=True, default=repr)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()
+
+
+class Manifest(object):
+    def __init__(self, path):
+        self.path = str(path)
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        self.skipped = []
+
+    def is_fresh(self, job, digest):
+        outpath = job.kwargs['outpath']
+        return self.entries.get(outpath) == digest and os.path.exists(outpath)
+
+    def stale_jobs(self, jobs, source):
+        """
+        Yields ``(job, digest)`` for each job whose output is missing or
+        out of date. Jobs which are up to date are added to ``skipped``.
+        """
+        for job in jobs:
+            digest = job_digest(job, source)
+            if self.is_fresh(job, digest):
+                self.skipped.append(job.name)
+                continue
+            yield job, digest
+
+    def record(self, outpath, digest):
+        self.entries[outpath] = digest
+
+    def forget(self, outpath):
+        self.entries.pop(outpath, None)
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        # mkstemp creates files readable only by their owner
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, self.path)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Encoding and writing of rendered images in the background.
+
+Drawing a figure produces an RGBA buffer. Compressing it into a PNG and
+writing the file takes about as long again, and need not hold up the
+drawing of the next figure. A :class:`PNGWriter` takes copies of such
+buffers and encodes and writes them on a pool of threads, which run
+concurrently with drawing since zlib releases the GIL. The number of
+buffers waiting to be written is bounded, and drawing waits for a slot
+when it is reached, so that memory use stays bounded.
+
+Files are written as :meth:`matplotlib.figure.Figure.savefig` would
+write them, with the same metadata, so that the output does not depend
+on whether it was written in the background.
+"""
+
+from __future__ import print_function
+
+import traceback
+import threading
+from multiprocessing import util
+from multiprocessing.pool import ThreadPool
+
+import numpy
+
+#: zlib compression level of PNG files, from 0 to 9. Lower levels are
+#: faster to write and give larger files, for interim runs. 6 is the
+#: default of matplotlib.
+PNG_COMPRESSION = 6
+
+#: Number of threads encoding and writing PNG files in each process. With
+#: 0, figures are written before the plotting function returns.
+PNG_WRITERS = 0
+
+#: Maximum number of images waiting to be written in each process
+PNG_PENDING = 4
+
+_lock = threading.Lock()
+_writer = None
+
+
+def _pnginfo():
+    # Imported here, so that importing this module for its settings does
+    # not load matplotlib and PIL in runs which render nothing
+    import matplotlib
+    from PIL.PngImagePlugin import PngInfo
+    info = PngInfo()
+    info.add_text('Software', 'Matplotlib version{0}, https://matplotlib.org/'
+                              ''.format(matplotlib.__version__))
+    return info
+
+
+class PNGWriter(object):
+    """
+    :param workers: The number of encoding threads
+    :param max_pending: The maximum number of images accepted but not
+                        yet written
+    :param compress_level: The zlib compression level
+    """
+    def __init__(self, workers=2, max_pending=PNG_PENDING,
+                 compress_level=PNG_COMPRESSION):
+        self.compress_level = compress_level
+        self._pool = ThreadPool(workers)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._idle = threading.Condition(threading.Lock())
+        self._npending = 0
+        self.errors = []
+
+    def submit(self, outpath, rgba, dpi):
+        """
+        Queues ``rgba``, an array of shape ``(height, width, 4)`` which
+        must not be modified afterwards, to be written to ``outpath``.
+        Blocks while :data:`PNG_PENDING` images are already waiting.
+        """
+        self._slots.acquire()
+        with self._idle:
+            self._npending += 1
+        self._pool.apply_async(self._write, (outpath, rgba, dpi))
+
+    def _write(self, outpath, rgba, dpi):
+        try:
+            from PIL import Image
+            image = Image.frombuffer('RGBA', (rgba.shape[1], rgba.shape[0]),
+                                     rgba, 'raw', 'RGBA', 0, 1)
+            image.save(outpath, format='png', dpi=(dpi, dpi),
+                       pnginfo=_pnginfo(), compress_level=self.compress_level)
+        except Exception:
+            with self._idle:
+                self.errors.append((outpath, traceback.format_exc()))
+        finally:
+            self._slots.release()
+            with self._idle:
+                self._npending -= 1
+                if not self._npending:
+                    self._idle.notify_all()
+
+    def flush(self):
+        """
+        Waits for every queued image to be written, and returns a list
+        of ``(outpath, error)`` for those which could not be.
+        """
+        with self._idle:
+            while self._npending:
+                self._idle.wait()
+            errors, self.errors = self.errors, []
+        return errors
+
+    def close(self):
+        errors = self.flush()
+        self._pool.close()
+        self._pool.join()
+        return errors
+
+
+def save_png(figure, outpath, dpi=None):
+    """
+    Saves ``figure`` as a PNG file. With :data:`PNG_WRITERS`, the figure
+    is drawn here and the file is encoded and written in the background.
+    Errors in writing are then reported by :func:`flush`, which
+    :func:`pipeline.execute` calls at the end of each job run in a
+    worker process.
+    """
+    if dpi is None:
+        dpi = figure.dpi
+    if not PNG_WRITERS:
+        figure.savefig(outpath, dpi=dpi,
+                       pil_kwargs={'compress_level': PNG_COMPRESSION})
+        return
+    # As savefig does, draw at the output resolution and then restore
+    # the resolution of the figure
+    original = figure.dpi
+    figure.dpi = dpi
+    try:
+        figure.canvas.draw()
+        # The canvas is reused for the next figure
+        rgba = numpy.array(figure.canvas.buffer_rgba())
+    finally:
+        figure.dpi = original
+    _get_writer().submit(outpath, rgba, dpi)
+
+
+def _get_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = PNGWriter(PNG_WRITERS, PNG_PENDING, PNG_COMPRESSION)
+            # Runs at exit, including that of the worker processes of a
+            # pool, so that no image is left unwritten
+            util.Finalize(None, _report, exitpriority=10)
+        return _writer
+
+
+def flush():
+    """
+    Waits for images being written in the background by this process,
+    and returns a list of ``(outpath, error)`` for those which failed.
+    """
+    with _lock:
+        writer = _writer
+    if writer is None:
+        return []
+    return writer.flush()
+
+
+def _report():
+    for outpath, error in flush():
+        print("Failed to write {0}".format(outpath))
+        print(error)
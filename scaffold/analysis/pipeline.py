@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Execution of jobs, such as rendering plots or loading datasets,
+serially or across a pool of workers.
+
+Workers are processes by default. Since :mod:`render` draws on
+per-thread figures rather than through :mod:`matplotlib.pyplot`, a pool
+of threads may be used instead. Large arrays in the arguments of jobs
+sent to worker processes are passed through shared files rather than
+copied into each job, see :mod:`shm`.
+"""
+
+import cProfile
+import traceback
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import shm
+import output
+import instrument
+
+
+class Job(object):
+    """
+    A single unit of work, such as one plot of one waveform.
+    The function must be importable by name, and the arguments must be
+    picklable, so that the job can be sent to a worker process.
+
+    If ``profile`` is set to a path, the job is run under
+    :mod:`cProfile`, and the profile is written to that path.
+
+    Arguments may be :class:`shm.SharedArray` references, which are
+    attached when the job is run.
+    """
+    def __init__(self, name, func, **kwargs):
+        self.name = name
+        self.func = func
+        self.kwargs = kwargs
+        self.profile = None
+
+    def __call__(self):
+        return self.func(**shm.attach_kwargs(self.kwargs))
+
+    def shared(self, arena):
+        """
+        Returns ``(job, keys)``, a copy of this job in which the arrays
+        are placed in ``arena``, and the keys to release from the arena
+        once the copy has been run.
+        """
+        kwargs, keys = arena.share_kwargs(self.kwargs)
+        job = Job(self.name, self.func, **kwargs)
+        job.profile = self.profile
+        return job, keys
+
+    def __repr__(self):
+        return '<Job {0}>'.format(self.name)
+
+
+class JobResult(object):
+    def __init__(self, name, result=None, error=None, stats=None):
+        self.name = name
+        self.result = result
+        self.error = error
+        # instrument.Stats of the job, if instrumentation is enabled
+        self.stats = stats
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _run(job):
+    if job.profile is None:
+        return job()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(job)
+    finally:
+        profiler.dump_stats(job.profile)
+
+
+def _write_errors():
+    # Waits for the images of the job being written in the background,
+    # see output.save_png, and describes those which failed
+    return ''.join("Failed to write {0}\n{1}".format(outpath, error)
+                   for outpath, error in output.flush())
+
+
+def execute(job, flush=False):
+    # Runs in the worker. Failures are returned rather than raised, so
+    # that one bad job does not take the rest of the batch down with it.
+    # Worker processes flush the images of each job before returning
+    # its result, so that a job is only reported done once its files
+    # are written, and nothing is left queued in a worker which may be
+    # terminated.
+    with instrument.scope() as stats:
+        try:
+            rval = JobResult(job.name, result=_run(job))
+            errors = _write_errors() if flush else None
+            if errors:
+                rval = JobResult(job.name, error=errors)
+        except Exception:
+            rval = JobResult(job.name, error=traceback.format_exc())
+    if instrument.ENABLED:
+        rval.stats = stats
+    return rval
+
+
+def _collect(job, async_result):
+    try:
+        return async_result.get()
+    except Exception:
+        # Jobs which could not be sent to or returned from the worker
+        return JobResult(job.name, error=traceback.format_exc())
+
+
+def _notify(done, job):
+    # A callback for the result or the error of job, which posts it to
+    # the queue done
+    return lambda _: done.put(job)
+
+
+def _next_done(pending, done):
+    # Removes the first of the pending jobs to complete, which its
+    # callbacks have posted to the queue done, and returns it with its
+    # result
+    job = done.get()
+    for idx, (pending_job, async_result) in enumerate(pending):
+        if pending_job is job:
+            del pending[idx]
+            return job, _collect(job, async_result)
+
+
+def run_jobs(jobs, workers=1, max_pending=None, threads=False, ordered=True,
+             share=True):
+    """
+    Runs ``jobs`` and yields a :class:`JobResult` for each, by default
+    in the order in which the jobs were provided.
+
+    :param jobs: An iterable of :class:`Job` instances. It is consumed
+                 lazily, so it may be a generator which acquires and
+                 processes data as jobs are needed.
+    :param workers: The number of worker processes. ``1`` runs the jobs
+                    in this process, and ``None`` uses one worker per CPU.
+    :param max_pending: The maximum number of jobs submitted to the pool
+                        but not yet reported. Bounds the memory held by
+                        queued job arguments. Defaults to twice the
+                        number of workers.
+    :param threads: Use a pool of threads rather than processes.
+    :param ordered: If ``False``, results are yielded as the jobs
+                    complete, so that a slow job does not hold up the
+                    results of those submitted after it.
+    :param share: Pass arrays of at least :data:`shm.MIN_BYTES` to
+                  worker processes through a :class:`shm.Arena`, in
+                  which each is placed once, rather than pickling them
+                  into every job. The files of a job are released as
+                  soon as its result is reported, and the arena is
+                  removed when all of the jobs are done or have failed.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if workers <= 1:
+        for job in jobs:
+            yield execute(job)
+        return
+
+    if max_pending is None:
+        max_pending = 2 * workers
+    if threads:
+        pool = ThreadPool(workers)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=instrument.enable,
+                                    initargs=(instrument.ENABLED,))
+    arena = shm.Arena() if share and not threads else None
+    # Files of the arena referred to by each pending job, by its id
+    shared = {}
+    pending = deque()
+    # Jobs which have completed, in the order they did, when unordered
+    done = queue.Queue()
+
+    def next_result():
+        if ordered:
+            job, async_result = pending.popleft()
+            rval = _collect(job, async_result)
+        else:
+            job, rval = _next_done(pending, done)
+        if arena is not None:
+            arena.release(shared.pop(id(job)))
+        return rval
+
+    closed = False
+    try:
+        for job in jobs:
+            if arena is not None:
+                job, keys = job.shared(arena)
+                shared[id(job)] = keys
+            callback = None if ordered else _notify(done, job)
+            pending.append((job, pool.apply_async(
+                execute, (job, not threads),
+                callback=callback, error_callback=callback
+            )))
+            while len(pending) >= max_pending:
+                yield next_result()
+        while pending:
+            yield next_result()
+        # Workers are left to exit by themselves, so that they can
+        # finish anything they do at exit.
+        pool.close()
+        closed = True
+    finally:
+        if not closed:
+            pool.terminate()
+        pool.join()
+        if arena is not None:
+            arena.close()
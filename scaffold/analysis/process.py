@@ -22,23 +22,616 @@
 Docstring for process
 """
 
+import csv
+import json
+import numpy
 
-def get_fd(array):
-    fdarray = []
-    lpoint = 0
-    for point in array:
-        fdarray.append(point - lpoint)
-        lpoint = point
-    return fdarray
-
-
-def get_sd(array):
-    sdarray = []
-    lpoint = 0
-    lfd = 0
-    for point in array:
-        fd = point - lpoint
-        sdarray.append(fd - lfd)
-        lpoint = point
-        lfd = fd
-    return sdarray
+# Bump whenever a change here alters the processed data, so that plots
+# rendered incrementally from older results are drawn again.
+STAGE_VERSION = 2
+
+
+def _diff_out(array, out):
+    if out is None:
+        dtype = array.dtype
+        if dtype.kind in 'ub':
+            # Differences of unsigned codes can be negative
+            dtype = numpy.int64
+        out = numpy.empty(array.shape, dtype=dtype)
+    return out
+
+
+def get_fd(array, lpoint=0, out=None):
+    """
+    Returns the first difference of ``array``, preceded by an implicit
+    initial point ``lpoint``, so that the output is the same length as
+    the input.
+
+    :param array: The series to differentiate
+    :param lpoint: The point preceding the series, default ``0``
+    :param out: An optional array to write the result into. May be
+                ``array`` itself, in which case no memory is allocated.
+    :return: The first difference
+    """
+    array = numpy.asarray(array)
+    out = _diff_out(array, out)
+    if not len(array):
+        return out
+    first = array[0] - lpoint
+    numpy.subtract(array[1:], array[:-1], out=out[1:], dtype=out.dtype)
+    out[0] = first
+    return out
+
+
+def get_sd(array, lpoint=0, lfd=0, out=None):
+    """
+    Returns the second difference of ``array``, with the same implicit
+    initial point as :func:`get_fd` and an implicit initial first
+    difference ``lfd``.
+    """
+    out = get_fd(array, lpoint, out)
+    if not len(out):
+        return out
+    first = out[0] - lfd
+    numpy.subtract(out[1:], out[:-1], out=out[1:])
+    out[0] = first
+    return out
+
+
+def get_nd(array, n, out=None):
+    """
+    Returns the ``n``-th difference of ``array``, with implicit zero
+    initial points at each order. ``get_nd(a, 1)`` and ``get_nd(a, 2)``
+    are equivalent to ``get_fd(a)`` and ``get_sd(a)``.
+    """
+    if n < 1:
+        raise ValueError("Order of difference must be at least 1, got {0}"
+                         "".format(n))
+    out = get_fd(array, 0, out)
+    for _ in range(n - 1):
+        get_fd(out, 0, out)
+    return out
+
+
+def detrend(array, type='linear'):
+    """
+    Removes the least-squares linear fit (or only the mean, if ``type``
+    is ``constant``) from ``array``. Equivalent to
+    :func:`scipy.signal.detrend` for one dimensional data.
+    """
+    array = numpy.asarray(array, dtype=numpy.float64)
+    if type == 'constant':
+        return array - array.mean()
+    if type != 'linear':
+        raise ValueError("Unknown detrend type {0}".format(type))
+    n = len(array)
+    if n < 2:
+        return array - array.mean()
+    t = numpy.arange(n, dtype=numpy.float64)
+    t -= (n - 1) / 2.0
+    slope = numpy.dot(t, array) / numpy.dot(t, t)
+    out = array - array.mean()
+    t *= slope
+    out -= t
+    return out
+
+
+def _rolling_sums(array, window, power):
+    if window < 1 or window > len(array):
+        raise ValueError("Window of {0} is not valid for a series of length "
+                         "{1}".format(window, len(array)))
+    csum = numpy.empty(len(array) + 1, dtype=numpy.float64)
+    csum[0] = 0
+    if power == 1:
+        numpy.cumsum(array, out=csum[1:])
+    else:
+        numpy.cumsum(numpy.square(array, dtype=numpy.float64), out=csum[1:])
+    return csum[window:] - csum[:-window]
+
+
+def rolling_mean(array, window):
+    """
+    Returns the mean over each complete window of ``window`` samples.
+    The output has ``len(array) - window + 1`` points.
+    """
+    array = numpy.asarray(array)
+    return _rolling_sums(array, window, 1) / window
+
+
+def rolling_std(array, window):
+    """
+    Returns the population standard deviation over each complete window
+    of ``window`` samples, as for :func:`rolling_mean`.
+    """
+    # Removing the mean first keeps the running sums small, which
+    # avoids catastrophic cancellation for signals with a large offset.
+    array = numpy.asarray(array, dtype=numpy.float64)
+    array = array - array.mean()
+    mean = _rolling_sums(array, window, 1) / window
+    var = _rolling_sums(array, window, 2) / window
+    var -= numpy.square(mean)
+    numpy.clip(var, 0, None, out=var)
+    return numpy.sqrt(var, out=var)
+
+
+def describe(array, percentiles=(1, 5, 50, 95, 99)):
+    """
+    Returns summary statistics of ``array`` as a dict with ``count``,
+    ``min``, ``max``, ``mean``, ``std`` and one ``pNN`` entry for each
+    of the requested ``percentiles``.
+    """
+    array = numpy.asarray(array)
+    rval = {'count': len(array)}
+    if not len(array):
+        return rval
+    rval['min'] = array.min().item()
+    rval['max'] = array.max().item()
+    rval['mean'] = float(array.mean())
+    rval['std'] = float(array.std())
+    if percentiles:
+        values = numpy.percentile(array, percentiles)
+        for p, v in zip(percentiles, values):
+            rval['p{0:g}'.format(p)] = float(v)
+    return rval
+
+
+def _plain(value):
+    # Arrays and numpy scalars, as the lists and numbers json writes
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, dict):
+        return dict((k, _plain(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    return value
+
+
+def _flatten(value, prefix=''):
+    if isinstance(value, dict):
+        rval = {}
+        for k, v in value.items():
+            rval.update(_flatten(v, '{0}{1}.'.format(prefix, k)))
+        return rval
+    if isinstance(value, list):
+        value = ' '.join(str(v) for v in value)
+    return {prefix[:-1]: value}
+
+
+def write_statistics(path, statistics):
+    """
+    Writes a dict of ``{name: statistics}``, such as from
+    :meth:`acquire.Waveform.statistics`, to ``path``. If it ends in
+    ``.csv``, each is written as a row with a column for each of the
+    nested keys, joined with ``.``, and lists of values are joined with
+    spaces. Otherwise, it is written as JSON.
+    """
+    path = str(path)
+    statistics = _plain(statistics)
+    if not path.endswith('.csv'):
+        with open(path, 'w') as f:
+            json.dump(statistics, f, indent=2, sort_keys=True)
+        return
+    rows = dict((name, _flatten(v)) for name, v in statistics.items())
+    keys = sorted(set(k for row in rows.values() for k in row))
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, ['name'] + keys)
+        writer.writeheader()
+        for name in sorted(rows):
+            row = dict(rows[name], name=name)
+            writer.writerow(row)
+
+
+def code_histogram(codes, lo=None, hi=None):
+    """
+    Counts the occurrences of each integer code in ``codes``.
+
+    :param codes: Integer samples, such as DAC or ADC codes
+    :param lo: The lowest code to count, default the lowest present
+    :param hi: The highest code to count, default the highest present
+    :return: A tuple of the codes and their counts
+    """
+    codes = numpy.asarray(codes)
+    if lo is None:
+        lo = int(codes.min())
+    if hi is None:
+        hi = int(codes.max())
+    inrange = codes[(codes >= lo) & (codes <= hi)]
+    counts = numpy.bincount(inrange - lo, minlength=hi - lo + 1)
+    return numpy.arange(lo, hi + 1), counts
+
+
+def dnl_inl(codes, lo=None, hi=None, exclude_ends=True):
+    """
+    Computes the differential and integral nonlinearity of a converter
+    from a code density histogram, in LSB. This assumes a stimulus which
+    is uniformly distributed over the code range, such as a slow ramp.
+
+    The end codes also collect any over and under range samples, so
+    they are excluded from the reference density unless
+    ``exclude_ends`` is ``False``.
+
+    :return: A tuple of codes, DNL and INL arrays
+    """
+    codes, counts = code_histogram(codes, lo, hi)
+    return _nonlinearity(codes, counts, exclude_ends)
+
+
+def _nonlinearity(codes, counts, exclude_ends):
+    if exclude_ends and len(codes) > 2:
+        codes = codes[1:-1]
+        counts = counts[1:-1]
+    mean = counts.mean()
+    if mean == 0:
+        raise ValueError("No samples within the code range")
+    dnl = counts / mean - 1
+    inl = numpy.cumsum(dnl)
+    return codes, dnl, inl
+
+
+class Differentiator(object):
+    """
+    Computes first and second differences of a series presented as a
+    sequence of blocks. The last point and the last first difference
+    are carried across block boundaries, so the concatenated output is
+    identical to that of :func:`get_fd` and :func:`get_sd` applied to
+    the whole series.
+    """
+    def __init__(self, lpoint=0, lfd=0):
+        self.lpoint = lpoint
+        self.lfd = lfd
+
+    def push(self, block):
+        fd = get_fd(block, self.lpoint)
+        sd = numpy.diff(fd, prepend=self.lfd)
+        if len(block):
+            self.lpoint = block[-1]
+            self.lfd = fd[-1]
+        return fd, sd
+
+
+class HistogramAccumulator(object):
+    """
+    Accumulates a fixed-range histogram of a series presented as a
+    sequence of blocks. Values outside of ``x_range`` are counted in
+    ``underflow`` and ``overflow``.
+    """
+    def __init__(self, bins, x_range):
+        self.edges = numpy.linspace(x_range[0], x_range[1], bins + 1)
+        self.counts = numpy.zeros(bins, dtype=numpy.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    def update(self, block):
+        block = numpy.asarray(block)
+        self.counts += numpy.histogram(block, self.edges)[0]
+        self.underflow += int(numpy.count_nonzero(block < self.edges[0]))
+        self.overflow += int(numpy.count_nonzero(block > self.edges[-1]))
+
+    def merge(self, other):
+        """
+        Adds the counts of another accumulator with the same bins, such
+        as one of another file or worker.
+        """
+        if not numpy.array_equal(self.edges, other.edges):
+            raise ValueError("Histograms have different bins")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def histogram(self):
+        return self.edges, self.counts
+
+
+class CodeHistogram(object):
+    """
+    Accumulates the number of occurrences of each integer code, such as
+    DAC or ADC codes, over a series presented as a sequence of blocks.
+    The range of codes grows as needed, so that no range need be known
+    in advance, and histograms of different files or workers can be
+    merged.
+    """
+    def __init__(self):
+        self.lo = 0
+        self.counts = numpy.zeros(0, dtype=numpy.int64)
+
+    def _extend(self, lo, hi):
+        if not len(self.counts):
+            self.lo = lo
+            self.counts = numpy.zeros(hi - lo + 1, dtype=numpy.int64)
+            return
+        new_lo = min(lo, self.lo)
+        new_hi = max(hi, self.hi)
+        if new_lo == self.lo and new_hi == self.hi:
+            return
+        counts = numpy.zeros(new_hi - new_lo + 1, dtype=numpy.int64)
+        counts[self.lo - new_lo:self.lo - new_lo + len(self.counts)] = \
+            self.counts
+        self.lo, self.counts = new_lo, counts
+
+    @property
+    def hi(self):
+        return self.lo + len(self.counts) - 1
+
+    def update(self, block):
+        block = numpy.asarray(block)
+        if not len(block):
+            return
+        lo, hi = int(block.min()), int(block.max())
+        self._extend(lo, hi)
+        self.counts[lo - self.lo:hi - self.lo + 1] += \
+            numpy.bincount((block - lo).astype(numpy.intp))
+
+    def merge(self, other):
+        if len(other.counts):
+            self._extend(other.lo, other.hi)
+            start = other.lo - self.lo
+            self.counts[start:start + len(other.counts)] += other.counts
+        return self
+
+    @property
+    def codes(self):
+        return numpy.arange(self.lo, self.lo + len(self.counts))
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def histogram(self, width=1):
+        """
+        Returns bin edges centred on each code, and the counts.
+
+        :param width: The number of consecutive codes in each bin
+        """
+        if width == 1:
+            return numpy.arange(self.lo, self.hi + 2) - 0.5, self.counts
+        starts = numpy.arange(0, len(self.counts), width)
+        edges = numpy.append(starts, len(self.counts)) + self.lo - 0.5
+        if not len(self.counts):
+            return edges, self.counts
+        return edges, numpy.add.reduceat(self.counts, starts)
+
+    def dnl_inl(self, exclude_ends=True):
+        """
+        .. seealso:: :func:`dnl_inl`
+        """
+        return _nonlinearity(self.codes, self.counts, exclude_ends)
+
+
+class FloatSketch(object):
+    """
+    Accumulates an approximate histogram of real values over a series
+    presented as a sequence of blocks, in at most ``nbins`` bins.
+
+    Bins are ``2 ** exponent`` wide and aligned to multiples of their
+    width. When values arrive which don't fit in ``nbins`` bins, the
+    width is doubled by merging pairs of bins, so that the sketch always
+    covers the values seen with the finest width that fits. Sketches of
+    different files or workers can be merged, and the result does not
+    depend on the order of updates and merges. Values which are not
+    finite are only counted, in ``nonfinite``.
+    """
+    def __init__(self, nbins=1024):
+        self.nbins = nbins
+        self.exponent = None
+        self.start = 0
+        self.counts = numpy.zeros(0, dtype=numpy.int64)
+        self.nonfinite = 0
+
+    def _index(self, values):
+        return numpy.floor(numpy.ldexp(values, -self.exponent))
+
+    def _coarsen(self, steps=1):
+        # Bin i of width w lies in bin i >> k of width w * 2 ** k
+        start = self.start >> steps
+        idx = numpy.arange(self.start, self.start + len(self.counts)) >> \
+            min(steps, 63)
+        counts = numpy.zeros(idx[-1] - start + 1 if len(idx) else 0,
+                             dtype=numpy.int64)
+        numpy.add.at(counts, idx - start, self.counts)
+        self.exponent += steps
+        self.start, self.counts = start, counts
+
+    def _min_exponent(self, lo, hi):
+        # The finest width which values in [lo, hi] could need : no finer
+        # than the spacing of floats about them, and no finer than their
+        # span over nbins. Neither depends on where the span lies, and
+        # neither exceeds what the values seen overall need, so that the
+        # width settled on does not depend on the order of the values.
+        exponent = int(numpy.frexp(
+            numpy.spacing(max(abs(lo), abs(hi))))[1]) - 1
+        if hi > lo:
+            exponent = max(exponent,
+                           int(numpy.frexp((hi - lo) / self.nbins)[1]))
+        return exponent
+
+    def _cover(self, lo, hi):
+        # Coarsens until both the current bins and [lo, hi] fit
+        exponent = self._min_exponent(lo, hi)
+        if self.exponent is None:
+            self.exponent = exponent
+            self.start = int(self._index(lo))
+        elif exponent > self.exponent:
+            self._coarsen(exponent - self.exponent)
+        while True:
+            first = int(self._index(lo))
+            last = int(self._index(hi))
+            if len(self.counts):
+                first = min(first, self.start)
+                last = max(last, self.start + len(self.counts) - 1)
+            if last - first < self.nbins:
+                break
+            self._coarsen()
+        counts = numpy.zeros(last - first + 1, dtype=numpy.int64)
+        offset = self.start - first
+        counts[offset:offset + len(self.counts)] = self.counts
+        self.start, self.counts = first, counts
+
+    def update(self, block):
+        block = numpy.asarray(block, dtype=numpy.float64)
+        finite = numpy.isfinite(block)
+        if not finite.all():
+            self.nonfinite += int(len(block) - numpy.count_nonzero(finite))
+            block = block[finite]
+        if not len(block):
+            return
+        self._cover(block.min(), block.max())
+        idx = self._index(block).astype(numpy.int64) - self.start
+        self.counts += numpy.bincount(idx, minlength=len(self.counts))
+
+    def merge(self, other):
+        if other.nbins != self.nbins:
+            raise ValueError("Sketches have different numbers of bins")
+        self.nonfinite += other.nonfinite
+        if other.exponent is None:
+            return self
+        other = other.copy()
+        if self.exponent is None:
+            self.exponent, self.start = other.exponent, other.start
+            self.counts = other.counts
+            return self
+        if other.exponent < self.exponent:
+            other._coarsen(self.exponent - other.exponent)
+        elif self.exponent < other.exponent:
+            self._coarsen(other.exponent - self.exponent)
+        width = 2.0 ** self.exponent
+        self._cover(other.start * width,
+                    (other.start + len(other.counts) - 1) * width)
+        if other.exponent < self.exponent:
+            other._coarsen(self.exponent - other.exponent)
+        offset = other.start - self.start
+        self.counts[offset:offset + len(other.counts)] += other.counts
+        return self
+
+    def copy(self):
+        rval = FloatSketch(self.nbins)
+        rval.exponent, rval.start = self.exponent, self.start
+        rval.counts = self.counts.copy()
+        rval.nonfinite = self.nonfinite
+        return rval
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def histogram(self):
+        """
+        Returns the bin edges and counts.
+        """
+        if self.exponent is None:
+            return numpy.zeros(1), self.counts
+        edges = numpy.arange(self.start, self.start + len(self.counts) + 1)
+        return numpy.ldexp(edges.astype(numpy.float64), self.exponent), \
+            self.counts
+
+
+def accumulator(dtype, nbins=1024):
+    """
+    Returns an empty histogram accumulator suited to samples of
+    ``dtype`` : a :class:`CodeHistogram` for integer codes, and a
+    :class:`FloatSketch` otherwise.
+    """
+    if numpy.dtype(dtype).kind in 'iub':
+        return CodeHistogram()
+    return FloatSketch(nbins)
+
+
+def binned(hist, nbins=1024):
+    """
+    Returns the bin edges and counts of an accumulator from
+    :func:`accumulator`, in at most ``nbins`` bins. Integer codes are
+    grouped a whole number of codes to a bin.
+    """
+    if isinstance(hist, CodeHistogram):
+        return hist.histogram(max(-(-len(hist.counts) // nbins), 1))
+    return hist.histogram()
+
+
+def histogram(array, nbins=1024):
+    """
+    Returns the bin edges and counts of the values of ``array``.
+
+    .. seealso:: :func:`accumulator` and :func:`binned`
+    """
+    array = numpy.asarray(array)
+    hist = accumulator(array.dtype, nbins)
+    hist.update(array)
+    return binned(hist, nbins)
+
+
+def bit_planes(codes, nbits=16):
+    """
+    Splits integer codes into their bits.
+
+    :param codes: An array of unsigned integer codes
+    :param nbits: The number of bits to extract, from the LSB
+    :return: An array of shape ``(nbits, len(codes))`` of type uint8,
+             in which row ``b`` holds bit ``b`` of every code
+    """
+    codes = numpy.asarray(codes)
+    planes = numpy.empty((nbits, len(codes)), dtype=numpy.uint8)
+    for b in range(nbits):
+        numpy.bitwise_and(codes >> b, 1, out=planes[b], casting='unsafe')
+    return planes
+
+
+def adjacent_xor(codes):
+    """
+    Returns codes in which bit ``b`` is the XOR of bits ``b`` and
+    ``b + 1`` of the input codes.
+    """
+    codes = numpy.asarray(codes)
+    return codes ^ (codes >> 1)
+
+
+def bit_transition_stats(codes, nbits=16):
+    """
+    Computes per-bit transition statistics of a series of codes.
+
+    :return: A dict of arrays of length ``nbits``, indexed by bit :
+             ``toggles``, ``rises`` and ``falls`` count the transitions
+             of each bit, ``glitches`` counts transitions immediately
+             reversed at the next sample, ``toggle_rate`` is the
+             fraction of sample intervals with a transition and
+             ``duty`` is the fraction of samples in which the bit is set.
+    """
+    codes = numpy.asarray(codes)
+    prev = codes[:-1]
+    cur = codes[1:]
+    changed = prev ^ cur
+    rising = ~prev & cur
+    reverted = changed[:-1] & changed[1:]
+    rval = dict((k, numpy.zeros(nbits, dtype=numpy.int64))
+                for k in ('toggles', 'rises', 'falls', 'glitches'))
+    duty = numpy.zeros(nbits, dtype=numpy.float64)
+    for b in range(nbits):
+        rval['toggles'][b] = numpy.count_nonzero((changed >> b) & 1)
+        rval['rises'][b] = numpy.count_nonzero((rising >> b) & 1)
+        rval['glitches'][b] = numpy.count_nonzero((reverted >> b) & 1)
+        if len(codes):
+            duty[b] = numpy.count_nonzero((codes >> b) & 1) / float(len(codes))
+    rval['falls'] = rval['toggles'] - rval['rises']
+    rval['toggle_rate'] = rval['toggles'] / float(max(len(changed), 1))
+    rval['duty'] = duty
+    return rval
+
+
+def find_glitches(codes, mask=None):
+    """
+    Finds single sample glitches : samples in which one or more bits
+    differ from the same bits of both neighbouring samples.
+
+    :param codes: An array of unsigned integer codes
+    :param mask: Optionally, only consider the bits set in ``mask``
+    :return: A tuple of the indices of the glitched samples, and for
+             each, a mask of the bits which glitched
+    """
+    codes = numpy.asarray(codes)
+    if len(codes) < 3:
+        return (numpy.zeros(0, dtype=numpy.intp),
+                numpy.zeros(0, dtype=codes.dtype))
+    bits = (codes[1:-1] ^ codes[:-2]) & (codes[1:-1] ^ codes[2:])
+    if mask is not None:
+        bits &= mask
+    idx = numpy.flatnonzero(bits)
+    return idx + 1, bits[idx]
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Multi-resolution summaries of long series, for rendering windows of
+them in time proportional to the output resolution.
+
+Level ``k`` of a :class:`Pyramid` holds the minimum, maximum and mean
+of consecutive blocks of ``leaf * fanout ** k`` samples. A window of
+the series is summarized at the coarsest level which still has at least
+one block per output column, so that only a few blocks per column and
+the samples of the partial blocks at either end are read.
+"""
+
+import os
+import numpy
+
+import timebase
+
+#: Samples per block at the finest level
+LEAF = 16
+
+#: Blocks of each level per block of the next
+FANOUT = 4
+
+
+def _level_sizes(n, leaf, fanout):
+    sizes = []
+    block = leaf
+    while block < n:
+        sizes.append(-(-n // block))
+        block *= fanout
+    return sizes
+
+
+class Pyramid(object):
+    """
+    :param data: An array of shape ``(3, total)`` holding the minimum,
+                 maximum and mean of the blocks of every level, finest
+                 first
+    :param n: The length of the summarized series
+    """
+    def __init__(self, data, n, leaf=LEAF, fanout=FANOUT):
+        self.data = data
+        self.n = n
+        self.leaf = leaf
+        self.fanout = fanout
+        self.sizes = _level_sizes(n, leaf, fanout)
+        self.offsets = numpy.concatenate(([0], numpy.cumsum(self.sizes)))
+        if data.shape != (3, self.offsets[-1]):
+            raise ValueError("Pyramid data does not match its series")
+
+    @classmethod
+    def build(cls, y, leaf=LEAF, fanout=FANOUT):
+        """
+        Builds the pyramid of the series ``y``, in O(n) time.
+        """
+        y = numpy.asarray(y)
+        n = len(y)
+        levels = []
+        lo, hi, total, count = y, y, y, None
+        for _ in _level_sizes(n, leaf, fanout):
+            step = leaf if count is None else fanout
+            starts = numpy.arange(0, len(lo), step)
+            lo = numpy.minimum.reduceat(lo, starts)
+            hi = numpy.maximum.reduceat(hi, starts)
+            total = numpy.add.reduceat(total, starts, dtype=numpy.float64)
+            if count is None:
+                count = numpy.diff(numpy.append(starts, n))
+            else:
+                count = numpy.add.reduceat(count, starts)
+            levels.append(numpy.vstack((lo, hi, total / count)))
+        if levels:
+            data = numpy.concatenate(levels, axis=1)
+        else:
+            data = numpy.empty((3, 0))
+        return cls(data.astype(numpy.float64, copy=False), n, leaf, fanout)
+
+    def save(self, path):
+        numpy.save(path, self.data)
+
+    @classmethod
+    def load(cls, path, n, leaf=LEAF, fanout=FANOUT):
+        """
+        Loads a saved pyramid of a series of length ``n``, memory
+        mapped. Raises :class:`ValueError` if it does not match.
+        """
+        return cls(numpy.load(path, mmap_mode='r'), n, leaf, fanout)
+
+    def level(self, k):
+        """
+        Returns the ``(3, nblocks)`` summary of level ``k``.
+        """
+        return self.data[:, self.offsets[k]:self.offsets[k + 1]]
+
+    def block_size(self, k):
+        return self.leaf * self.fanout ** k
+
+    def window(self, y, i0, i1, ncols):
+        """
+        Summarizes the samples ``y[i0:i1]`` with at least ``ncols``
+        buckets, or returns them as they are if there are too few.
+
+        :param y: The series the pyramid was built from, for the samples
+                  of partial blocks at either end of the window
+        :return: ``(starts, lo, hi, mean)``, the index of the first
+                 sample of each bucket and the summary of its samples
+        """
+        i0, i1 = max(i0, 0), min(i1, self.n)
+        span = max(i1 - i0, 0)
+        k = -1
+        while k + 1 < len(self.sizes) and \
+                self.block_size(k + 1) * ncols <= span:
+            k += 1
+        if k < 0:
+            raw = numpy.asarray(y[i0:i1], dtype=numpy.float64)
+            return numpy.arange(i0, i1), raw, raw, raw
+        size = self.block_size(k)
+        b0, b1 = -(-i0 // size), i1 // size
+        summary = self.level(k)[:, b0:b1]
+        starts = [numpy.arange(b0, b1) * size]
+        lo, hi, mean = [summary[0]], [summary[1]], [summary[2]]
+        for p0, p1, where in ((i0, b0 * size, 0), (b1 * size, i1, None)):
+            if p1 <= p0:
+                continue
+            part = numpy.asarray(y[p0:p1], dtype=numpy.float64)
+            values = (numpy.array([p0]), part.min(keepdims=True),
+                      part.max(keepdims=True), part.mean(keepdims=True))
+            for parts, value in zip((starts, lo, hi, mean), values):
+                if where == 0:
+                    parts.insert(0, value)
+                else:
+                    parts.append(value)
+        return tuple(numpy.concatenate(x) for x in (starts, lo, hi, mean))
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+def envelope(x, starts, lo, hi):
+    """
+    Returns the x and y points of a line drawing the envelope of the
+    buckets of :meth:`Pyramid.window`, with a vertical stroke from the
+    minimum to the maximum of each bucket.
+
+    :param x: The x-axis of the series, an array or time base
+    """
+    xs = timebase.take(x, starts)
+    if lo is hi:
+        return xs, lo
+    return numpy.repeat(xs, 2), numpy.column_stack((lo, hi)).ravel()
+
+
+def cached(path, y, leaf=LEAF, fanout=FANOUT):
+    """
+    Returns the pyramid of ``y`` saved at ``path``, building and saving
+    it first if it does not exist or does not match ``y``.
+    """
+    if os.path.exists(path):
+        try:
+            return Pyramid.load(path, len(y), leaf, fanout)
+        except (ValueError, IOError):
+            pass
+    pyramid = Pyramid.build(y, leaf, fanout)
+    tmp = path + '.tmp.npy'
+    pyramid.save(tmp)
+    os.rename(tmp, path)
+    return pyramid
@@ -17,55 +17,280 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import print_function
-from six.moves import xrange
 
-import os
 import numpy
+import threading
 
 import matplotlib
 matplotlib.use('Agg')
 matplotlib.rcParams['agg.path.chunksize'] = 10000
-from matplotlib import pyplot
+from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-FNULL = open(os.devnull, 'w')
+import output
+import instrument
 
+#: Resolution at which graphs are saved, in dots per inch.
+GRAPH_DPI = 300
 
-def finish_graph(outpath, xscale='linear', yscale='linear',
+#: Size of graphs, in inches.
+GRAPH_SIZE = (8, 6)
+
+#: Whether graphs of long series are decimated before they are drawn.
+#: May be overridden per call with the ``decimate`` argument.
+DECIMATE = True
+
+#: Series are only decimated if they have more than this many points
+#: per horizontal pixel of the output.
+DECIMATE_THRESHOLD = 4
+
+_local = threading.local()
+
+
+class Canvas(object):
+    """
+    A figure with a single set of axes, drawn with the Agg backend
+    without involving :mod:`matplotlib.pyplot`. A canvas is reused for
+    every plot of its kind made by a thread, so that only the plotted
+    data changes between plots. The layout of each plot is computed
+    by ``tight_layout`` from the initial subplot parameters, so that a
+    plot does not depend on the plots drawn before it.
+    """
+    def __init__(self, figsize=None):
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot(111)
+        self.lines = []
+        self.bars = None
+        # Other artists drawn for one plot only
+        self.artists = []
+        p = self.figure.subplotpars
+        self._initial = dict(left=p.left, right=p.right,
+                             bottom=p.bottom, top=p.top)
+
+    def get_lines(self, n):
+        while len(self.lines) < n:
+            line, = self.axes.plot([], [])
+            self.lines.append(line)
+        for line in self.lines[n:]:
+            line.set_visible(False)
+        for line in self.lines[:n]:
+            line.set_visible(True)
+        return self.lines[:n]
+
+    def clear(self):
+        for line in self.lines:
+            line.set_data([], [])
+        if self.bars is not None:
+            self.bars.remove()
+            self.bars = None
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+
+    def autoscale(self):
+        self.axes.set_autoscale_on(True)
+        self.axes.relim(visible_only=True)
+        self.axes.autoscale_view()
+
+    @instrument.timed('render.layout')
+    def layout(self):
+        # tight_layout refines the current layout, so it is started
+        # afresh for every plot. It measures the tick labels where they
+        # are drawn, so its result cannot be reused for other plots,
+        # even those with the same labels.
+        self.figure.subplots_adjust(**self._initial)
+        self.figure.tight_layout()
+
+    def save(self, outpath, dpi=None):
+        with instrument.stage('render.savefig'):
+            output.save_png(self.figure, outpath, dpi=dpi)
+        instrument.count('figures')
+        self.clear()
+        return outpath
+
+
+def get_canvas(kind):
+    """
+    Returns the :class:`Canvas` used by the current thread for plots
+    of the given ``kind``, creating it if needed.
+    """
+    canvases = getattr(_local, 'canvases', None)
+    if canvases is None:
+        canvases = _local.canvases = {}
+    if kind not in canvases:
+        if kind == 'graph':
+            canvas = Canvas(figsize=GRAPH_SIZE)
+            canvas.axes.grid(True, which='major', color='0.3',
+                             linestyle='-', linewidth=0.2)
+            canvas.axes.grid(True, which='minor', color='0.3')
+        elif kind == 'bitplanes':
+            canvas = Canvas(figsize=GRAPH_SIZE)
+            canvas.axes.grid(True, which='major', axis='x', color='0.3',
+                             linestyle='-', linewidth=0.2)
+        else:
+            canvas = Canvas()
+            canvas.axes.grid(True, which='major', linestyle='-')
+            canvas.axes.grid(True, which='minor')
+        canvas.axes.tick_params(axis='both', which='major', labelsize=16)
+        canvas.axes.tick_params(axis='both', which='minor', labelsize=8)
+        canvases[kind] = canvas
+    return canvases[kind]
+
+
+def graph_pixels():
+    """
+    Returns the width and height of saved graphs, in pixels.
+    """
+    return GRAPH_SIZE[0] * GRAPH_DPI, GRAPH_SIZE[1] * GRAPH_DPI
+
+
+def finish_graph(canvas, outpath, xscale='linear', yscale='linear',
                  xlabel='', ylabel='', ymax=None, ymin=None):
-    f = pyplot.gcf()
-    f.set_size_inches(8, 6)
-    pyplot.xscale(xscale)
-    pyplot.yscale(yscale)
-    pyplot.grid(True, which='major', color='0.3', linestyle='-', linewidth=0.2)
-    pyplot.grid(True, which='minor', color='0.3')
-    pyplot.xlabel(xlabel, fontsize=20)
-    pyplot.ylabel(ylabel, fontsize=20)
-    pyplot.tick_params(axis='both', which='major', labelsize=16)
-    pyplot.tick_params(axis='both', which='minor', labelsize=8)
-    if (ymax, ymin) is not (None, None):
-        pyplot.ylim((ymin, ymax))
-    pyplot.tight_layout()
-    pyplot.savefig(outpath, dpi=300)
-    pyplot.close()
-    return outpath
+    ax = canvas.axes
+    ax.set_xscale(xscale)
+    ax.set_yscale(yscale)
+    ax.set_xlabel(xlabel, fontsize=20)
+    ax.set_ylabel(ylabel, fontsize=20)
+    canvas.autoscale()
+    if (ymax, ymin) != (None, None):
+        ax.set_ylim((ymin, ymax))
+    canvas.layout()
+    return canvas.save(outpath, dpi=GRAPH_DPI)
+
+
+def _pixel_columns(plotdata_x, n, ncols):
+    # Assigns each point to a pixel column. Columns are spaced evenly in
+    # x if it is monotonic, or in the index otherwise. The last point
+    # of a monotonic x falls just past the last column.
+    if plotdata_x is not None:
+        x = numpy.asarray(plotdata_x, dtype=numpy.float64)
+        span = x[-1] - x[0]
+        if span > 0 and numpy.all(x[1:] >= x[:-1]):
+            return ((x - x[0]) * (ncols / span)).astype(numpy.int64)
+    return numpy.arange(n, dtype=numpy.int64) * ncols // n
+
+
+def _segments(plotdata_x, n, ncols):
+    # Returns the start index and length of the points in each
+    # non-empty pixel column.
+    cols = _pixel_columns(plotdata_x, n, ncols)
+    starts = numpy.flatnonzero(numpy.diff(cols)) + 1
+    starts = numpy.concatenate(([0], starts))
+    lengths = numpy.diff(numpy.append(starts, n))
+    return starts, lengths
+
 
+def _first_match(y, values, starts, lengths):
+    # Index of the first point in each segment equal to that segment's
+    # entry in values.
+    hits = numpy.flatnonzero(y == numpy.repeat(values, lengths))
+    segment = numpy.searchsorted(starts, hits, side='right') - 1
+    return hits[numpy.flatnonzero(numpy.diff(segment, prepend=-1))]
 
+
+def minmax_decimate(plotdata_x, plotdata_y, ncols):
+    """
+    Reduces a series to the points needed to draw it as a line at a
+    resolution of ``ncols`` horizontal pixels : the first, last, lowest
+    and highest point in each pixel column. The envelope of the line is
+    preserved exactly, and the points retained are a subset of the input.
+
+    :param plotdata_x: The x-axis data, or None
+    :param plotdata_y: The y-axis data
+    :param ncols: The number of pixel columns
+    :return: The indices of the points to be drawn
+    """
+    y = numpy.asarray(plotdata_y)
+    starts, lengths = _segments(plotdata_x, len(y), ncols)
+    keep = numpy.concatenate((
+        starts, starts + lengths - 1,
+        _first_match(y, numpy.minimum.reduceat(y, starts), starts, lengths),
+        _first_match(y, numpy.maximum.reduceat(y, starts), starts, lengths),
+    ))
+    return numpy.unique(keep)
+
+
+def pixel_decimate(plotdata_x, plotdata_y, ncols, nrows):
+    """
+    Reduces a series drawn with markers alone to one point per occupied
+    pixel of an ``ncols`` by ``nrows`` raster.
+
+    :return: The indices of the points to be drawn
+    """
+    y = numpy.asarray(plotdata_y, dtype=numpy.float64)
+    if plotdata_x is None:
+        x = numpy.arange(len(y), dtype=numpy.float64)
+    else:
+        x = numpy.asarray(plotdata_x, dtype=numpy.float64)
+    keys = []
+    for values, npix in ((x, ncols), (y, nrows)):
+        lo = numpy.nanmin(values)
+        span = numpy.nanmax(values) - lo
+        if not span > 0:
+            span = 1
+        pix = numpy.nan_to_num((values - lo) * ((npix - 1) / span))
+        keys.append(pix.astype(numpy.int64))
+    return numpy.unique(keys[0] * nrows + keys[1], return_index=True)[1]
+
+
+@instrument.timed('render.decimate_series')
+def decimate_series(canvas, plotdata_x, plotdata_y, linestyle='-',
+                    xscale='linear', yscale='linear', decimate=None):
+    """
+    Returns the series to be drawn on ``canvas`` in place of
+    ``plotdata_x`` and ``plotdata_y``, decimated to the resolution of
+    the output if it is long enough for that to matter.
+
+    Lines are reduced with :func:`minmax_decimate`, and markers without
+    lines with :func:`pixel_decimate`. Series on logarithmic axes are
+    not decimated.
+
+    :param decimate: ``True`` or ``False`` to enable or disable
+                     decimation, or ``None`` to use :data:`DECIMATE`.
+    """
+    if plotdata_x is not None:
+        # Time bases and other array-likes are materialized once, here
+        plotdata_x = numpy.asarray(plotdata_x)
+    if decimate is None:
+        decimate = DECIMATE
+    if not decimate or xscale != 'linear':
+        return plotdata_x, plotdata_y
+    ncols, nrows = (canvas.figure.get_size_inches() * GRAPH_DPI).astype(int)
+    if len(plotdata_y) <= DECIMATE_THRESHOLD * ncols:
+        return plotdata_x, plotdata_y
+    if linestyle in ('None', 'none', '', ' ', None):
+        if yscale != 'linear':
+            return plotdata_x, plotdata_y
+        idx = pixel_decimate(plotdata_x, plotdata_y, ncols, nrows)
+    else:
+        idx = minmax_decimate(plotdata_x, plotdata_y, ncols)
+    if plotdata_x is None:
+        plotdata_x = idx
+    else:
+        plotdata_x = numpy.asarray(plotdata_x)[idx]
+    return plotdata_x, numpy.asarray(plotdata_y)[idx]
+
+
+@instrument.timed('render.make_graph')
 def make_graph(outpath, plotdata_y, plotdata_x=None,
                color='black', lw=1, marker=None,
                xscale='linear', yscale='linear',
                xlabel='', ylabel='', ymax=None, ymin=None,
-               linestyle='-'):
+               linestyle='-', decimate=None):
     """
     Renders a graph of the data provided as a ``.png`` file, saved to the
-    path specified by ``outpath``. This function uses :mod:`matplotlib.pyplot`.
+    path specified by ``outpath``. The graph is drawn on the calling
+    thread's :class:`Canvas`, so this function is thread safe.
 
     :param outpath: The path to the output file
     :type outpath: str
     :param plotdata_y: The y-axis data to plot
-    :type plotdata_y: list
+    :type plotdata_y: list or :class:`numpy.ndarray`
     :param plotdata_x: The x-axis data to plot, or None if
                        a plotdata_y is a sequence
-    :type plotdata_x: :class:`list` or None
+    :type plotdata_x: :class:`list`, :class:`numpy.ndarray` or None
     :param color: The color of the curve, default ``black``.
                   See matplotlib docs.
     :type color: str
@@ -85,30 +310,157 @@ def make_graph(outpath, plotdata_y, plotdata_x=None,
     :type xlabel: str
     :param ylabel: The y-axis label, default ``''``
     :type ylabel: str
+    :param decimate: Whether to decimate long series to the output
+                     resolution, default :data:`DECIMATE`.
+                     See :func:`decimate_series`.
+    :type decimate: bool or None
     :return: The output path.
     """
-    pyplot.plot(plotdata_x, plotdata_y, color=color, lw=lw,
-                marker=marker, linestyle=linestyle)
-    return finish_graph(outpath, xscale, yscale, xlabel, ylabel, ymax, ymin)
+    canvas = get_canvas('graph')
+    line, = canvas.get_lines(1)
+    plotdata_x, plotdata_y = decimate_series(
+        canvas, plotdata_x, plotdata_y, linestyle, xscale, yscale, decimate)
+    _set_line(line, plotdata_x, plotdata_y, color=color, lw=lw,
+              marker=marker, linestyle=linestyle)
+    return finish_graph(canvas, outpath, xscale, yscale,
+                        xlabel, ylabel, ymax, ymin)
 
 
+def _set_line(line, plotdata_x, plotdata_y, color, lw, marker, linestyle):
+    if plotdata_x is None:
+        plotdata_x = numpy.arange(len(plotdata_y))
+    line.set_data(plotdata_x, plotdata_y)
+    instrument.count('points_drawn', len(plotdata_y))
+    line.set_color(color)
+    line.set_linewidth(lw)
+    if marker is None:
+        marker = matplotlib.rcParams['lines.marker']
+    line.set_marker(marker)
+    line.set_linestyle(linestyle)
+
+
+@instrument.timed('render.make_multigraph')
 def make_multigraph(outpath, plotdata_ys, plotdata_x=None,
                     colors=None, lws=None, markers=None,
                     xscale='linear', yscale='linear',
-                    xlabel='', ylabel='', ymax=None, ymin=None):
+                    xlabel='', ylabel='', ymax=None, ymin=None,
+                    decimate=None):
     if colors is None:
         colors = ['black'] * len(plotdata_ys)
     if lws is None:
         lws = [0.7] * len(plotdata_ys)
     if markers is None:
         markers = [None] * len(plotdata_ys)
-    for idx in range(len(plotdata_ys)):
-        pyplot.plot(plotdata_x, plotdata_ys[idx],
-                    color=colors[idx], lw=lws[idx], marker=markers[idx])
-    return finish_graph(outpath, xscale, yscale, xlabel, ylabel, ymax, ymin)
+    if plotdata_x is not None:
+        plotdata_x = numpy.asarray(plotdata_x)
+    canvas = get_canvas('graph')
+    lines = canvas.get_lines(len(plotdata_ys))
+    for idx, line in enumerate(lines):
+        x, y = decimate_series(canvas, plotdata_x, plotdata_ys[idx], '-',
+                               xscale, yscale, decimate)
+        _set_line(line, x, y, color=colors[idx],
+                  lw=lws[idx], marker=markers[idx], linestyle='-')
+    return finish_graph(canvas, outpath, xscale, yscale,
+                        xlabel, ylabel, ymax, ymin)
+
+
+def _bit_stack(canvas, planes, plotdata_x, color, lw, decimate):
+    # Draws plane b as a line between b - 0.4 and b + 0.4, all of them
+    # in a single collection.
+    if decimate is None:
+        decimate = DECIMATE
+    ncols = int(canvas.figure.get_size_inches()[0] * GRAPH_DPI)
+    n = planes.shape[1]
+    x = numpy.arange(n) if plotdata_x is None else plotdata_x
+    segments = []
+    for b, plane in enumerate(planes):
+        if decimate and n > DECIMATE_THRESHOLD * ncols:
+            idx = minmax_decimate(plotdata_x, plane, ncols)
+            px, py = x[idx], plane[idx]
+        else:
+            px, py = x, plane
+        instrument.count('points_drawn', len(px))
+        segments.append(numpy.column_stack((px, py * 0.8 + (b - 0.4))))
+    lines = LineCollection(segments, colors=color, linewidths=lw)
+    canvas.axes.add_collection(lines, autolim=False)
+    canvas.artists.append(lines)
+
+
+def _bit_raster(canvas, planes, plotdata_x):
+    # Draws the fraction of the samples in each pixel column in which
+    # each bit is set, as one image.
+    nplanes, n = planes.shape
+    if not n:
+        return
+    ncols = min(int(canvas.figure.get_size_inches()[0] * GRAPH_DPI), n)
+    cols = numpy.minimum(_pixel_columns(plotdata_x, n, ncols), ncols - 1)
+    starts = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(cols)) + 1))
+    lengths = numpy.diff(numpy.append(starts, n))
+    image = numpy.full((nplanes, ncols), numpy.nan)
+    image[:, cols[starts]] = numpy.add.reduceat(
+        planes, starts, axis=1, dtype=numpy.float64) / lengths
+    if plotdata_x is None:
+        x0, x1 = 0, n - 1
+    else:
+        x0, x1 = plotdata_x[0], plotdata_x[-1]
+    instrument.count('points_drawn', image.size)
+    canvas.artists.append(canvas.axes.imshow(
+        image, aspect='auto', interpolation='nearest', origin='lower',
+        cmap='Greys', vmin=0, vmax=1,
+        extent=(x0, x1, -0.5, nplanes - 0.5)
+    ))
+
+
+@instrument.timed('render.make_bitplanes')
+def make_bitplanes(outpath, planes, plotdata_x=None, labels=None,
+                   style='stack', color='black', lw=0.5, xlabel='',
+                   decimate=None):
+    """
+    Renders the bit planes of a dump, one above the other with the
+    lowest at the bottom, as a single ``.png`` file saved to the path
+    specified by ``outpath``. This replaces a graph per plane with one
+    figure, in which all the planes are drawn at once.
 
+    :param planes: An array of shape ``(nplanes, n)`` of zeros and ones,
+                   such as from :func:`process.bit_planes`
+    :param plotdata_x: The x-axis data, or None
+    :param labels: The label of each plane, by default its index
+    :param style: ``stack`` to draw each plane as a line, or ``raster``
+                  to draw an image of the fraction of samples in each
+                  pixel column in which the bit is set
+    :param decimate: For the ``stack`` style, whether to decimate long
+                     series to the output resolution, default
+                     :data:`DECIMATE`
+    :return: The output path.
+    """
+    planes = numpy.asarray(planes)
+    nplanes, n = planes.shape
+    if labels is None:
+        labels = [str(b) for b in range(nplanes)]
+    if plotdata_x is not None:
+        plotdata_x = numpy.asarray(plotdata_x)
+    canvas = get_canvas('bitplanes')
+    ax = canvas.axes
+    if style == 'stack':
+        _bit_stack(canvas, planes, plotdata_x, color, lw, decimate)
+    elif style == 'raster':
+        _bit_raster(canvas, planes, plotdata_x)
+    else:
+        raise ValueError("Unknown bit plane style {0}".format(style))
+    if plotdata_x is None:
+        ax.set_xlim(0, max(n - 1, 1))
+    elif n:
+        ax.set_xlim(plotdata_x[0], plotdata_x[-1])
+    ax.set_ylim(-0.5, nplanes - 0.5)
+    ax.set_yticks(range(nplanes))
+    ax.set_yticklabels(labels)
+    ax.set_xlabel(xlabel, fontsize=20)
+    canvas.layout()
+    return canvas.save(outpath, dpi=GRAPH_DPI)
 
-def get_optimum_bins(plotdata_y):
+
+@instrument.timed('render.get_optimum_bins')
+def get_optimum_bins(plotdata_y, n_min=2, n_max=50):
     """
     Histogram Binwidth Optimization Method
 
@@ -122,56 +474,62 @@ def get_optimum_bins(plotdata_y):
     This implementation based on the version in python
     written by Érbet Almeida Costa
 
+    The data is sorted once, and the bin counts for every candidate
+    number of bins are then obtained from a single
+    :func:`numpy.searchsorted` over all of their edges.
+
+    Data with a single distinct value has no meaningful optimum, and
+    ``n_min`` bins are used. Where more than one bin count has the same
+    minimum cost, the smallest is returned.
+
     :param plotdata_y: The data for which a histogram is to be made
+    :param n_min: The smallest number of bins to consider
+    :param n_max: The number of bins above the largest to consider
     :return: The optimal number of bins
-
-    .. warning:: This function fails if the provided data lacks a proper
-                 distribution, such as if there are only 4 distinct values
-                 in the output. Figure out why and how to fix it. In the
-                 meanwhile, specify bins manually to not let this function
-                 be called.
     """
-
-    max_p = max(plotdata_y)
-    min_p = min(plotdata_y)
-
-    n_min = 2
-    n_max = 50
-    n = range(n_min, n_max)
+    data = numpy.sort(numpy.asarray(plotdata_y), axis=None)
+    if not len(data):
+        raise ValueError("Cannot find the optimum bins for empty data")
+    min_p = data[0]
+    max_p = data[-1]
 
     # Number of Bins array
-    n = numpy.array(n)
+    n = numpy.arange(n_min, n_max)
+    if max_p == min_p:
+        return n[0]
     # Bin Size Vector
     d = (max_p - min_p) / n
 
-    c = numpy.zeros(shape=(numpy.size(d), 1))
+    # Bin edges of all candidates, concatenated. The count of events in
+    # each bin follows from the position of its edges in the sorted data.
+    # As with numpy.histogram, the last bin includes its right edge,
+    # which is always the largest value.
+    edges = numpy.concatenate([numpy.linspace(min_p, max_p, x + 1)
+                               for x in n])
+    positions = numpy.searchsorted(data, edges, side='left')
+    ends = numpy.cumsum(n + 1) - 1
+    positions[ends] = len(data)
+    ki = numpy.diff(positions)
+    # Drop the differences across the boundary between two candidates
+    ki = numpy.delete(ki, ends[:-1])
+    starts = numpy.concatenate(([0], numpy.cumsum(n)[:-1]))
 
     # Computation of the cost function
-    for i in xrange(numpy.size(n)):
-        edges = numpy.linspace(min_p, max_p, n[i]+1)  # Bin edges
-        ki = pyplot.hist(plotdata_y, edges)     # Count # of events in bins
-        ki = ki[0]
-        k = numpy.mean(ki)                      # Mean of event count
-        v = sum((ki - k) ** 2) / n[i]           # Variance of event count
-        if d[i] == 0:
-            c[i] = 10000
-        else:
-            c[i] = (2 * k - v) / ((d[i]) ** 2)  # The cost Function
+    k = len(data) / n.astype(numpy.float64)              # Mean of event count
+    v = numpy.add.reduceat((ki - numpy.repeat(k, n)) ** 2, starts) / n
+    c = (2 * k - v) / (d ** 2)                           # The cost Function
 
     # Optimal Bin Size Selection
-    cmin = min(c)
-    idx = numpy.where(c == cmin)
-    idx = int(idx[0])
-    pyplot.close()
-    return n[idx]
+    return n[numpy.argmin(c)]
 
 
+@instrument.timed('render.make_histogram')
 def make_histogram(outpath, plotdata_y, bins=None, color='red',
                    xlabel='', ylabel='', x_range=None):
     """
     Renders a histogram of the data provided as a ``.png`` file,
     saved to the path specified by ``outpath``.
-    This function uses :mod:`matplotlib.pyplot`.
+    The histogram is drawn on the calling thread's :class:`Canvas`.
 
     .. seealso:: :func:`get_optimum_bins`
 
@@ -196,14 +554,44 @@ def make_histogram(outpath, plotdata_y, bins=None, color='red',
     """
     if bins is None:
         bins = get_optimum_bins(plotdata_y)
-    pyplot.hist(plotdata_y, bins=bins, color=color, range=x_range)
-    pyplot.grid(True, which='major', linestyle='-')
-    pyplot.grid(True, which='minor')
-    pyplot.xlabel(xlabel, fontsize=20)
-    pyplot.ylabel(ylabel, fontsize=20)
-    pyplot.tick_params(axis='both', which='major', labelsize=16)
-    pyplot.tick_params(axis='both', which='minor', labelsize=8)
-    pyplot.tight_layout()
-    pyplot.savefig(outpath)
-    pyplot.close()
-    return outpath
+    canvas = get_canvas('histogram')
+    ax = canvas.axes
+    canvas.autoscale()
+    canvas.bars = ax.hist(plotdata_y, bins=bins, color=color, range=x_range)[2]
+    ax.set_xlabel(xlabel, fontsize=20)
+    ax.set_ylabel(ylabel, fontsize=20)
+    canvas.layout()
+    return canvas.save(outpath)
+
+
+@instrument.timed('render.make_binned_histogram')
+def make_binned_histogram(outpath, edges, counts, color='red',
+                          xlabel='', ylabel='', x_range=None):
+    """
+    Renders a histogram which has already been binned, such as one
+    accumulated over many captures by :mod:`process`, as a ``.png`` file
+    saved to the path specified by ``outpath``.
+
+    .. seealso:: :func:`make_histogram`
+
+    :param edges: The bin edges, one more than ``counts``
+    :param counts: The number of samples in each bin
+    :return: The output path.
+    """
+    edges = numpy.asarray(edges, dtype=numpy.float64)
+    counts = numpy.asarray(counts)
+    if x_range is not None:
+        keep = (edges[1:] > x_range[0]) & (edges[:-1] < x_range[1])
+        idx = numpy.flatnonzero(keep)
+        if len(idx):
+            edges = edges[idx[0]:idx[-1] + 2]
+            counts = counts[idx[0]:idx[-1] + 1]
+    canvas = get_canvas('histogram')
+    ax = canvas.axes
+    canvas.autoscale()
+    canvas.bars = ax.hist(edges[:-1], bins=edges, weights=counts,
+                          color=color)[2]
+    ax.set_xlabel(xlabel, fontsize=20)
+    ax.set_ylabel(ylabel, fontsize=20)
+    canvas.layout()
+    return canvas.save(outpath)
@@ -22,19 +22,32 @@
 Docstring for run
 """
 
+import cProfile
+import argparse
+import traceback
 try:
     from pathlib import Path
     Path().expanduser()
 except (ImportError, AttributeError):
     from pathlib2 import Path
 
+import cache
+import output
 import acquire
+import pipeline
+import spectral
+import manifest
+import instrument
+from process import binned, write_statistics
 
 BASE_FOLDER = Path('../')
 if not BASE_FOLDER.is_absolute():
     BASE_FOLDER = Path.cwd().joinpath(BASE_FOLDER)
 BASE_FOLDER = BASE_FOLDER.resolve()
 OUT_FOLDER = BASE_FOLDER / 'plots'
+CACHE_FOLDER = BASE_FOLDER / 'cache'
+MANIFEST = OUT_FOLDER / '.manifest.json'
+PROFILE_FOLDER = OUT_FOLDER / 'profiles'
 
 SOURCES = [#('full', acquire.IQDataSet),
            #('crop', acquire.IQDataSet),
@@ -50,13 +63,324 @@ SOURCES = [#('full', acquire.IQDataSet),
            ]
 
 
-def main():
-    print("Using data from {0}".format(BASE_FOLDER / 'data'))
-    for waveform in acquire.all_waveforms(BASE_FOLDER / 'data', SOURCES):
-        waveform.process_waveform()
+def _process_waveform(waveform, metrics=None):
+    waveform.process_waveform()
+    jobs = waveform.plot_jobs(OUT_FOLDER)
+    if metrics is not None and hasattr(waveform, 'spectral_metrics'):
+        metrics[waveform.name] = waveform.spectral_metrics()
+    # The jobs hold what they plot. Anything else derived from the
+    # channel is freed as soon as they have been rendered.
+    waveform.release()
+    return jobs
+
+
+def process_waveform(waveform, profile=None, metrics=None):
+    """
+    Processes ``waveform`` and returns ``(jobs, stats)``, its plot jobs
+    and the :class:`instrument.Stats` of the processing.
+
+    :param profile: Run under :mod:`cProfile`, and write the profile to
+                    this path
+    :param metrics: A dict into which to add the spectral metrics of the
+                    waveform, see :meth:`acquire.Waveform.spectral_metrics`
+    """
+    with instrument.scope() as stats, instrument.stage('process'):
+        instrument.count('samples_processed', len(waveform.y_data))
+        if profile is None:
+            return _process_waveform(waveform, metrics), stats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(_process_waveform, waveform,
+                                    metrics), stats
+        finally:
+            profiler.dump_stats(str(profile))
+
+
+def plot_jobs(dcache=None, outputs=None, pending=None, loaders=1,
+              prefetch=None, summary=None, profile=None, channels=None,
+              metrics=None):
+    waveforms = acquire.all_waveforms(BASE_FOLDER / 'data', SOURCES,
+                                      skip_errors=True, cache=dcache,
+                                      channels=channels, workers=loaders,
+                                      prefetch=prefetch, ordered=False)
+    for waveform in waveforms:
+        profiling = waveform.name == profile
+        if profiling and not PROFILE_FOLDER.exists():
+            PROFILE_FOLDER.mkdir(parents=True)
+        try:
+            jobs, stats = process_waveform(
+                waveform, PROFILE_FOLDER / (waveform.name + '.process.prof')
+                if profiling else None, metrics
+            )
+            if summary is not None:
+                summary[waveform.name] = {'acquire': waveform.parent.stats,
+                                          'process': stats,
+                                          'render': instrument.Stats()}
+            if outputs is not None:
+                nskipped = len(outputs.skipped)
+                stale = list(outputs.stale_jobs(
+                    jobs, waveform.parent.fingerprint
+                ))
+                nskipped = len(outputs.skipped) - nskipped
+                for job, digest in stale:
+                    pending[job.kwargs['outpath']] = digest
+                jobs = [job for job, _ in stale]
+                if not jobs:
+                    print("Plots for {0} are up to date"
+                          "".format(waveform.name))
+                    continue
+                if nskipped:
+                    print("Skipping {0} up to date plots for {1}"
+                          "".format(nskipped, waveform.name))
+        except Exception:
+            print("Failed to process {0}".format(waveform.name))
+            traceback.print_exc()
+            continue
         print("Rendering plots for {0}".format(waveform.name))
-        waveform.render_plots(OUT_FOLDER)
+        for job in jobs:
+            if profiling:
+                job.profile = str(PROFILE_FOLDER / (job.name + '.prof'))
+            yield job
+
+
+def main(workers=1, threads=False, dcache=None, incremental=False,
+         loaders=1, prefetch=None, stats=None, profile=None, channels=None,
+         spectral_out=None):
+    """
+    :param incremental: Only render plots whose output is missing, or
+                        whose source data or rendering parameters have
+                        changed since it was last rendered.
+    :param loaders: The number of processes parsing datasets while
+                    earlier ones are rendered.
+    :param prefetch: The maximum number of datasets loaded ahead of
+                     rendering.
+    :param stats: Write a summary of the time spent and the work done in
+                  each stage for each waveform to this path, as CSV if it
+                  ends in ``.csv`` and otherwise as JSON. The
+                  ``acquire`` part of each waveform is that of its
+                  dataset, and is shared by the dataset's waveforms.
+    :param profile: The name of a waveform to profile. Profiles of its
+                    processing and of each of its plots are written to
+                    :data:`PROFILE_FOLDER`.
+    :param channels: The indices of the channels to plot, by default all
+                     of them. The other channels are not parsed.
+    :param spectral_out: Write the SNR, SINAD, ENOB and largest spurs of
+                         each waveform to this path, as CSV if it ends in
+                         ``.csv`` and otherwise as JSON.
+    """
+    print("Using data from {0}".format(BASE_FOLDER / 'data'))
+    failed = []
+    outputs, pending = None, {}
+    summary = None
+    metrics = {} if spectral_out is not None else None
+    if incremental:
+        outputs = manifest.Manifest(MANIFEST)
+    if stats is not None:
+        instrument.enable()
+        summary = {}
+    jobs = plot_jobs(dcache, outputs, pending, loaders, prefetch,
+                     summary, profile, channels, metrics)
+    results = pipeline.run_jobs(jobs, workers, threads=threads)
+    try:
+        for idx, result in enumerate(results):
+            if result.stats is not None:
+                # Plot names are the waveform name and a suffix
+                waveform = result.name.rsplit('.', 1)[0]
+                summary[waveform]['render'].merge(result.stats)
+            if result.ok:
+                digest = pending.pop(result.result, None)
+                if digest is not None:
+                    outputs.record(result.result, digest)
+                print("[{0}] Rendered {1}".format(idx + 1, result.name))
+            else:
+                failed.append(result.name)
+                print("[{0}] Failed to render {1}".format(idx + 1,
+                                                          result.name))
+                print(result.error)
+    finally:
+        # Plots written in the background by this process
+        for outpath, error in output.flush():
+            failed.append(outpath)
+            print("Failed to write {0}".format(outpath))
+            print(error)
+            if outputs is not None:
+                outputs.forget(outpath)
+        if outputs is not None:
+            outputs.save()
+        if metrics is not None:
+            spectral.write_metrics(spectral_out, dict(
+                (k, v) for k, v in metrics.items() if v is not None
+            ))
+            print("Wrote spectral metrics to {0}".format(spectral_out))
+        if summary is not None:
+            instrument.write_summary(stats, summary)
+            print("Wrote the timing summary to {0}".format(stats))
+    if outputs is not None and outputs.skipped:
+        print("{0} plots were up to date and skipped"
+              "".format(len(outputs.skipped)))
+    if failed:
+        print("{0} plots could not be rendered : {1}"
+              "".format(len(failed), ', '.join(failed)))
+
+
+def aggregate(workers=1, threads=False, nbins=1024):
+    """
+    Renders one histogram per channel of each branch of :data:`SOURCES`,
+    over all of its captures, to ``<branch>.ch<N>.h.png``. Captures are
+    streamed, so that the samples of a branch are never all in memory.
+
+    :param nbins: The maximum number of bins of each histogram
+    """
+    import render
+    print("Using data from {0}".format(BASE_FOLDER / 'data'))
+    if not OUT_FOLDER.exists():
+        OUT_FOLDER.mkdir(parents=True)
+    hists = acquire.aggregate_histograms(BASE_FOLDER / 'data', SOURCES,
+                                         skip_errors=True, workers=workers,
+                                         nbins=nbins, threads=threads)
+    for branch, channels in sorted(hists.items()):
+        for idx, hist in enumerate(channels):
+            if not hist.total:
+                continue
+            edges, counts = binned(hist, nbins)
+            outpath = OUT_FOLDER / '{0}.ch{1}.h.png'.format(branch, idx)
+            render.make_binned_histogram(str(outpath), edges, counts)
+            print("Rendered {0} from {1} samples".format(outpath.name,
+                                                         hist.total))
+
+
+def summarize(outpath, dcache=None, loaders=1, prefetch=None, channels=None,
+              nbins=1024, spectral_out=None):
+    """
+    Writes numeric summaries of each waveform to ``outpath``, as CSV if
+    it ends in ``.csv`` and otherwise as JSON, without rendering any
+    plots. Neither matplotlib nor the rendering modules are loaded.
+
+    :param nbins: The maximum number of bins of the histogram of each
+                  waveform
+    :param spectral_out: Also write the spectral metrics of each waveform
+                         to this path, as with :func:`main`
+
+    .. seealso:: :meth:`acquire.Renderable.statistics`
+    """
+    print("Using data from {0}".format(BASE_FOLDER / 'data'))
+    summaries = {}
+    metrics = {}
+    waveforms = acquire.all_waveforms(BASE_FOLDER / 'data', SOURCES,
+                                      skip_errors=True, cache=dcache,
+                                      channels=channels, workers=loaders,
+                                      prefetch=prefetch, ordered=False)
+    for waveform in waveforms:
+        try:
+            summaries[waveform.name] = waveform.statistics(nbins)
+            if spectral_out is not None and \
+                    hasattr(waveform, 'spectral_metrics'):
+                metrics[waveform.name] = waveform.spectral_metrics()
+        except Exception:
+            print("Failed to summarize {0}".format(waveform.name))
+            traceback.print_exc()
+            continue
+        finally:
+            waveform.release()
+        print("Summarized {0}".format(waveform.name))
+    write_statistics(outpath, summaries)
+    print("Wrote statistics of {0} waveforms to {1}"
+          "".format(len(summaries), outpath))
+    if spectral_out is not None:
+        spectral.write_metrics(spectral_out, dict(
+            (k, v) for k, v in metrics.items() if v is not None
+        ))
+        print("Wrote spectral metrics to {0}".format(spectral_out))
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description="Render plots of the "
+                                                 "captures in the data folder")
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help="Number of worker processes. 0 uses one per CPU.")
+    parser.add_argument('--threads', action='store_true',
+                        help="Use worker threads instead of processes.")
+    parser.add_argument('-l', '--loaders', type=int, default=1,
+                        help="Number of processes parsing datasets ahead "
+                             "of rendering. 0 uses one per CPU.")
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help="Maximum number of datasets loaded ahead of "
+                             "rendering.")
+    parser.add_argument('--stats', metavar='PATH',
+                        help="Write per-waveform timings and counters to "
+                             "this .json or .csv file.")
+    parser.add_argument('--spectral', metavar='PATH',
+                        help="Write the SNR, SINAD, ENOB and spurs of each "
+                             "waveform to this .json or .csv file.")
+    parser.add_argument('--profile', metavar='WAVEFORM',
+                        help="Profile the processing and rendering of "
+                             "this waveform with cProfile.")
+    parser.add_argument('--cache', default=str(CACHE_FOLDER),
+                        help="Folder for the cache of parsed datasets.")
+    parser.add_argument('--cache-size', type=int, default=4096,
+                        help="Size limit of the dataset cache, in MB.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Parse every dataset without using the cache.")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Re-parse every dataset and replace its cache.")
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help="Skip plots which are already up to date.")
+    parser.add_argument('--channels', type=int, nargs='+', metavar='N',
+                        help="Only plot these channels of each capture.")
+    parser.add_argument('--bitplanes', choices=('stack', 'raster', 'separate'),
+                        default=acquire.BinDump.planes,
+                        help="Draw the bit planes of dumps stacked or as a "
+                             "raster in one figure, or as separate graphs.")
+    parser.add_argument('--png-writers', type=int, default=output.PNG_WRITERS,
+                        help="Threads per process encoding and writing "
+                             "PNG files in the background. 0 writes each "
+                             "plot before drawing the next.")
+    parser.add_argument('--png-compression', type=int, choices=range(10),
+                        default=output.PNG_COMPRESSION, metavar='0-9',
+                        help="PNG compression level. Lower levels are "
+                             "faster, for interim runs.")
+    parser.add_argument('--convert', action='store_true',
+                        help="Only convert the text captures of each "
+                             "source to binary containers, which are "
+                             "then read in their place.")
+    parser.add_argument('--aggregate', action='store_true',
+                        help="Only render a histogram of each channel of "
+                             "each source over all of its captures.")
+    parser.add_argument('--stats-only', metavar='PATH',
+                        help="Only write statistics and histogram counts "
+                             "of each waveform to this .json or .csv "
+                             "file, without plotting.")
+    parser.add_argument('--bins', type=int, default=1024,
+                        help="Maximum number of bins of aggregate "
+                             "histograms and of those of --stats-only.")
+    return parser
 
 
 if __name__ == '__main__':
-    main()
+    args = _parser().parse_args()
+    acquire.BinDump.planes = args.bitplanes
+    output.PNG_WRITERS = args.png_writers
+    output.PNG_COMPRESSION = args.png_compression
+    if args.convert:
+        acquire.convert_captures(BASE_FOLDER / 'data', SOURCES,
+                                 skip_errors=True,
+                                 workers=args.workers or None,
+                                 threads=args.threads)
+        raise SystemExit
+    if args.aggregate:
+        aggregate(workers=args.workers or None, threads=args.threads,
+                  nbins=args.bins)
+        raise SystemExit
+    dcache = None
+    if not args.no_cache:
+        dcache = cache.DataSetCache(args.cache, args.cache_size * 1024 ** 2,
+                                    refresh=args.refresh)
+    if args.stats_only:
+        summarize(args.stats_only, dcache=dcache, loaders=args.loaders or None,
+                  prefetch=args.prefetch, channels=args.channels,
+                  nbins=args.bins, spectral_out=args.spectral)
+        raise SystemExit
+    main(workers=args.workers or None, threads=args.threads, dcache=dcache,
+         incremental=args.incremental, loaders=args.loaders or None,
+         prefetch=args.prefetch, stats=args.stats, profile=args.profile,
+         channels=args.channels, spectral_out=args.spectral)
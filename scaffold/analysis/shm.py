@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Transport of sample arrays to worker processes by reference.
+
+The arguments of a job sent to a worker process are pickled, and every
+array in them is copied, once per job. The plots of one waveform are
+several jobs which each hold the same channel, or slices of it, so that
+a long capture is copied many times over.
+
+An :class:`Arena` instead places each array once in a scratch file,
+on a memory backed file system where there is one, and replaces it in
+the arguments of jobs with a small :class:`SharedArray` naming the
+file. Slices of an array which has been placed refer to the same file.
+Arrays mapped from a :mod:`container` are referred to where they are,
+and are not copied at all, since containers are only replaced by
+conversion and not removed during a run. Arrays mapped from other
+files, such as the entries of a :mod:`cache` which may be evicted while
+jobs are queued, are placed in the arena as any other. In the worker,
+:func:`attach` maps the files read only, and restores the arrays as
+views of them.
+
+The arena belongs to the process which submits the jobs. A file is
+removed once every job referring to it has been reported, and the
+whole arena is removed when it is closed, or when the process exits.
+Workers only map the files, so a worker which fails or is killed
+leaves nothing behind.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy
+from multiprocessing import util
+
+from timebase import TickTimeBase
+from container import SUFFIX
+
+#: Arrays smaller than this many bytes are pickled with the job as usual
+MIN_BYTES = 1 << 20
+
+#: The folder in which arenas are created. The default is a memory backed
+#: file system where there is one, and the system temporary folder
+#: otherwise.
+SCRATCH_FOLDER = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class SharedArray(object):
+    """
+    A reference to an array held in a file, which is restored as a read
+    only view of that file by :meth:`attach`.
+
+    :param path: The path to the file
+    :param offset: The position in the file of the first byte of the
+                   array the view is taken from
+    :param dtype: The type of the elements
+    :param size: The number of elements in the file from ``offset``
+    :param start: The position of the first element of the view, in
+                  bytes from ``offset``
+    :param shape: The shape of the view
+    :param strides: The strides of the view
+    """
+    def __init__(self, path, offset, dtype, size, start, shape, strides):
+        self.path = path
+        self.offset = offset
+        self.dtype = dtype
+        self.size = size
+        self.start = start
+        self.shape = shape
+        self.strides = strides
+
+    def attach(self, mapped=None):
+        """
+        Returns the array. ``mapped`` is an optional dict of the files
+        already mapped, so that the arrays of one job which are in the
+        same file share a mapping.
+        """
+        key = (self.path, self.offset)
+        if mapped is None:
+            mapped = {}
+        if key not in mapped:
+            mapped[key] = numpy.memmap(self.path, dtype=self.dtype, mode='r',
+                                       offset=self.offset, shape=(self.size,))
+        return numpy.ndarray(self.shape, dtype=self.dtype,
+                             buffer=mapped[key], offset=self.start,
+                             strides=self.strides)
+
+    @property
+    def nbytes(self):
+        return int(numpy.prod(self.shape)) * numpy.dtype(self.dtype).itemsize
+
+    def __repr__(self):
+        return '<SharedArray {0} shape={1}>'.format(self.path, self.shape)
+
+
+def _address(array):
+    return array.__array_interface__['data'][0]
+
+
+def _root(array):
+    # The array which owns the memory of ``array``, of which it is a view
+    while isinstance(array.base, numpy.ndarray):
+        array = array.base
+    return array
+
+
+def _mapped_file(root):
+    # The file and offset of an array mapped directly from a container.
+    # Other files may be removed before the jobs referring to them run.
+    if isinstance(root, numpy.memmap) and root.filename is not None \
+            and root.filename.endswith(SUFFIX) and root.flags.c_contiguous:
+        return root.filename, root.offset
+    return None
+
+
+class Arena(object):
+    """
+    Holds the scratch files of the arrays shared with workers.
+
+    :param folder: The folder in which to create the arena, by default
+                   :data:`SCRATCH_FOLDER`
+    :param min_bytes: The size of the smallest array to share, by
+                      default :data:`MIN_BYTES`
+    """
+    def __init__(self, folder=None, min_bytes=None):
+        if folder is None:
+            folder = SCRATCH_FOLDER
+        if min_bytes is None:
+            min_bytes = MIN_BYTES
+        self.min_bytes = min_bytes
+        self.folder = tempfile.mkdtemp(prefix='mwtp-', dir=folder)
+        # Scratch files by the id of the array they hold, as
+        # [path, root, references]. The root is kept so that its id is
+        # not reused while the file exists.
+        self._files = {}
+        self._count = 0
+        self._finalizer = util.Finalize(self, shutil.rmtree,
+                                        args=(self.folder, True),
+                                        exitpriority=10)
+
+    def _place(self, root):
+        key = id(root)
+        if key not in self._files:
+            path = os.path.join(self.folder, '{0}.bin'.format(self._count))
+            self._count += 1
+            root.tofile(path)
+            self._files[key] = [path, root, 0]
+        entry = self._files[key]
+        entry[2] += 1
+        return key, entry[0]
+
+    def _share_array(self, array, keys):
+        if array.nbytes < self.min_bytes or array.dtype.hasobject:
+            return array
+        root = _root(array)
+        if not root.flags.c_contiguous:
+            # Only the view itself is written
+            root = array = numpy.ascontiguousarray(array)
+        source = _mapped_file(root)
+        if source is None:
+            key, path = self._place(root)
+            keys.append(key)
+            source = path, 0
+        path, offset = source
+        return SharedArray(path, offset, root.dtype.str, root.size,
+                           _address(array) - _address(root),
+                           array.shape, array.strides)
+
+    def share(self, value, keys):
+        """
+        Returns ``value`` with the arrays in it replaced by
+        :class:`SharedArray` references. Values may be arrays, time
+        bases, or lists or tuples of them. Anything else is returned as
+        it is. The files which are referred to are appended to ``keys``,
+        to be given to :meth:`release` once the references are no
+        longer needed.
+        """
+        if isinstance(value, numpy.ndarray):
+            return self._share_array(value, keys)
+        if isinstance(value, TickTimeBase):
+            return TickTimeBase(self.share(value.ticks(), keys), value.places)
+        if isinstance(value, (list, tuple)):
+            return type(value)(self.share(v, keys) for v in value)
+        return value
+
+    def share_kwargs(self, kwargs):
+        """
+        Returns ``(kwargs, keys)``, ``kwargs`` with their arrays shared,
+        and the files they refer to.
+        """
+        keys = []
+        return dict((k, self.share(v, keys)) for k, v in kwargs.items()), keys
+
+    def release(self, keys):
+        """
+        Drops a reference to each of the files of ``keys``, and removes
+        those which are no longer referred to. Workers which still have
+        them mapped keep their contents until they are done.
+        """
+        for key in keys:
+            entry = self._files.get(key)
+            if entry is None:
+                continue
+            entry[2] -= 1
+            if entry[2] <= 0:
+                del self._files[key]
+                try:
+                    os.remove(entry[0])
+                except OSError:
+                    pass
+
+    @property
+    def nbytes(self):
+        """
+        The size of the files in the arena.
+        """
+        return sum(entry[1].nbytes for entry in self._files.values())
+
+    def close(self):
+        """
+        Removes the arena and every file in it.
+        """
+        self._files = {}
+        self._finalizer()
+
+
+def attach(value, mapped=None):
+    """
+    Returns ``value`` with each :class:`SharedArray` in it replaced by
+    the array it refers to. The inverse of :meth:`Arena.share`.
+    """
+    if mapped is None:
+        mapped = {}
+    if isinstance(value, SharedArray):
+        return value.attach(mapped)
+    if isinstance(value, TickTimeBase):
+        ticks = value.ticks()
+        if isinstance(ticks, SharedArray):
+            return TickTimeBase(ticks.attach(mapped), value.places)
+        return value
+    if isinstance(value, (list, tuple)):
+        return type(value)(attach(v, mapped) for v in value)
+    return value
+
+
+def attach_kwargs(kwargs):
+    """
+    Returns ``kwargs`` with the arrays they refer to attached. Arrays
+    in the same file share one mapping.
+    """
+    mapped = {}
+    return dict((k, attach(v, mapped)) for k, v in kwargs.items())
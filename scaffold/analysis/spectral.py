@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Spectral and noise analysis of captures, for converter characterization.
+
+The power spectral density is estimated with Welch's method : the
+series is cut into overlapping segments, each of which is windowed and
+transformed, and their periodograms are averaged. Segments are taken a
+batch at a time from a series presented as a sequence of blocks, so
+memory use depends on the segment length and not on the length of the
+capture. Windows and their normalization are computed once for each
+segment length and reused.
+
+From the spectrum of a capture of a sine wave, :func:`analyze` derives
+the usual dynamic performance figures : SNR, SINAD, THD, SFDR and ENOB,
+and a table of the largest spurs.
+"""
+
+import csv
+import json
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+#: The longest segment used, in samples
+NPERSEG = 4096
+
+#: The shortest capture for which a spectrum is estimated
+MIN_SAMPLES = 64
+
+#: Fraction of each segment shared with the next
+OVERLAP = 0.5
+
+#: Segments transformed at once, which bounds the working memory
+BATCH = 64
+
+#: The window of the segments of spectra. The sidelobes of the 4-term
+#: Blackman-Harris window are 92 dB down, below the quantization noise of
+#: converters of up to about 14 bits, so that the power a tone between
+#: two bins leaks is not counted as noise.
+WINDOW = 'blackmanharris'
+
+#: Bins on either side of a tone which hold its power, for each window :
+#: the half width of its main lobe, and one more for a tone between bins
+LEAKAGE_BINS = {'boxcar': 2, 'hann': 3, 'blackmanharris': 5}
+
+# Coefficients of the 4-term Blackman-Harris window
+_BLACKMAN_HARRIS = (0.35875, 0.48829, 0.14128, 0.01168)
+
+_windows = {}
+
+
+def get_window(n, kind=WINDOW):
+    """
+    Returns ``(window, sum of squares)`` for a periodic window of ``n``
+    points, computed once for each length.
+    """
+    key = (kind, n)
+    if key not in _windows:
+        phase = 2 * numpy.pi * numpy.arange(n) / n
+        if kind == 'hann':
+            w = 0.5 - 0.5 * numpy.cos(phase)
+        elif kind == 'blackmanharris':
+            w = numpy.zeros(n)
+            for k, a in enumerate(_BLACKMAN_HARRIS):
+                w += (-1) ** k * a * numpy.cos(k * phase)
+        elif kind == 'boxcar':
+            w = numpy.ones(n)
+        else:
+            raise ValueError("Unknown window {0}".format(kind))
+        w.flags.writeable = False
+        _windows[key] = (w, float(numpy.dot(w, w)))
+    return _windows[key]
+
+
+def segment_length(n, nperseg=NPERSEG):
+    """
+    Returns the segment length used for a series of ``n`` samples : the
+    largest power of two up to ``nperseg`` which gives several segments.
+    """
+    length = 1
+    while length * 2 <= min(nperseg, n // 4 or 1):
+        length *= 2
+    return length
+
+
+def sample_rate(x):
+    """
+    Returns the mean sample rate of the x-axis ``x``, an array or
+    :class:`timebase.TimeBase`, in samples per unit of ``x``.
+    """
+    n = len(x)
+    if n < 2:
+        raise ValueError("Need at least two samples for a sample rate")
+    step = getattr(x, 'step', None)
+    if step:
+        return 1 / float(step)
+    span = float(x[n - 1]) - float(x[0])
+    if not span > 0:
+        raise ValueError("The x-axis is not increasing")
+    return (n - 1) / span
+
+
+class Welch(object):
+    """
+    Accumulates a Welch estimate of the one-sided power spectral density
+    of a series presented as a sequence of blocks. Each segment has its
+    mean removed before it is windowed.
+
+    :param fs: The sample rate
+    :param nperseg: The segment length
+    :param window: The window of the segments, see :func:`get_window`
+    """
+    def __init__(self, fs, nperseg=NPERSEG, overlap=OVERLAP, window=WINDOW,
+                 batch=BATCH):
+        self.fs = float(fs)
+        self.nperseg = nperseg
+        self.step = max(nperseg - int(nperseg * overlap), 1)
+        self.batch = batch
+        self.window, self._wss = get_window(nperseg, window)
+        self._sum = numpy.zeros(nperseg // 2 + 1)
+        self._tail = numpy.zeros(0)
+        self.nseg = 0
+
+    def update(self, block):
+        data = numpy.concatenate((self._tail,
+                                  numpy.asarray(block, dtype=numpy.float64)))
+        if len(data) < self.nperseg:
+            self._tail = data
+            return
+        nseg = (len(data) - self.nperseg) // self.step + 1
+        stride = data.strides[0]
+        segments = as_strided(data, shape=(nseg, self.nperseg),
+                              strides=(self.step * stride, stride),
+                              writeable=False)
+        for start in range(0, nseg, self.batch):
+            batch = segments[start:start + self.batch]
+            batch = batch - batch.mean(axis=1, keepdims=True)
+            batch *= self.window
+            spectrum = numpy.fft.rfft(batch, axis=1)
+            self._sum += (spectrum.real ** 2 + spectrum.imag ** 2).sum(axis=0)
+        self.nseg += nseg
+        self._tail = data[nseg * self.step:].copy()
+
+    def result(self):
+        """
+        Returns ``(freqs, psd)``, the frequencies of the bins and the
+        density in each, in squared units of the series per unit of
+        ``fs``.
+        """
+        if not self.nseg:
+            raise ValueError("Too few samples for a segment of {0}"
+                             "".format(self.nperseg))
+        psd = self._sum / (self.nseg * self.fs * self._wss)
+        # One-sided. DC and, for even lengths, Nyquist are not doubled.
+        if self.nperseg % 2:
+            psd[1:] *= 2
+        else:
+            psd[1:-1] *= 2
+        freqs = numpy.fft.rfftfreq(self.nperseg, 1 / self.fs)
+        return freqs, psd
+
+
+def welch(y, fs, nperseg=None, block_size=1 << 20, **kwargs):
+    """
+    Returns ``(freqs, psd)``, the Welch estimate of the power spectral
+    density of ``y``. The series is read a block at a time.
+
+    :param nperseg: The segment length, by default chosen by
+                    :func:`segment_length`
+    """
+    if nperseg is None:
+        nperseg = segment_length(len(y))
+    welch = Welch(fs, nperseg, **kwargs)
+    for start in range(0, len(y), block_size):
+        welch.update(y[start:start + block_size])
+    return welch.result()
+
+
+def _band(n, idx, width):
+    return slice(max(idx - width, 0), min(idx + width + 1, n))
+
+
+def _db(num, den):
+    if den <= 0:
+        return float('inf')
+    if num <= 0:
+        return float('-inf')
+    return float(10 * numpy.log10(num / den))
+
+
+def analyze(freqs, psd, fundamental=None, nharmonics=5, nspurs=5,
+            window=WINDOW, leakage_bins=None):
+    """
+    Computes the dynamic performance of a converter from the spectrum of
+    a capture of a single tone.
+
+    The power of a tone is that of the bins within ``leakage_bins`` of
+    its peak. Harmonics 2 to ``nharmonics``, folded into the first
+    Nyquist zone, are distortion. The noise is the power of the
+    remaining bins other than those at DC, scaled up to the whole band
+    to account for the bins which were excluded.
+
+    :param fundamental: The frequency of the tone, by default that of
+                        the largest bin other than DC
+    :param window: The window the spectrum was estimated with
+    :param leakage_bins: The bins on either side of a tone which hold
+                         its power, by default those of ``window`` in
+                         :data:`LEAKAGE_BINS`
+    :return: A dict of ``fundamental_hz``, ``signal_power``,
+             ``noise_power``, ``distortion_power``, ``snr_db``,
+             ``sinad_db``, ``thd_db``, ``sfdr_db``, ``enob`` and
+             ``spurs``, a list of ``(freq_hz, dbc)`` of the largest
+             spurs other than the tone, largest first
+    """
+    if leakage_bins is None:
+        leakage_bins = LEAKAGE_BINS[window]
+    psd = numpy.asarray(psd, dtype=numpy.float64)
+    n = len(psd)
+    df = freqs[1] - freqs[0]
+    fs = 2 * freqs[-1] if n > 1 else 0
+    power = psd * df
+    used = numpy.zeros(n, dtype=bool)
+    used[_band(n, 0, leakage_bins)] = True
+    if fundamental is None:
+        candidates = numpy.where(used, -1, power)
+        peak = int(numpy.argmax(candidates))
+    else:
+        peak = int(round(fundamental / df))
+        region = _band(n, peak, leakage_bins)
+        peak = region.start + int(numpy.argmax(power[region]))
+    band = _band(n, peak, leakage_bins)
+    signal = power[band].sum()
+    used[band] = True
+
+    distortion = 0.0
+    for k in range(2, nharmonics + 1):
+        f = (k * freqs[peak]) % fs if fs else 0
+        if f > fs / 2:
+            f = fs - f
+        idx = int(round(f / df))
+        region = _band(n, idx, leakage_bins)
+        idx = region.start + int(numpy.argmax(power[region]))
+        band = _band(n, idx, leakage_bins)
+        if used[band].any():
+            continue
+        distortion += power[band].sum()
+        used[band] = True
+
+    noise_bins = numpy.count_nonzero(~used)
+    noise = power[~used].sum() * n / max(noise_bins, 1)
+
+    # Spurs are the largest local maxima outside the tone and DC,
+    # including the harmonics
+    spur_used = numpy.zeros(n, dtype=bool)
+    spur_used[_band(n, 0, leakage_bins)] = True
+    spur_used[_band(n, peak, leakage_bins)] = True
+    spurs = []
+    order = numpy.argsort(power)[::-1]
+    for idx in order:
+        if len(spurs) >= nspurs:
+            break
+        if spur_used[idx]:
+            continue
+        band = _band(n, idx, leakage_bins)
+        spur = power[band][~spur_used[band]].sum()
+        spur_used[band] = True
+        spurs.append((float(freqs[idx]), _db(spur, signal)))
+
+    sinad = _db(signal, noise + distortion)
+    return {
+        'fundamental_hz': float(freqs[peak]),
+        'signal_power': float(signal),
+        'noise_power': float(noise),
+        'distortion_power': float(distortion),
+        'snr_db': _db(signal, noise),
+        'sinad_db': sinad,
+        'thd_db': _db(distortion, signal),
+        'sfdr_db': -spurs[0][1] if spurs else float('inf'),
+        'enob': float((sinad - 1.76) / 6.02),
+        'spurs': spurs,
+    }
+
+
+def write_metrics(path, metrics):
+    """
+    Writes the results of :func:`analyze` for each of a dict of
+    ``{name: metrics}`` to ``path``, as CSV with the largest spur if it
+    ends in ``.csv`` and otherwise as JSON.
+    """
+    path = str(path)
+    if not path.endswith('.csv'):
+        with open(path, 'w') as f:
+            json.dump(metrics, f, indent=2, sort_keys=True)
+        return
+    keys = ['fundamental_hz', 'snr_db', 'sinad_db', 'thd_db', 'sfdr_db',
+            'enob', 'signal_power', 'noise_power', 'distortion_power']
+    with open(path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name'] + keys + ['spur_hz', 'spur_dbc'])
+        for name in sorted(metrics):
+            m = metrics[name]
+            spur = m['spurs'][0] if m['spurs'] else ('', '')
+            writer.writerow([name] + [m[k] for k in keys] + list(spur))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Columnar sample storage for acquired datasets.
+
+Samples are held in typed numpy arrays, one per channel, with a single
+x-axis shared by every channel of a dataset. Once the store is
+finalized, the x-axis is held as a compact time base.
+
+.. seealso:: :mod:`timebase`
+"""
+
+import numpy
+
+import timebase
+
+
+class SampleBuffer(object):
+    """
+    A growable, typed, one-dimensional array. Capacity is doubled as
+    needed, so appends are amortized O(1) and storage costs one machine
+    word per sample.
+    """
+    def __init__(self, dtype=numpy.float64, capacity=4096):
+        self._data = numpy.empty(max(int(capacity), 1), dtype=dtype)
+        self._len = 0
+
+    @classmethod
+    def wrap(cls, array):
+        """
+        Creates a buffer holding an existing array, such as a memory
+        mapped one, without copying it.
+        """
+        buf = cls.__new__(cls)
+        buf._data = array
+        buf._len = len(array)
+        return buf
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def _reserve(self, n):
+        if n <= len(self._data):
+            return
+        capacity = len(self._data)
+        while capacity < n:
+            capacity *= 2
+        data = numpy.empty(capacity, dtype=self._data.dtype)
+        data[:self._len] = self._data[:self._len]
+        self._data = data
+
+    def append(self, value):
+        self._reserve(self._len + 1)
+        self._data[self._len] = value
+        self._len += 1
+
+    def extend(self, values):
+        values = numpy.asarray(values)
+        n = self._len + len(values)
+        self._reserve(n)
+        self._data[self._len:n] = values
+        self._len = n
+
+    def finalize(self):
+        """
+        Releases unused capacity and returns the filled array.
+        """
+        if len(self._data) != self._len:
+            self._data = self._data[:self._len].copy()
+        return self._data
+
+    @property
+    def data(self):
+        """
+        A view of the filled portion of the buffer. No data is copied.
+        """
+        return self._data[:self._len]
+
+
+class ColumnStore(object):
+    """
+    Columnar storage for a dataset : one x-axis buffer and one buffer
+    per channel, all of the same length.
+    """
+    def __init__(self, nch, y_dtype=numpy.float64, x_dtype=numpy.float64,
+                 capacity=4096):
+        self._x = SampleBuffer(x_dtype, capacity)
+        self._xbase = None
+        # Exact ticks of the x-axis, where its text is given
+        self._ticks = timebase.TickAccumulator()
+        self._ys = [SampleBuffer(y_dtype, capacity) for _ in range(nch)]
+
+    @classmethod
+    def from_arrays(cls, x, columns):
+        """
+        Creates a finalized store around an existing x-axis, either an
+        array or a time base, and channel arrays, without copying them.
+        """
+        store = cls.__new__(cls)
+        store._x = None
+        store._xbase = x
+        store._ys = [SampleBuffer.wrap(y) for y in columns]
+        return store
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def nch(self):
+        return len(self._ys)
+
+    def append_row(self, x, ys):
+        """
+        Appends a sample. ``x`` may be given as the text of the
+        timestamp, which is then also read exactly.
+        """
+        if isinstance(x, str):
+            self._ticks.append(x)
+            x = float(x)
+        else:
+            self._ticks.invalidate()
+        self._x.append(x)
+        for buf, y in zip(self._ys, ys):
+            buf.append(y)
+
+    def extend(self, x, ys, ticks=None, places=None):
+        """
+        Appends a block of samples. ``ys`` is a sequence of per-channel
+        arrays, or a 2D array with one column per channel. ``ticks`` and
+        ``places`` are the exact timestamps of the block, if known, as
+        from :func:`timebase.parse_ticks`.
+        """
+        self._ticks.extend(ticks, places)
+        if isinstance(ys, numpy.ndarray) and ys.ndim == 2:
+            ys = ys.T
+        self._x.extend(x)
+        for buf, y in zip(self._ys, ys):
+            buf.extend(y)
+
+    def finalize(self):
+        """
+        Releases unused capacity, and replaces the x-axis with an exact
+        time base where possible. No samples may be added afterwards.
+        """
+        if self._xbase is None:
+            ticks, places = self._ticks.result()
+            if ticks is not None and len(ticks) == len(self._x):
+                self._xbase = timebase.from_ticks(ticks, places)
+            else:
+                self._xbase = timebase.from_array(self._x.data)
+            self._x = None
+            self._ticks = None
+        for buf in self._ys:
+            buf.finalize()
+
+    @property
+    def x(self):
+        """
+        The x-axis. An array while the store is being filled, and a
+        :class:`timebase.TimeBase` or array once it is finalized.
+        """
+        if self._xbase is not None:
+            return self._xbase
+        return self._x.data
+
+    def column(self, idx):
+        return self._ys[idx].data
+
+    def add_column(self, y):
+        """
+        Adds a channel to a finalized store, without copying it.
+        """
+        if len(y) != len(self):
+            raise ValueError("Column of {0} samples does not match the "
+                             "store of {1}".format(len(y), len(self)))
+        self._ys.append(SampleBuffer.wrap(y))
+        return len(self._ys) - 1
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import bench
+
+
+def test_run_keeps_given_folder(tmpdir):
+    tmpdir.join('keep').write('')
+    results = bench.run(formats=('csv',), sizes=(1000,), stages=('parse',),
+                        folder=str(tmpdir))
+    assert [r['stage'] for r in results] == ['parse']
+    assert results[0]['peak_rss_mb'] > 0
+    # The captures are removed, and the folder and its files are not
+    assert sorted(x.basename for x in tmpdir.listdir()) == ['keep']
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+
+import numpy
+import pytest
+
+import cache
+import acquire
+
+
+@pytest.fixture
+def dcache(tmpdir):
+    return cache.DataSetCache(str(tmpdir.join('cache')))
+
+
+def _write(tmpdir, name, rows, mtime=None):
+    path = tmpdir.join(name)
+    path.write(''.join('{0},{1}\n'.format(i, v) for i, v in enumerate(rows)))
+    if mtime is not None:
+        os.utime(str(path), (mtime, mtime))
+    return str(path)
+
+
+def _cached(dataset):
+    # Columns loaded from the cache are memory mapped
+    return isinstance(dataset._store.column(0), numpy.memmap)
+
+
+def test_store_and_load(tmpdir, dcache):
+    path = _write(tmpdir, 'a.csv', [3, 1, 4, 1, 5])
+    first = acquire.CSVDataSet(path, cache=dcache)
+    assert not _cached(first)
+    assert len(list(dcache.entries())) == 1
+    second = acquire.CSVDataSet(path, cache=dcache)
+    assert _cached(second)
+    assert list(second.waveforms[0].y_data) == [3, 1, 4, 1, 5]
+    assert list(numpy.asarray(second.x_data)) == [0, 1, 2, 3, 4]
+
+
+def test_source_hashed_while_parsed(tmpdir, dcache):
+    path = _write(tmpdir, 'a.csv', [3, 1, 4])
+    source = cache.SourceFile(path)
+    with source.open() as f:
+        f.read()
+    assert source.digest()['hash'] == cache.content_hash(path)
+    # Read in part only, past what is buffered
+    path = _write(tmpdir, 'b.csv', range(100000))
+    source = cache.SourceFile(path)
+    with source.open() as f:
+        f.read(2)
+    assert 'hash' not in source.digest()
+
+
+def test_changed_contents_invalidate(tmpdir, dcache):
+    path = _write(tmpdir, 'a.csv', [3, 1, 4], mtime=1000)
+    acquire.CSVDataSet(path, cache=dcache)
+    # Same size, new contents
+    _write(tmpdir, 'a.csv', [2, 7, 1], mtime=2000)
+    dataset = acquire.CSVDataSet(path, cache=dcache)
+    assert not _cached(dataset)
+    assert list(dataset.waveforms[0].y_data) == [2, 7, 1]
+
+
+def test_touched_file_still_valid(tmpdir, dcache):
+    path = _write(tmpdir, 'a.csv', [3, 1, 4], mtime=1000)
+    acquire.CSVDataSet(path, cache=dcache)
+    os.utime(path, (2000, 2000))
+    assert _cached(acquire.CSVDataSet(path, cache=dcache))
+
+
+def test_changed_while_parsed(tmpdir, dcache):
+    # The fingerprint is taken before the file is parsed, so contents
+    # which changed since are not recorded as current
+    path = _write(tmpdir, 'a.csv', [3, 1, 4], mtime=1000)
+    source = cache.SourceFile(path)
+    _write(tmpdir, 'a.csv', [3, 1, 4, 1], mtime=2000)
+    dataset = acquire.CSVDataSet(path)
+    dcache.store(dataset, source)
+    assert not dcache.load(acquire.CSVDataSet(path))
+
+
+def test_refresh(tmpdir, dcache):
+    path = _write(tmpdir, 'a.csv', [3, 1, 4])
+    acquire.CSVDataSet(path, cache=dcache)
+    fresh = cache.DataSetCache(dcache.folder, refresh=True)
+    assert not _cached(acquire.CSVDataSet(path, cache=fresh))
+    assert _cached(acquire.CSVDataSet(path, cache=fresh))
+
+
+def test_invalidate(tmpdir, dcache):
+    path = _write(tmpdir, 'a.csv', [3, 1, 4])
+    acquire.CSVDataSet(path, cache=dcache)
+    dcache.invalidate(path, acquire.CSVDataSet)
+    assert not list(dcache.entries())
+
+
+def test_lru_eviction(tmpdir, dcache):
+    paths = [_write(tmpdir, '{0}.csv'.format(name), range(100))
+             for name in 'abc']
+    a, b, c = paths
+    acquire.CSVDataSet(a, cache=dcache)
+    entry_bytes = sum(os.path.getsize(os.path.join(e, f))
+                      for e in dcache.entries() for f in os.listdir(e)
+                      if f.endswith('.npy'))
+    dcache.max_bytes = 2 * entry_bytes
+    acquire.CSVDataSet(b, cache=dcache)
+    # Loading a makes b the least recently used
+    for entry in dcache.entries():
+        os.utime(os.path.join(entry, 'meta.json'), (1000, 1000))
+    assert _cached(acquire.CSVDataSet(a, cache=dcache))
+    acquire.CSVDataSet(c, cache=dcache)
+    assert len(list(dcache.entries())) == 2
+    assert _cached(acquire.CSVDataSet(a, cache=dcache))
+    assert not _cached(acquire.CSVDataSet(b, cache=dcache))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import json
+import pathlib
+
+import numpy
+import pytest
+
+import acquire
+import container
+
+
+def _capture(tmpdir, text, name='capture.csv'):
+    path = pathlib.Path(str(tmpdir.join(name)))
+    path.write_text(text)
+    return path
+
+
+def _round_trip(parser, datafile):
+    dataset = parser(datafile)
+    outpath = container.convert(parser, datafile)
+    assert outpath == container.container_path(datafile)
+    loaded = acquire.BinaryDataSet(outpath)
+    assert len(loaded.waveforms) == len(dataset.waveforms)
+    assert numpy.array_equal(numpy.asarray(loaded.x_data),
+                             numpy.asarray(dataset.x_data))
+    for i in range(len(dataset.waveforms)):
+        assert loaded.channel(i).dtype == dataset.channel(i).dtype
+        assert numpy.array_equal(loaded.channel(i), dataset.channel(i))
+    return container.read_header(outpath), loaded
+
+
+def test_round_trip_uniform(tmpdir):
+    rows = ''.join('{0},{1},{2}\n'.format(i * 0.25, i, -i)
+                   for i in range(100))
+    header, loaded = _round_trip(acquire.CSVDataSet, _capture(tmpdir, rows))
+    assert header['x']['kind'] == 'uniform'
+    assert [c['name'] for c in header['columns']] == ['ch0', 'ch1']
+    for column in header['columns']:
+        assert column['offset'] % container.ALIGN == 0
+
+
+def test_round_trip_non_uniform(tmpdir):
+    datafile = _capture(tmpdir, '0,1\n0.1,2\n0.3,3\n0.35,4\n1,5\n')
+    header, loaded = _round_trip(acquire.CSVDataSet, datafile)
+    assert header['x']['kind'] != 'uniform'
+    assert header['columns'][0]['name'] == 'x'
+    assert list(numpy.asarray(loaded.x_data)) == [0, 0.1, 0.3, 0.35, 1]
+
+
+def test_round_trip_bindump(tmpdir):
+    datafile = _capture(tmpdir, '0,1011,0\n1,1,1111111111111111\n2,10,101\n')
+    header, loaded = _round_trip(acquire.CSVBinDump, datafile)
+    assert header['parser'] == 'CSVBinDump'
+    assert loaded.channel(0).dtype == numpy.uint16
+    assert list(loaded.channel(1)) == [0, 0xffff, 5]
+    assert isinstance(loaded.waveforms[0], acquire.BinDump)
+
+
+def test_round_trip_no_samples(tmpdir):
+    datafile = _capture(tmpdir, 'channels_2,\n'
+                                'field_time,field_a,field_b\n'
+                                'unit_s,unit_V,unit_A\n')
+    header, loaded = _round_trip(acquire.IQDataSet, datafile)
+    assert header['count'] == 0
+    assert len(loaded.x_data) == 0
+    assert loaded.waveforms[1].y_name == 'b'
+
+
+def _rewrite(path, edit):
+    with open(str(path), 'rb') as f:
+        data = f.read()
+    with open(str(path), 'wb') as f:
+        f.write(edit(data))
+
+
+def test_read_header_bad_magic(tmpdir):
+    datafile = _capture(tmpdir, '0,1\n1,2\n')
+    outpath = container.convert(acquire.CSVDataSet, datafile)
+    _rewrite(outpath, lambda data: b'NOTACAP\x00' + data[8:])
+    with pytest.raises(ValueError):
+        container.read_header(outpath)
+    with pytest.raises(ValueError):
+        container.read_header(datafile)
+
+
+def test_read_header_bad_version(tmpdir):
+    datafile = _capture(tmpdir, '0,1\n1,2\n')
+    outpath = container.convert(acquire.CSVDataSet, datafile)
+    header = container.read_header(outpath)
+    old = json.dumps(header).encode('utf-8')
+    header['version'] = container.FORMAT_VERSION + 1
+    new = json.dumps(header).encode('utf-8')
+    assert len(new) == len(old)
+    _rewrite(outpath, lambda data: data.replace(old, new))
+    with pytest.raises(ValueError):
+        container.read_header(outpath)
+
+
+def _set_mtime(path, mtime):
+    os.utime(str(path), (mtime, mtime))
+
+
+def test_captures_prefers_current_container(tmpdir):
+    folder = pathlib.Path(str(tmpdir))
+    datafile = _capture(tmpdir, '0,1\n1,2\n')
+    parser = acquire.CSVDataSet
+    assert not container.is_current(datafile)
+    assert list(acquire.captures(folder, parser)) == [(parser, datafile)]
+
+    outpath = container.convert(parser, datafile)
+    _set_mtime(datafile, 1000000)
+    _set_mtime(outpath, 2000000)
+    assert container.is_current(datafile)
+    assert list(acquire.captures(folder, parser)) == \
+        [(acquire.BinaryDataSet, outpath)]
+
+    # The text file changed after it was converted
+    _set_mtime(datafile, 3000000)
+    assert not container.is_current(datafile)
+    assert list(acquire.captures(folder, parser)) == [(parser, datafile)]
+
+    # The container alone is left
+    datafile.unlink()
+    assert list(acquire.captures(folder, parser)) == \
+        [(acquire.BinaryDataSet, outpath)]
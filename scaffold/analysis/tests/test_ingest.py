@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+
+import numpy
+import pytest
+
+import ingest
+import acquire
+
+
+def _dataset(tmpdir, text, parser=acquire.CSVDataSet, name='capture.csv'):
+    path = tmpdir.join(name)
+    path.write(text)
+    return parser(str(path))
+
+
+def test_parse_chunk_skips_empty_lines():
+    block = ingest.parse_chunk(['1, 2\n', '\n', '3,4\n'], 2)
+    assert block.tolist() == [[1, 2], [3, 4]]
+
+
+def test_parse_chunk_malformed():
+    with pytest.raises(ValueError):
+        ingest.parse_chunk(['1,2\n', '3,x\n'], 2)
+    with pytest.raises(ValueError):
+        ingest.parse_chunk(['1,2\n', '3\n'], 2)
+    with pytest.raises(ValueError):
+        ingest.parse_chunk(['1,2\n', '   \n'], 2)
+
+
+def test_read_blocks_exact_x():
+    lines = ['0.5,1\n', '0.75,2\n']
+    f = io.StringIO(''.join(lines))
+    (block, ticks, places), = ingest.read_blocks(f, 2, exact_x=True)
+    assert block.tolist() == [[0.5, 1], [0.75, 2]]
+    assert list(ticks) == [50, 75] and places == 2
+
+
+def test_dataset_blank_lines(tmpdir):
+    # Lines of whitespace alone are skipped by the row parser
+    dataset = _dataset(tmpdir, '0,1,10\n\n0.5,2,20\n  \n1,3,30\n')
+    assert list(numpy.asarray(dataset.x_data)) == [0, 0.5, 1]
+    assert list(dataset.waveforms[1].y_data) == [10, 20, 30]
+
+
+def test_dataset_row_fallback(tmpdir):
+    # Quoted fields are not read by the bulk parser, but are by the rows
+    dataset = _dataset(tmpdir, '0,1\n"1","2"\n2,3\n')
+    assert list(numpy.asarray(dataset.x_data)) == [0, 1, 2]
+    assert list(dataset.waveforms[0].y_data) == [1, 2, 3]
+
+
+def test_dataset_malformed_row(tmpdir):
+    with pytest.raises(ValueError):
+        _dataset(tmpdir, '0,1\n1,x\n2,3\n')
+
+
+def test_dataset_header_only(tmpdir):
+    dataset = _dataset(tmpdir, 'channels_2,\n'
+                               'field_time,field_a,field_b\n'
+                               'unit_s,unit_V,unit_A\n',
+                       parser=acquire.IQDataSet)
+    assert len(dataset.waveforms) == 2
+    assert dataset.waveforms[1].y_name == 'b'
+    assert len(dataset.x_data) == 0
+    assert len(dataset.waveforms[0].y_data) == 0
+
+
+def test_parse_bincodes():
+    codes = ingest.parse_bincodes(numpy.array([0, 1, 10, 1011,
+                                               1111111111111111.0]))
+    assert codes.dtype == numpy.uint16
+    assert list(codes) == [0, 1, 2, 11, 0xffff]
+    assert list(ingest.parse_bincodes(numpy.array([1011]), nbits=2)) == [3]
+
+
+def test_parse_bincodes_rejects_digits():
+    for value in (2, 1021, 19, 0.5, -1):
+        with pytest.raises(ValueError):
+            ingest.parse_bincodes(numpy.array([1, value]))
+
+
+def test_parse_bincodes_rejects_long_codes():
+    # 17 binary digits
+    with pytest.raises(ValueError):
+        ingest.parse_bincodes(numpy.array([1e16]))
+    with pytest.raises(ValueError):
+        ingest.parse_bincodes(numpy.array([11111111111111111.0]))
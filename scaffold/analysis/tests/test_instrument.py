@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+
+import pytest
+
+import instrument
+
+
+@pytest.fixture
+def enabled():
+    instrument.enable()
+    yield
+    instrument.enable(False)
+
+
+def test_scope_collects_nested_stages(enabled):
+    with instrument.scope() as outer:
+        with instrument.stage('a'):
+            with instrument.scope() as inner:
+                instrument.count('samples', 10)
+    assert outer.stages['a'][1] == 1
+    assert outer.counters == inner.counters == {'samples': 10}
+    assert 'a' not in inner.stages
+    # The peak of the process so far, not of the scope
+    assert inner.process_peak_rss_mb > 0
+
+
+def test_merge_and_summary(enabled, tmpdir):
+    first, second = instrument.Stats(), instrument.Stats()
+    first.process_peak_rss_mb, second.process_peak_rss_mb = 10.0, 20.0
+    first.add_time('a', 1.0)
+    second.add_time('a', 2.0)
+    merged = instrument.Stats().merge(first).merge(second)
+    assert merged.stages['a'] == [3.0, 2]
+    assert merged.process_peak_rss_mb == 20.0
+    path = str(tmpdir.join('stats.json'))
+    instrument.write_summary(path, {'w': {'render': merged}})
+    with open(path) as f:
+        assert json.load(f)['w']['render']['process_peak_rss_mb'] == 20.0
+    path = str(tmpdir.join('stats.csv'))
+    instrument.write_summary(path, {'w': {'render': merged}})
+    with open(path) as f:
+        assert f.readline().startswith('name,part,process_peak_rss_mb,a_s')
+
+
+def test_disabled():
+    with instrument.scope() as stats:
+        with instrument.stage('a'):
+            instrument.count('samples')
+    assert stats.stages == {} and stats.counters == {}
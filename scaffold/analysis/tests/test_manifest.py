@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import stat
+
+import numpy
+import pytest
+
+import output
+import render
+import manifest
+import spectral
+from pipeline import Job
+
+SOURCE = {'path': '/data/a.csv', 'size': 10, 'mtime': 1000.0, 'hash': 'x'}
+
+
+def _job(outpath, y=None, **kwargs):
+    if y is None:
+        y = numpy.arange(10)
+    return Job('a.0.w', render.make_graph, outpath=str(outpath),
+               plotdata_y=y, **kwargs)
+
+
+def test_job_digest_inputs(tmpdir):
+    digest = manifest.job_digest(_job('a.png'), SOURCE)
+    # Data arrays and the output path are not part of the digest
+    assert manifest.job_digest(_job('b.png', y=numpy.ones(10)),
+                               SOURCE) == digest
+    assert manifest.job_digest(_job('a.png', color='red'), SOURCE) != digest
+    assert manifest.job_digest(_job('a.png'),
+                               dict(SOURCE, mtime=2000.0)) != digest
+    job = _job('a.png')
+    job.func = render.make_histogram
+    assert manifest.job_digest(job, SOURCE) != digest
+
+
+def test_job_digest_render_config(monkeypatch):
+    digest = manifest.job_digest(_job('a.png'), SOURCE)
+    monkeypatch.setattr(render, 'GRAPH_DPI', render.GRAPH_DPI + 1)
+    assert manifest.job_digest(_job('a.png'), SOURCE) != digest
+    dpi = manifest.job_digest(_job('a.png'), SOURCE)
+    monkeypatch.setattr(output, 'PNG_COMPRESSION', output.PNG_COMPRESSION - 1)
+    assert manifest.job_digest(_job('a.png'), SOURCE) != dpi
+
+
+def test_job_digest_spectral_settings(monkeypatch):
+    # Spectra drawn with other windows or segments are drawn again
+    digest = manifest.job_digest(_job('a.png'), SOURCE)
+    for name, value in (('WINDOW', 'hann'), ('NPERSEG', 1024),
+                        ('OVERLAP', 0.25)):
+        with monkeypatch.context() as m:
+            m.setattr(spectral, name, value)
+            assert manifest.job_digest(_job('a.png'), SOURCE) != digest
+    assert manifest.job_digest(_job('a.png'), SOURCE) == digest
+
+
+def test_stale_jobs(tmpdir):
+    outputs = manifest.Manifest(str(tmpdir.join('manifest.json')))
+    fresh, missing, changed = [_job(tmpdir.join(name + '.png'))
+                               for name in ('fresh', 'missing', 'changed')]
+    for job in (fresh, changed):
+        tmpdir.join(os.path.basename(job.kwargs['outpath'])).write('')
+    outputs.record(fresh.kwargs['outpath'], manifest.job_digest(fresh, SOURCE))
+    outputs.record(changed.kwargs['outpath'], 'old')
+    stale = list(outputs.stale_jobs([fresh, missing, changed], SOURCE))
+    assert [job for job, _ in stale] == [missing, changed]
+    assert stale[0][1] == manifest.job_digest(missing, SOURCE)
+    assert outputs.skipped == [fresh.name]
+
+
+def test_record_forget_save(tmpdir):
+    path = str(tmpdir.join('plots', '.manifest.json'))
+    outputs = manifest.Manifest(path)
+    outputs.record('a.png', '1')
+    outputs.record('b.png', '2')
+    outputs.forget('a.png')
+    outputs.forget('missing.png')
+    outputs.save()
+    assert manifest.Manifest(path).entries == {'b.png': '2'}
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+
+def test_damaged_manifest(tmpdir):
+    path = tmpdir.join('manifest.json')
+    path.write('{not json')
+    assert manifest.Manifest(str(path)).entries == {}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import time
+
+import numpy
+import pytest
+
+import output
+import pipeline
+import render
+
+
+@pytest.fixture
+def png_writers():
+    output.PNG_WRITERS = 1
+    yield
+    output.PNG_WRITERS = 0
+
+
+def _plot_jobs(folder):
+    y = numpy.sin(numpy.linspace(0, 10, 100))
+    for name in ('good', 'missing/bad'):
+        yield pipeline.Job(name, render.make_graph, plotdata_y=y,
+                           outpath=os.path.join(folder, name + '.png'))
+
+
+def test_background_write_errors_fail_job(tmpdir, png_writers):
+    # Worker processes inherit the writers, and must report a file which
+    # could not be written as a failure of its job
+    results = dict((r.name, r) for r in pipeline.run_jobs(
+        _plot_jobs(str(tmpdir)), workers=2))
+    assert results['good'].ok
+    assert tmpdir.join('good.png').check()
+    assert not results['missing/bad'].ok
+    assert 'Failed to write' in results['missing/bad'].error
+
+
+def _sleep(seconds):
+    if seconds < 0:
+        raise ValueError("Negative delay")
+    time.sleep(seconds)
+    return seconds
+
+
+@pytest.mark.parametrize('threads', [False, True])
+def test_unordered_results(threads):
+    delays = [0.5, 0.0, -0.1, 0.1]
+    jobs = [pipeline.Job(str(i), _sleep, seconds=d)
+            for i, d in enumerate(delays)]
+    results = list(pipeline.run_jobs(jobs, workers=2, threads=threads,
+                                     ordered=False))
+    assert sorted(r.name for r in results) == ['0', '1', '2', '3']
+    # The slow job does not hold up those submitted after it
+    assert results[-1].name == '0'
+    assert 'Negative delay' in [r for r in results if r.name == '2'][0].error
+
+
+def test_ordered_results():
+    jobs = [pipeline.Job(str(i), _sleep, seconds=d)
+            for i, d in enumerate([0.2, 0.0, 0.1])]
+    results = list(pipeline.run_jobs(jobs, workers=2))
+    assert [r.name for r in results] == ['0', '1', '2']
+    assert [r.result for r in results] == [0.2, 0.0, 0.1]
+
+
+def test_unordered_unsent_job():
+    # A job which can't be sent to a worker is reported, not waited for
+    jobs = [pipeline.Job('0', _sleep, seconds=0.1),
+            pipeline.Job('1', _sleep, seconds=lambda: 0)]
+    results = dict((r.name, r) for r in pipeline.run_jobs(
+        jobs, workers=2, ordered=False))
+    assert results['0'].ok
+    assert not results['1'].ok
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy
+
+import process
+
+
+def _sketch(blocks, nbins=1024):
+    sketch = process.FloatSketch(nbins)
+    for block in blocks:
+        sketch.update(block)
+    return sketch
+
+
+def test_float_sketch_offset_resolution():
+    # A millivolt of noise on a 3.3 V rail
+    values = 3.3 + numpy.random.RandomState(0).uniform(-1e-3, 1e-3, 100000)
+    edges, counts = _sketch([values]).histogram()
+    assert len(counts) > 512
+    assert edges[1] - edges[0] <= 2e-3 / 512
+    assert counts.sum() == len(values)
+
+
+def test_float_sketch_order_independent():
+    values = 3.3 + numpy.random.RandomState(1).normal(0, 1e-3, 30000)
+    blocks = [numpy.full(100, 3.3)] + numpy.split(values, 3)
+    reference = _sketch([numpy.concatenate(blocks)])
+    for order in ([0, 1, 2, 3], [3, 2, 1, 0], [1, 0, 3, 2]):
+        sketch = _sketch([blocks[i] for i in order])
+        assert sketch.exponent == reference.exponent
+        assert sketch.start == reference.start
+        assert numpy.array_equal(sketch.counts, reference.counts)
+    merged = _sketch(blocks[2:]).merge(_sketch(blocks[:2]))
+    assert merged.exponent == reference.exponent
+    assert numpy.array_equal(merged.counts, reference.counts)
+
+
+def test_float_sketch_constant():
+    edges, counts = _sketch([numpy.full(10, 3.3)]).histogram()
+    assert list(counts) == [10]
+    assert edges[0] <= 3.3 < edges[1]
+    edges, counts = _sketch([numpy.zeros(10), numpy.ones(10)]).histogram()
+    assert counts.sum() == 20 and len(counts) <= 1024
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy
+
+import pyramid
+import timebase
+
+
+def _brute_force(y, starts, i1):
+    ends = numpy.append(starts[1:], i1)
+    return ([y[a:b].min() for a, b in zip(starts, ends)],
+            [y[a:b].max() for a, b in zip(starts, ends)],
+            [y[a:b].mean() for a, b in zip(starts, ends)])
+
+
+def test_window_matches_brute_force():
+    rng = numpy.random.RandomState(0)
+    y = rng.normal(size=50000)
+    pyr = pyramid.Pyramid.build(y)
+    for _ in range(200):
+        i0, i1 = sorted(rng.randint(0, len(y) + 1, 2))
+        ncols = rng.randint(1, 400)
+        starts, lo, hi, mean = pyr.window(y, i0, i1, ncols)
+        assert len(starts) == i1 - i0 or len(starts) >= ncols
+        if i1 > i0:
+            assert starts[0] == i0
+        assert numpy.all(numpy.diff(starts) > 0)
+        blo, bhi, bmean = _brute_force(y, starts, i1)
+        assert numpy.array_equal(lo, blo)
+        assert numpy.array_equal(hi, bhi)
+        assert numpy.allclose(mean, bmean)
+
+
+def test_window_clipped_and_raw():
+    y = numpy.arange(100.0)
+    pyr = pyramid.Pyramid.build(y)
+    starts, lo, hi, mean = pyr.window(y, -10, 20, 1000)
+    assert list(starts) == list(range(20))
+    assert lo is hi
+    starts, lo, hi, mean = pyr.window(y, 90, 200, 1)
+    assert starts[0] == 90 and hi[-1] == 99
+
+
+def test_envelope():
+    x = timebase.UniformTimeBase(0, 1, 1, 0, 10)
+    starts = numpy.array([0, 4, 8])
+    xs, ys = pyramid.envelope(x, starts, numpy.array([1.0, 2, 3]),
+                              numpy.array([4.0, 5, 6]))
+    assert list(xs) == [0, 0, 4, 4, 8, 8]
+    assert list(ys) == [1, 4, 2, 5, 3, 6]
+    raw = numpy.array([7.0, 8, 9])
+    xs, ys = pyramid.envelope(x, starts, raw, raw)
+    assert list(xs) == [0, 4, 8] and ys is raw
+
+
+def test_cached(tmpdir):
+    path = str(tmpdir.join('y.pyr.npy'))
+    y = numpy.random.RandomState(1).normal(size=1000)
+    built = pyramid.cached(path, y)
+    loaded = pyramid.cached(path, y)
+    assert isinstance(loaded.data, numpy.memmap)
+    assert numpy.array_equal(built.data, loaded.data)
+    # A pyramid of another series is rebuilt
+    other = pyramid.cached(path, y[:500])
+    assert other.n == 500
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy
+import pytest
+
+import render
+
+
+@pytest.fixture
+def fresh_canvases():
+    render._local.canvases = {}
+    yield
+    render._local.canvases = {}
+
+
+def _draw(func, outpath, **kwargs):
+    func(str(outpath), **kwargs)
+    with open(str(outpath), 'rb') as f:
+        return f.read()
+
+
+def test_graph_independent_of_previous_plot(tmpdir, fresh_canvases):
+    # Sines whose amplitudes differ by a hair have the same tick labels,
+    # but not the same labels in view, and so not the same layout
+    x = numpy.linspace(0, 1, 500)
+    y = numpy.sin(2 * numpy.pi * 3 * x)
+    for before, amp in ((0.91, 0.92), (0.93, 0.94), (1.0, 1.01)):
+        render._local.canvases = {}
+        fresh = _draw(render.make_graph, tmpdir / 'fresh.png',
+                      plotdata_y=y * amp, plotdata_x=x)
+        render._local.canvases = {}
+        _draw(render.make_graph, tmpdir / 'before.png',
+              plotdata_y=y * before, plotdata_x=x)
+        after = _draw(render.make_graph, tmpdir / 'after.png',
+                      plotdata_y=y * amp, plotdata_x=x)
+        assert fresh == after
+
+
+def test_histogram_independent_of_previous_plot(tmpdir, fresh_canvases):
+    rng = numpy.random.RandomState(0)
+    a = rng.normal(size=5000)
+    b = rng.normal(size=5000) * 1e-3 + 3
+    fresh = _draw(render.make_histogram, tmpdir / 'fresh.png', plotdata_y=b)
+    render._local.canvases = {}
+    _draw(render.make_histogram, tmpdir / 'before.png', plotdata_y=a)
+    after = _draw(render.make_histogram, tmpdir / 'after.png', plotdata_y=b)
+    assert fresh == after
+
+
+def _bit_planes(n=2000, nplanes=4):
+    codes = numpy.random.RandomState(0).randint(0, 1 << nplanes, size=n)
+    return (codes >> numpy.arange(nplanes)[:, None]) & 1
+
+
+@pytest.mark.parametrize('style', ['stack', 'raster'])
+def test_bitplanes(tmpdir, fresh_canvases, style):
+    planes = _bit_planes()
+    x = numpy.arange(planes.shape[1]) * 1e-3
+    png = _draw(render.make_bitplanes, tmpdir / 'planes.png',
+                planes=planes, plotdata_x=x, style=style)
+    assert png.startswith(b'\x89PNG')
+    # Without an x-axis, and with no samples at all
+    for planes in (_bit_planes(), _bit_planes(n=0)):
+        png = _draw(render.make_bitplanes, tmpdir / 'planes.png',
+                    planes=planes, style=style, labels='abcd')
+        assert png.startswith(b'\x89PNG')
+
+
+def test_bitplanes_styles_differ(tmpdir, fresh_canvases):
+    planes = _bit_planes()
+    stack = _draw(render.make_bitplanes, tmpdir / 'stack.png',
+                  planes=planes, style='stack')
+    raster = _draw(render.make_bitplanes, tmpdir / 'raster.png',
+                   planes=planes, style='raster')
+    assert stack != raster
+
+
+def test_bitplanes_unknown_style(tmpdir, fresh_canvases):
+    with pytest.raises(ValueError):
+        render.make_bitplanes(str(tmpdir / 'planes.png'), _bit_planes(),
+                              style='bars')
+    assert not (tmpdir / 'planes.png').exists()
+    # The canvas is still usable afterwards
+    png = _draw(render.make_bitplanes, tmpdir / 'planes.png',
+                planes=_bit_planes(), style='stack')
+    assert png.startswith(b'\x89PNG')
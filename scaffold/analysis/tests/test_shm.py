@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+
+import numpy
+import pytest
+
+import shm
+
+
+@pytest.fixture
+def arena(tmpdir):
+    arena = shm.Arena(folder=str(tmpdir.mkdir('arena')), min_bytes=0)
+    yield arena
+    arena.close()
+
+
+def test_cache_memmap_copied(tmpdir, arena):
+    # Cache entries may be evicted while the jobs referring to them are
+    # queued, so their columns are placed in the arena
+    path = str(tmpdir.join('ch0.npy'))
+    numpy.save(path, numpy.arange(1000, dtype=numpy.float64))
+    column = numpy.load(path, mmap_mode='r')
+    keys = []
+    shared = arena.share(column[10:20], keys)
+    assert keys
+    assert not shared.path.startswith(str(tmpdir.join('ch0')))
+    del column
+    os.remove(path)
+    assert list(shm.attach(shared)) == list(range(10, 20))
+    arena.release(keys)
+
+
+def test_container_memmap_in_place(tmpdir, arena):
+    path = str(tmpdir.join('capture.mwtp'))
+    numpy.arange(1000, dtype=numpy.float64).tofile(path)
+    column = numpy.memmap(path, dtype=numpy.float64, mode='r', offset=800)
+    keys = []
+    shared = arena.share(column[10:20], keys)
+    assert keys == []
+    assert shared.path == path and shared.offset == 800
+    assert list(shm.attach(shared)) == list(range(110, 120))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import numpy
+
+import spectral
+
+FS = 1e6
+
+
+def _sine(freq, nbits=12, n=1 << 18):
+    # A full scale sine quantized to nbits
+    t = numpy.arange(n) / FS
+    return numpy.round((2 ** (nbits - 1) - 1) *
+                       numpy.sin(2 * numpy.pi * freq * t))
+
+
+def test_enob_incoherent_tone():
+    # The tone lies between bins, and leaks into those about it
+    metrics = spectral.analyze(*spectral.welch(_sine(12345.6), FS))
+    assert abs(metrics['fundamental_hz'] - 12345.6) < FS / spectral.NPERSEG
+    assert 11.8 < metrics['enob'] < 12.2
+    assert metrics['sfdr_db'] > 80
+
+
+def test_window_parameter():
+    freqs, psd = spectral.welch(_sine(12345.6), FS, window='hann')
+    narrow = spectral.analyze(freqs, psd, window='hann')
+    wide = spectral.analyze(freqs, psd, window='hann', leakage_bins=50)
+    assert wide['signal_power'] > narrow['signal_power']
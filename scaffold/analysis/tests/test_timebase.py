@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from fractions import Fraction
+
+import numpy
+
+import acquire
+import timebase
+
+# Epoch timestamps in nanoseconds, which a float64 can't tell apart
+EPOCH_NS = ['1571234567.{0:09d}'.format(i) for i in range(1000)]
+
+
+def test_parse_ticks_exact():
+    ticks, places = timebase.parse_ticks(EPOCH_NS)
+    assert places == 9
+    assert ticks[0] == 1571234567000000000
+    assert numpy.all(numpy.diff(ticks) == 1)
+
+
+def test_parse_ticks_rejects():
+    for texts in (['1e-6'], ['1.2.3'], ['1 2'], ['nan'], ['1-2'], [''],
+                  ['12345678901234567890']):
+        assert timebase.parse_ticks(texts) == (None, None)
+
+
+def test_parse_ticks_scales():
+    ticks, places = timebase.parse_ticks([' -1.5 ', '2', '+.25', '-0.001'])
+    assert places == 3
+    assert list(ticks) == [-1500, 2000, 250, -1]
+
+
+def test_csv_epoch_ns(tmpdir):
+    path = tmpdir.join('epoch.csv')
+    path.write(''.join('{0},{1}\n'.format(x, i % 7)
+                       for i, x in enumerate(EPOCH_NS)))
+    x = acquire.CSVDataSet(str(path)).x_data
+    assert isinstance(x, timebase.UniformTimeBase)
+    assert len(x) == 1000
+    assert x.exact(0) == Fraction(1571234567)
+    assert x.exact(999) == Fraction(1571234567000000999, 10 ** 9)
@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# Copyright (C) 2016 Chintalagiri Shashank
+#
+# This file is part of libmwtp.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compact, exact representations of the x-axis of a capture.
+
+Timestamps in capture files are decimal numbers printed to a fixed
+number of places. Once that number of places is known, each timestamp
+is an integer number of ticks, and is held exactly by an int64. Most
+captures are uniformly sampled, in which case the ticks are described
+by their first value and a rational step, and no per-sample storage is
+needed at all.
+
+Ticks are read from the text of the timestamps with :func:`parse_ticks`,
+so that they are exact even where a float64 could not tell neighbouring
+timestamps apart, such as for epoch times to the nanosecond. Where the
+text is not available, they are recovered from float64 timestamps with
+:func:`from_array`, as far as the floats allow.
+
+Time bases behave like read only one-dimensional arrays. They can be
+sliced without copying, and are converted to float64 arrays wherever
+:func:`numpy.asarray` is applied to them. For timestamps of up to 15
+significant digits, these are equal to those the timestamps would have
+been parsed into directly.
+"""
+
+import bisect
+from fractions import Fraction
+import numpy
+
+# Powers of ten are exact in float64 up to 1e22. Timestamps with more
+# significant digits than a float64 can carry, which would need more
+# than 2**53 ticks, are left as float64 arrays.
+MAX_PLACES = 22
+_MAX_TICKS = 2 ** 53
+
+#: Timestamps parsed from text are held exactly if they have at most this
+#: many digits, with all of them given the same number of places, and
+#: their ticks fit an int64.
+MAX_DIGITS = 19
+
+_POW10 = 10 ** numpy.arange(MAX_DIGITS + 1, dtype=numpy.uint64)
+_MAX_INT64 = 2 ** 63 - 1
+
+# Classes of the characters of timestamps
+_BLANK, _DIGIT, _DOT, _OTHER, _MINUS, _PLUS = range(6)
+_CLASS = numpy.full(256, _OTHER, dtype=numpy.uint8)
+_CLASS[[0, 9, 10, 13, 32]] = _BLANK
+_CLASS[ord('0'):ord('9') + 1] = _DIGIT
+_CLASS[ord('.')] = _DOT
+_CLASS[ord('-')] = _MINUS
+_CLASS[ord('+')] = _PLUS
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return abs(a)
+
+
+class TimeBase(object):
+    """
+    Base class for time bases. Values are integer ticks of
+    ``10 ** -places`` units.
+    """
+    def __init__(self, places):
+        self.places = places
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def ticks(self):
+        """
+        Returns the timestamps as an int64 array of ticks.
+        """
+        raise NotImplementedError
+
+    def _slice(self, sl):
+        raise NotImplementedError
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self._slice(idx)
+        n = len(self)
+        if idx < 0:
+            idx += n
+        if not 0 <= idx < n:
+            raise IndexError("time base index out of range")
+        return float(self._slice(slice(idx, idx + 1)).values()[0])
+
+    def exact(self, idx):
+        """
+        Returns the timestamp at ``idx`` as a :class:`fractions.Fraction`.
+        """
+        n = len(self)
+        if idx < 0:
+            idx += n
+        tick = int(self._slice(slice(idx, idx + 1)).ticks()[0])
+        return Fraction(tick, 10 ** self.places)
+
+    def take(self, indices):
+        """
+        Returns the timestamps at ``indices`` as a float64 array, without
+        materializing the rest of the time base.
+        """
+        raise NotImplementedError
+
+    def values(self, dtype=numpy.float64):
+        # Integers below 2**53 and powers of ten up to 1e22 are exact in
+        # float64, so the division is correctly rounded, and gives the
+        # same result as parsing the decimal timestamp.
+        return (self.ticks() / 10.0 ** self.places).astype(dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values(dtype or numpy.float64)
+
+    @property
+    def nbytes(self):
+        raise NotImplementedError
+
+
+class UniformTimeBase(TimeBase):
+    """
+    A uniformly sampled time base. The timestamp of sample ``i`` is
+    ``start + i * step``, rounded half up to ``places`` decimal places,
+    where ``start`` is exact and ``step`` is an exact rational number of
+    ticks. The rounding describes captures whose sampling interval is
+    not itself a whole number of ticks.
+
+    :param t0: The first timestamp, in ticks
+    :param p: The numerator of the step, in ticks
+    :param q: The denominator of the step
+    :param places: The number of decimal places of a tick
+    :param count: The number of samples
+    """
+    def __init__(self, t0, p, q, places, count, offset=0, stride=1):
+        super(UniformTimeBase, self).__init__(places)
+        g = _gcd(p, q) or 1
+        self.t0 = int(t0)
+        self.p = int(p) // g
+        self.q = int(q) // g
+        self.count = int(count)
+        # Position of this view within the underlying sequence
+        self.offset = int(offset)
+        self.stride = int(stride)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def start(self):
+        if not self.count:
+            return None
+        return self.exact(0)
+
+    @property
+    def step(self):
+        return Fraction(self.p * self.stride, self.q * 10 ** self.places)
+
+    def _ticks(self, k):
+        whole, rem = divmod(self.p, self.q)
+        return self.t0 + k * whole + (2 * k * rem + self.q) // (2 * self.q)
+
+    def ticks(self):
+        k = self.offset + self.stride * numpy.arange(self.count,
+                                                     dtype=numpy.int64)
+        return self._ticks(k)
+
+    def take(self, indices):
+        k = self.offset + self.stride * numpy.asarray(indices,
+                                                      dtype=numpy.int64)
+        return self._ticks(k) / 10.0 ** self.places
+
+    def _slice(self, sl):
+        start, stop, step = sl.indices(self.count)
+        count = len(range(start, stop, step))
+        return UniformTimeBase(self.t0, self.p, self.q, self.places, count,
+                               offset=self.offset + start * self.stride,
+                               stride=self.stride * step)
+
+    @property
+    def nbytes(self):
+        return 0
+
+    def __repr__(self):
+        return '<UniformTimeBase start={0} step={1} count={2}>' \
+               ''.format(self.start, self.step, self.count)
+
+
+class TickTimeBase(TimeBase):
+    """
+    A non-uniformly sampled time base, held as an int64 array of ticks.
+    """
+    def __init__(self, ticks, places):
+        super(TickTimeBase, self).__init__(places)
+        self._ticks = ticks
+
+    def __len__(self):
+        return len(self._ticks)
+
+    def ticks(self):
+        return self._ticks
+
+    def _slice(self, sl):
+        return TickTimeBase(self._ticks[sl], self.places)
+
+    def take(self, indices):
+        return self._ticks[indices] / 10.0 ** self.places
+
+    @property
+    def nbytes(self):
+        return self._ticks.nbytes
+
+    def __repr__(self):
+        return '<TickTimeBase count={0} places={1}>' \
+               ''.format(len(self), self.places)
+
+
+def _fits(x, places, tol=4 * numpy.finfo(numpy.float64).eps):
+    scaled = x * 10.0 ** places
+    if numpy.max(numpy.abs(scaled)) >= _MAX_TICKS:
+        return None
+    ticks = numpy.rint(scaled)
+    err = numpy.abs(scaled - ticks)
+    if numpy.any(err > tol * numpy.maximum(numpy.abs(scaled), 1)):
+        return None
+    return ticks.astype(numpy.int64)
+
+
+def _to_ticks(x):
+    # The fewest places which represent the whole column are found on a
+    # sample of it first, so that the full column is usually only
+    # scanned once.
+    sample = x[::max(len(x) // 4096, 1)]
+    for places in range(MAX_PLACES + 1):
+        if _fits(sample, places) is None:
+            continue
+        ticks = _fits(x, places)
+        if ticks is not None:
+            return ticks, places
+        sample = x
+    return None, None
+
+
+def _uniform(ticks, places):
+    n = len(ticks)
+    if n < 2:
+        return UniformTimeBase(ticks[0] if n else 0, 0, 1, places, n)
+    if n >= 2 ** 31:
+        return None
+    candidate = UniformTimeBase(ticks[0], ticks[-1] - ticks[0], n - 1,
+                                places, n)
+    if numpy.array_equal(candidate.ticks(), ticks):
+        return candidate
+    return None
+
+
+def from_array(x):
+    """
+    Returns the most compact exact time base for the timestamps in
+    ``x``. If the timestamps can't be represented exactly as ticks,
+    ``x`` is returned as a float64 array.
+
+    :param x: The timestamps, as parsed into a float64 array
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    if not len(x):
+        return UniformTimeBase(0, 0, 1, 0, 0)
+    if not numpy.all(numpy.isfinite(x)):
+        return x
+    ticks, places = _to_ticks(x)
+    if ticks is None or \
+            not numpy.array_equal(ticks / 10.0 ** places, x):
+        return x
+    return _uniform(ticks, places) or TickTimeBase(ticks, places)
+
+
+def _parse_digits(m):
+    # Parses a batch of timestamps, as rows of ASCII bytes padded with
+    # NULs, into (mantissas, negative, places, digits), or None if a row
+    # is not a plain decimal number.
+    cls = _CLASS[m]
+    if numpy.any(cls == _OTHER):
+        return None
+    nonblank = cls != _BLANK
+    digit = cls == _DIGIT
+    dot = cls == _DOT
+    sign = cls >= _MINUS
+    # Each row is one run of characters, with a sign only at its start
+    starts = numpy.count_nonzero(nonblank[:, 1:] & ~nonblank[:, :-1], axis=1)
+    starts += nonblank[:, 0]
+    ndigits = numpy.count_nonzero(digit, axis=1)
+    if numpy.any(starts != 1) or numpy.any(ndigits == 0) or \
+            numpy.any(ndigits > MAX_DIGITS) or \
+            numpy.any(numpy.count_nonzero(dot, axis=1) > 1) or \
+            numpy.any(sign[:, 1:] & nonblank[:, :-1]):
+        return None
+    # Horner's rule, a column at a time, which at most MAX_DIGITS digits
+    # can't overflow
+    mantissas = numpy.zeros(len(m), dtype=numpy.uint64)
+    places = numpy.zeros(len(m), dtype=numpy.int64)
+    seen_dot = numpy.zeros(len(m), dtype=bool)
+    ten = numpy.uint64(10)
+    for j in range(m.shape[1]):
+        isdigit = digit[:, j]
+        mantissas = numpy.where(isdigit, mantissas * ten +
+                                (m[:, j] - 48).astype(numpy.uint64),
+                                mantissas)
+        places += isdigit & seen_dot
+        seen_dot |= dot[:, j]
+    return mantissas, (cls == _MINUS).any(axis=1), places, ndigits
+
+
+def parse_ticks(texts, batch=1 << 16):
+    """
+    Parses decimal timestamps, such as ``b'1571234567.000000999'``,
+    exactly into integer ticks of a common number of places. Surrounding
+    whitespace is ignored.
+
+    :param texts: An array of ASCII ``bytes`` or ``str`` timestamps
+    :return: ``(ticks, places)``, or ``(None, None)`` if a timestamp is
+             not a plain decimal number, or if the ticks would need more
+             than :data:`MAX_DIGITS` digits
+    """
+    texts = numpy.asarray(texts)
+    if texts.dtype.kind == 'U':
+        try:
+            texts = numpy.char.encode(texts, 'ascii')
+        except UnicodeError:
+            return None, None
+    if texts.dtype.kind != 'S':
+        raise TypeError("Timestamps must be strings, not {0}"
+                        "".format(texts.dtype))
+    if not len(texts):
+        return numpy.zeros(0, dtype=numpy.int64), 0
+    m = numpy.ascontiguousarray(texts).view(numpy.uint8)
+    m = m.reshape(len(texts), texts.dtype.itemsize)
+    # Only the columns used by the longest timestamp
+    m = m[:, :len(m.any(axis=0)) - numpy.argmax(m.any(axis=0)[::-1])]
+    parts = []
+    for start in range(0, len(m), batch):
+        part = _parse_digits(m[start:start + batch])
+        if part is None:
+            return None, None
+        parts.append(part)
+    mantissas, negative, places, ndigits = \
+        [numpy.concatenate(x) for x in zip(*parts)]
+    common = int(places.max())
+    scale = common - places
+    if numpy.any(ndigits + scale > MAX_DIGITS):
+        return None, None
+    # At most MAX_DIGITS digits fit a uint64, but not always an int64
+    magnitudes = mantissas * _POW10[scale]
+    if int(magnitudes.max()) > _MAX_INT64:
+        return None, None
+    ticks = magnitudes.astype(numpy.int64)
+    ticks[negative] *= -1
+    return ticks, common
+
+
+def _rescale(ticks, places, common):
+    # Returns ticks of ``places`` as ticks of ``common`` places, or None
+    # if they do not fit
+    if common == places:
+        return ticks
+    factor = 10 ** (common - places)
+    if len(ticks) and int(numpy.abs(ticks).max()) * factor > _MAX_INT64:
+        return None
+    return ticks * numpy.int64(factor)
+
+
+class TickAccumulator(object):
+    """
+    Collects the exact ticks of the timestamps of a capture while it is
+    parsed, a block or a row at a time. Blocks may have differing
+    numbers of places. If the ticks of any of them are not known, or
+    the whole can't be held exactly, there is no result.
+    """
+    def __init__(self):
+        self.valid = True
+        self._blocks = []
+        self._texts = []
+
+    def extend(self, ticks, places):
+        """
+        Adds a block of ticks, as from :func:`parse_ticks`. ``None``
+        marks timestamps whose ticks are not known.
+        """
+        self._flush()
+        if ticks is None:
+            self.invalidate()
+        if self.valid:
+            self._blocks.append((ticks, places))
+
+    def append(self, text):
+        """
+        Adds the text of a single timestamp.
+        """
+        if self.valid:
+            self._texts.append(text)
+            if len(self._texts) >= 1 << 16:
+                self._flush()
+
+    def _flush(self):
+        if self._texts:
+            texts, self._texts = self._texts, []
+            self.extend(*parse_ticks(numpy.array(texts)))
+
+    def invalidate(self):
+        self.valid = False
+        self._blocks = []
+        self._texts = []
+
+    def result(self):
+        """
+        Returns ``(ticks, places)`` of every timestamp added, or
+        ``(None, None)``.
+        """
+        self._flush()
+        if not self.valid:
+            return None, None
+        if not self._blocks:
+            return numpy.zeros(0, dtype=numpy.int64), 0
+        common = max(places for _, places in self._blocks)
+        blocks = [_rescale(t, p, common) for t, p in self._blocks]
+        if any(b is None for b in blocks):
+            return None, None
+        return numpy.concatenate(blocks), common
+
+
+def from_ticks(ticks, places):
+    """
+    Returns the most compact time base for exact ``ticks`` of ``places``
+    decimal places, such as from :func:`parse_ticks`. Places which are
+    zero in every timestamp are dropped.
+    """
+    ticks = numpy.asarray(ticks, dtype=numpy.int64)
+    while places and len(ticks) and not numpy.any(ticks % 10):
+        ticks = ticks // 10
+        places -= 1
+    if not len(ticks):
+        return UniformTimeBase(0, 0, 1, 0, 0)
+    return _uniform(ticks, places) or TickTimeBase(ticks, places)
+
+
+def take(x, indices):
+    """
+    Returns the values of the time base or array ``x`` at ``indices``.
+    """
+    if isinstance(x, TimeBase):
+        return x.take(indices)
+    return numpy.asarray(x)[indices]
+
+
+def searchsorted(x, value, side='left'):
+    """
+    Finds the index at which ``value`` would be inserted into the
+    ascending time base or array ``x``, as :func:`numpy.searchsorted`.
+    Time bases are bisected without being materialized.
+    """
+    if not isinstance(x, TimeBase):
+        return int(numpy.searchsorted(x, value, side=side))
+    if side == 'left':
+        return bisect.bisect_left(_Values(x), value)
+    return bisect.bisect_right(_Values(x), value)
+
+
+class _Values(object):
+    # Presents the values of a time base as a sequence, which bisect
+    # reads only at the points it probes.
+    def __init__(self, tb):
+        self._tb = tb
+
+    def __len__(self):
+        return len(self._tb)
+
+    def __getitem__(self, idx):
+        return self._tb.take([idx])[0]
+
+
+def dump(tb):
+    """
+    Returns ``(meta, array)`` describing a time base, or a plain array,
+    for storage. ``meta`` is JSON serializable, and ``array`` is
+    ``None`` for uniform time bases.
+    """
+    if isinstance(tb, UniformTimeBase):
+        return {'kind': 'uniform', 't0': tb.t0, 'p': tb.p, 'q': tb.q,
+                'places': tb.places, 'count': tb.count,
+                'offset': tb.offset, 'stride': tb.stride}, None
+    if isinstance(tb, TickTimeBase):
+        return {'kind': 'ticks', 'places': tb.places}, tb.ticks()
+    return {'kind': 'float'}, numpy.asarray(tb)
+
+
+def load(meta, array=None):
+    """
+    Recreates a time base from the output of :func:`dump`.
+    """
+    if meta['kind'] == 'uniform':
+        return UniformTimeBase(meta['t0'], meta['p'], meta['q'],
+                               meta['places'], meta['count'],
+                               offset=meta['offset'], stride=meta['stride'])
+    if meta['kind'] == 'ticks':
+        return TickTimeBase(array, meta['places'])
+    return array